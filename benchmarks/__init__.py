@@ -0,0 +1 @@
+'''benchmarks for wastedyears (not installed with the package)'''
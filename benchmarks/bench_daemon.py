@@ -0,0 +1,86 @@
+'''measure the latency of "wy task" with and without "wy serve" running
+
+"request" times one task capture from within Python: a round trip to
+the daemon, or the direct sqlite3 fast path. "process" times a whole
+wy process, interpreter startup included.
+
+usage: python -m benchmarks.bench_daemon [--runs N] [--output FILE]
+'''
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from wastedyears import capture, client, config
+
+_argv = ['task', 'benchmark', 'daemon']
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=50)
+    parser.add_argument('--output', help='write JSON results here (default: stdout)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='wastedyears.bench.') as tmp_dir:
+        os.environ['XDG_CONFIG_HOME'] = os.path.join(tmp_dir, 'config')
+        os.environ['XDG_DATA_HOME'] = os.path.join(tmp_dir, 'data')
+        cfg = config.get_config()
+        _wy(['init'], 'wastedyears.cli')
+
+        results = {}
+        results['direct'] = _measure(lambda: capture.capture(_argv), args.runs)
+
+        daemon = subprocess.Popen([sys.executable, '-m', 'wastedyears.cli', 'serve'])
+        try:
+            while client.send(cfg.socket_path, ['done'], print) is None:
+                time.sleep(0.01)
+            results['daemon'] = _measure(
+                lambda: client.send(cfg.socket_path, _argv, print), args.runs)
+        finally:
+            daemon.terminate()
+            daemon.wait()
+
+    output = json.dumps({'benchmark': 'daemon', 'results': results}, indent=2)
+    if args.output:
+        with open(args.output, 'w') as outfile:
+            outfile.write(output + '\n')
+    else:
+        print(output)
+
+
+def _measure(request, runs: int) -> dict[str, dict[str, float]]:
+    '''time runs requests in this process, then runs wy processes'''
+    in_process = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        request()
+        in_process.append(time.perf_counter() - started)
+    processes = [_wy(_argv) for _ in range(runs)]
+    return {
+        'request_ms': _summarize(in_process),
+        'process_ms': _summarize(processes),
+    }
+
+
+def _wy(argv: list[str], module='wastedyears.capture') -> float:
+    '''run one wy command in a new interpreter; return elapsed seconds'''
+    started = time.perf_counter()
+    subprocess.run([sys.executable, '-m', module] + argv, check=True)
+    return time.perf_counter() - started
+
+
+def _summarize(times: list[float]) -> dict[str, float]:
+    return {
+        'min': round(min(times) * 1000, 2),
+        'median': round(statistics.median(times) * 1000, 2),
+    }
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+'''compare hot-path query times with and without the indexes added by
+schema migration 2
+
+usage: python -m benchmarks.bench_indexes [--tasks N]
+'''
+
+import argparse
+import datetime
+import os
+import tempfile
+import time
+
+import sqlalchemy as sa
+
+from wastedyears import database
+from . import synthetic
+
+_queries = {
+    'get_task_dates': None,
+    'week of tasks': (
+        'select count(*), max(end_ts) from tasks'
+        ' where start_ts >= :start and start_ts < :end'),
+    'tasks with word': (
+        'select count(*), max(start_ts) from task_words'
+        ' join tasks using (task_id) where word_id = :word_id'),
+    'last task': (
+        'select task_id, end_ts from tasks order by task_id desc limit 1'),
+}
+
+_indexes = {
+    'ix_tasks_start_ts': 'tasks (start_ts, end_ts)',
+    'ix_task_words_word_id': 'task_words (word_id, task_id)',
+}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tasks', type=int, default=200_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='wastedyears.bench.') as tmp_dir:
+        engine = database.create_engine(
+            'sqlite:///' + os.path.join(tmp_dir, 'bench.sqlite'))
+        db = database.WastedYearsDB(engine.connect())
+        db.init_schema()
+        stats = db.bulk_load(synthetic.generate_tasks(args.tasks))
+        db.commit()
+        print(f'loaded {stats}')
+
+        middle = db.conn.execute(
+            'select start_ts from tasks where task_id = ?',
+            (args.tasks // 2,)).scalar()
+        start = datetime.datetime.fromisoformat(middle)
+        params = {
+            'start': str(start),
+            'end': str(start + datetime.timedelta(days=7)),
+            'word_id': 10,
+        }
+
+        results = {}
+        for phase in ('without', 'with'):
+            for (name, columns) in _indexes.items():
+                if phase == 'with':
+                    db.conn.execute(f'create index {name} on {columns}')
+                else:
+                    db.conn.execute(f'drop index if exists {name}')
+            db.conn.execute('analyze')
+
+            for (name, sql) in _queries.items():
+                results[(name, phase)] = _time(db, sql, params, args.repeat)
+
+        db.close()
+
+    print(f'{"query":<20} {"without":>10} {"with":>10}')
+    for name in _queries:
+        without = results[(name, 'without')]
+        with_ = results[(name, 'with')]
+        print(f'{name:<20} {without * 1000:8.2f}ms {with_ * 1000:8.2f}ms')
+
+
+def _time(db, sql, params, repeat) -> float:
+    '''return best time of repeat runs of one query'''
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        if sql is None:
+            db.get_task_dates()
+        else:
+            db.conn.execute(sa.text(sql), params).fetchall()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+'''measure how long it takes to gather the "recent tasks" shown by the
+wy task editor, for databases with more and more history
+
+The indexed query (get_recent_tasks) should take the same time however
+many tasks there are; loading every task (list_tasks) is shown for
+comparison.
+
+usage: python -m benchmarks.bench_prefill [--sizes N ...] [--output FILE]
+'''
+
+import argparse
+import datetime
+import json
+import os
+import tempfile
+import time
+
+from wastedyears import database
+from . import synthetic
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[10_000, 100_000, 500_000])
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--output', help='write JSON results here')
+    args = parser.parse_args()
+
+    results = {}
+    print(f'{"tasks":>10} {"recent":>10} {"list_tasks":>12}')
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory(prefix='wastedyears.bench.') as tmp_dir:
+            engine = database.create_engine(
+                'sqlite:///' + os.path.join(tmp_dir, 'bench.sqlite'))
+            db = database.WastedYearsDB(engine.connect())
+            db.init_schema()
+            db.bulk_load(synthetic.generate_tasks(size))
+            db.commit()
+
+            # "yesterday and today" relative to the last task
+            last_ts = db.conn.execute('select max(start_ts) from tasks').scalar()
+            since = (datetime.datetime.fromisoformat(last_ts)
+                     .replace(hour=0, minute=0, second=0, microsecond=0)
+                     - datetime.timedelta(days=1))
+
+            recent = _time(lambda: db.get_recent_tasks(since), args.repeat)
+            full = _time(db.list_tasks, 1)
+            db.close()
+
+        results[str(size)] = {
+            'recent_ms': round(recent * 1000, 3),
+            'list_tasks_ms': round(full * 1000, 3),
+        }
+        print(f'{size:>10} {recent * 1000:8.3f}ms {full * 1000:10.1f}ms')
+
+    if args.output:
+        with open(args.output, 'w') as outfile:
+            json.dump({'benchmark': 'prefill', 'results': results}, outfile, indent=2)
+            outfile.write('\n')
+
+
+def _time(func, repeat) -> float:
+    '''return best time of repeat calls of func'''
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+if __name__ == '__main__':
+    main()
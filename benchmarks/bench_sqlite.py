@@ -0,0 +1,134 @@
+'''measure concurrent reader/writer throughput under each SQLite profile
+
+One process records tasks as fast as it can (end_last_task() +
+add_task() + commit, like wy task), while --readers processes run
+reports (a week's get_word_report() and get_recent_tasks(), like the GUI
+or a cron job), all against the same database for --seconds. Each
+profile is a [sqlite] section of wastedyears.cfg.
+
+usage: python -m benchmarks.bench_sqlite [--tasks N] [--readers N] [--seconds S]
+'''
+
+import argparse
+import datetime
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+
+import sqlalchemy as sa
+
+from wastedyears import config, database, models
+from . import synthetic
+
+_profiles = {
+    # SQLite's own defaults, which wy used before it had a [sqlite] section
+    'rollback': config.SQLiteConfig(
+        journal_mode='delete', synchronous='full', mmap_size=0,
+        cache_size=-2000, busy_timeout=5000),
+    'wal': config.SQLiteConfig(),
+    'wal, sync off': config.SQLiteConfig(synchronous='off'),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tasks', type=int, default=50_000)
+    parser.add_argument('--readers', type=int, default=3)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    args = parser.parse_args()
+
+    print(f'{"profile":<14} {"writes/s":>9} {"write p95":>10}'
+          f' {"reads/s":>9} {"read p95":>10} {"errors":>7}')
+    for (name, profile) in _profiles.items():
+        with tempfile.TemporaryDirectory(prefix='wastedyears.bench.') as tmp_dir:
+            url = 'sqlite:///' + os.path.join(tmp_dir, 'bench.sqlite')
+            last_day = _load(url, profile, args.tasks)
+            results = _run(url, profile, last_day, args)
+
+        writes = results['writer']
+        reads = [latency for (role, latencies, _) in results.values()
+                 if role == 'reader' for latency in latencies]
+        errors = sum(errors for (_, _, errors) in results.values())
+        print(f'{name:<14} {len(writes[1]) / args.seconds:9.0f}'
+              f' {_p95(writes[1]):8.2f}ms {len(reads) / args.seconds:9.0f}'
+              f' {_p95(reads):8.2f}ms {errors:7}')
+
+
+def _load(url: str, profile: config.SQLiteConfig, num_tasks: int) -> datetime.date:
+    with database.WastedYearsDB(database.create_engine(url, profile).connect()) as db:
+        db.init_schema()
+        db.bulk_load(synthetic.generate_tasks(num_tasks))
+        db.commit()
+        return db.get_task_dates()[-1]
+
+
+def _run(url, profile, last_day, args) -> dict[str, tuple[str, list[float], int]]:
+    start = multiprocessing.Barrier(args.readers + 1)
+    queue: multiprocessing.Queue = multiprocessing.Queue()
+    workers = [('writer', _write)] + [(f'reader {idx}', _read)
+                                      for idx in range(args.readers)]
+    processes = [
+        multiprocessing.Process(
+            target=_worker,
+            args=(name, func, url, profile, last_day, args.seconds, start, queue))
+        for (name, func) in workers
+    ]
+    for process in processes:
+        process.start()
+    results = dict(queue.get() for _ in processes)
+    for process in processes:
+        process.join()
+    return results
+
+
+def _worker(name, func, url, profile, last_day, seconds, start, queue):
+    engine = database.create_engine(url, profile)
+    latencies = []
+    errors = 0
+    with database.WastedYearsDB(engine.connect()) as db:
+        db.commit()
+        db.begin()
+        start.wait()
+        deadline = time.perf_counter() + seconds
+        idx = 0
+        while (started := time.perf_counter()) < deadline:
+            try:
+                func(db, last_day, idx)
+            except sa.exc.OperationalError:
+                # database is locked (busy_timeout expired)
+                db.rollback()
+                errors += 1
+            else:
+                latencies.append(time.perf_counter() - started)
+            db.begin()
+            idx += 1
+    role = 'writer' if func is _write else 'reader'
+    queue.put((name, (role, latencies, errors)))
+
+
+def _write(db: database.WastedYearsDB, last_day: datetime.date, idx: int):
+    # naive UTC, like wy task; after the end of the history
+    now = datetime.datetime(last_day.year, last_day.month, last_day.day)
+    now += datetime.timedelta(days=1, seconds=idx)
+    db.end_last_task(now)
+    db.add_task(models.Task(start_ts=now, description=f'benchmark task {idx % 50}'))
+    db.commit()
+
+
+def _read(db: database.WastedYearsDB, last_day: datetime.date, idx: int):
+    db.get_word_report(last_day - datetime.timedelta(days=6), last_day)
+    midnight = datetime.datetime(last_day.year, last_day.month, last_day.day)
+    db.get_recent_tasks(midnight - datetime.timedelta(days=1))
+    db.commit()
+
+
+def _p95(latencies: list[float]) -> float:
+    if len(latencies) < 2:
+        return float('nan')
+    return statistics.quantiles(latencies, n=20)[-1] * 1000
+
+
+if __name__ == '__main__':
+    main()
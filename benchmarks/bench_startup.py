@@ -0,0 +1,81 @@
+'''measure wall-clock time of "wy task" and "wy done" in a fresh process
+
+"cold" runs compile every module from scratch (empty bytecode cache),
+"warm" runs reuse the bytecode cache like a normal installed wy.
+Results are written as JSON so that CI can track them.
+
+usage: python -m benchmarks.bench_startup [--runs N] [--output FILE]
+'''
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+_paths = {
+    'fast': 'wastedyears.capture',
+    'full': 'wastedyears.cli',
+}
+_commands = {
+    'task': ['task', 'benchmark', 'startup'],
+    'done': ['done'],
+}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--output', help='write JSON results here (default: stdout)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='wastedyears.bench.') as tmp_dir:
+        env = dict(
+            os.environ,
+            XDG_CONFIG_HOME=os.path.join(tmp_dir, 'config'),
+            XDG_DATA_HOME=os.path.join(tmp_dir, 'data'),
+        )
+        _run(['init'], env)
+
+        results = {}
+        for (path, module) in _paths.items():
+            for (name, argv) in _commands.items():
+                cold = []
+                warm = []
+                for _ in range(args.runs):
+                    with tempfile.TemporaryDirectory() as cache_dir:
+                        cold_env = dict(env, PYTHONPYCACHEPREFIX=cache_dir)
+                        cold.append(_run(argv, cold_env, module))
+                    warm.append(_run(argv, env, module))
+                results[f'{path}.{name}'] = {
+                    'cold_ms': _summarize(cold),
+                    'warm_ms': _summarize(warm),
+                }
+
+    output = json.dumps({'benchmark': 'startup', 'results': results}, indent=2)
+    if args.output:
+        with open(args.output, 'w') as outfile:
+            outfile.write(output + '\n')
+    else:
+        print(output)
+
+
+def _run(argv: list[str], env: dict[str, str], module='wastedyears.cli') -> float:
+    '''run one wy command in a new interpreter; return elapsed seconds'''
+    started = time.perf_counter()
+    subprocess.run([sys.executable, '-m', module] + argv, env=env, check=True)
+    return time.perf_counter() - started
+
+
+def _summarize(times: list[float]) -> dict[str, float]:
+    return {
+        'min': round(min(times) * 1000, 2),
+        'median': round(statistics.median(times) * 1000, 2),
+    }
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+'''compare two benchmark result files and flag regressions
+
+Reads the JSON written by benchmarks.suite (or bench_startup) for a
+baseline and a candidate, e.g. the commits before and after a change,
+and prints every metric side by side. Metrics ending in "_per_sec" are
+better when higher, all others (times) when lower. A metric that got
+worse by more than --threshold percent is a regression, and makes the
+exit status 1.
+
+usage: python -m benchmarks.compare BASELINE CANDIDATE [--threshold PCT]
+'''
+
+import argparse
+import json
+import sys
+from typing import Any
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help='percent change that counts (default: %(default)s)')
+    args = parser.parse_args()
+
+    (old, old_commit) = _load(args.baseline)
+    (new, new_commit) = _load(args.candidate)
+
+    regressions = 0
+    print(f'{"metric":<36} {old_commit:>12} {new_commit:>12} {"change":>8}')
+    for name in sorted(old.keys() | new.keys()):
+        if name not in old or name not in new:
+            value = old.get(name, new.get(name))
+            column = 'gone' if name in old else 'new'
+            print(f'{name:<36} {value!s:>12} {column:>21}')
+            continue
+
+        change = _change(old[name], new[name])
+        worse = -change if name.endswith('_per_sec') else change
+        flag = ''
+        if worse > args.threshold:
+            flag = '  REGRESSION'
+            regressions += 1
+        elif worse < -args.threshold:
+            flag = '  improved'
+        print(f'{name:<36} {old[name]:>12} {new[name]:>12} {change:>+7.1f}%{flag}')
+
+    if regressions:
+        print(f'{regressions} regression(s) of more than {args.threshold}%')
+        sys.exit(1)
+
+
+def _load(path: str) -> tuple[dict[str, float], str]:
+    '''return the flattened results and commit of one result file'''
+    with open(path) as infile:
+        data = json.load(infile)
+    return (_flatten(data['results']), data.get('commit') or path)
+
+
+def _flatten(results: dict[str, Any], prefix: str = '') -> dict[str, float]:
+    '''{"10k": {"list_words.ms": 1.5}} -> {"10k.list_words.ms": 1.5}'''
+    flat = {}
+    for (key, value) in results.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f'{prefix}{key}.'))
+        else:
+            flat[prefix + key] = value
+    return flat
+
+
+def _change(old: float, new: float) -> float:
+    '''percent change from old to new'''
+    if old == 0:
+        return 0.0 if new == 0 else float('inf')
+    return (new - old) / old * 100
+
+
+if __name__ == '__main__':
+    main()
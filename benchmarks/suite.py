@@ -0,0 +1,170 @@
+'''run the standard benchmarks against synthetic histories of several sizes
+
+For each size, this writes a synthetic log, ingests it into a fresh
+database, and then measures:
+
+  ingest       tasks/s and rows/s of wy ingest (bulk_load)
+  add_task     latency of recording a task: end_last_task() + add_task()
+               + commit, as wy task does
+  list_words   list_words('ecw'), as wy ls-words does
+  word_report  get_word_report() for the last week of the history
+  weekly       iter_word_report('week') over the whole history, as
+               wy weekly does
+  startup      wy task and wy done in a fresh process (the fast path)
+
+Results are written as JSON; benchmarks.compare diffs two result files,
+e.g. from before and after a change.
+
+usage: python -m benchmarks.suite [--sizes 10k,100k,1m] [--output FILE]
+'''
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import tempfile
+import time
+from typing import Callable
+
+from wastedyears import config, database, ingest, models
+from . import bench_startup, synthetic
+
+_suffixes = {'k': 1000, 'm': 1000_000}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default='10k,100k,1m',
+                        help='comma-separated numbers of tasks (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='runs of each query; the fastest counts')
+    parser.add_argument('--runs', type=int, default=200,
+                        help='tasks recorded to measure add_task latency')
+    parser.add_argument('--output', help='write JSON results here (default: stdout)')
+    args = parser.parse_args()
+
+    results = {}
+    for size in args.sizes.split(','):
+        print(f'{size} tasks ...', flush=True)
+        results[size] = _run_size(_parse_size(size), args)
+
+    output = json.dumps({
+        'benchmark': 'suite',
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'seed': args.seed,
+        'results': results,
+    }, indent=2)
+    if args.output:
+        with open(args.output, 'w') as outfile:
+            outfile.write(output + '\n')
+    else:
+        print(output)
+
+
+def _parse_size(size: str) -> int:
+    size = size.strip().lower()
+    if size[-1:] in _suffixes:
+        return int(size[:-1]) * _suffixes[size[-1]]
+    return int(size)
+
+
+def _run_size(num_tasks: int, args) -> dict[str, float]:
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='wastedyears.bench.') as tmp_dir:
+        env = dict(
+            os.environ,
+            XDG_CONFIG_HOME=os.path.join(tmp_dir, 'config'),
+            XDG_DATA_HOME=os.path.join(tmp_dir, 'data'),
+        )
+        os.environ.update(env)
+        cfg = config.get_config()
+
+        log_path = os.path.join(tmp_dir, 'tasks.txt')
+        with open(log_path, 'w') as outfile:
+            synthetic.write_log(synthetic.generate_tasks(num_tasks, args.seed), outfile)
+
+        with database.open_db(cfg) as db:
+            db.init_schema()
+            with open(log_path) as infile:
+                stats = db.bulk_load(ingest.ingest(db, infile))
+            db.commit()
+            db.begin()
+            results['ingest.tasks_per_sec'] = round(stats.tasks / stats.seconds)
+            results['ingest.rows_per_sec'] = round(stats.rows_per_sec)
+
+            last_day = db.get_task_dates()[-1]
+            latencies = _add_tasks(
+                db, last_day + datetime.timedelta(days=1), args.runs, args.seed)
+            results['add_task.median_ms'] = _ms(statistics.median(latencies))
+            results['add_task.p95_ms'] = _ms(
+                statistics.quantiles(latencies, n=20)[-1])
+
+            week = (last_day - datetime.timedelta(days=6), last_day)
+            queries: dict[str, Callable] = {
+                'list_words': lambda: db.list_words('ecw'),
+                'word_report': lambda: db.get_word_report(*week),
+                'weekly': lambda: list(db.iter_word_report('week')),
+            }
+            for (name, func) in queries.items():
+                results[f'{name}.ms'] = _ms(_best(func, args.repeat))
+
+        for (name, argv) in bench_startup._commands.items():
+            times = [bench_startup._run(argv, env, 'wastedyears.capture')
+                     for _ in range(args.repeat)]
+            results[f'startup.{name}_ms'] = _ms(statistics.median(times))
+    return results
+
+
+def _add_tasks(
+        db: database.WastedYearsDB,
+        day: datetime.date,
+        runs: int,
+        seed: int) -> list[float]:
+    '''record runs tasks on day (after the end of the history), the way
+    wy task does; return the latency of each'''
+    descs = synthetic.vocabulary(50, random.Random(seed))
+    # naive UTC, like wy task
+    now = datetime.datetime(day.year, day.month, day.day)
+    latencies = []
+    for idx in range(runs):
+        now += datetime.timedelta(minutes=5)
+        started = time.perf_counter()
+        db.end_last_task(now)
+        db.add_task(models.Task(start_ts=now, description=descs[idx % len(descs)]))
+        db.commit()
+        latencies.append(time.perf_counter() - started)
+        db.begin()
+    return latencies
+
+
+def _best(func: Callable, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 3)
+
+
+def _git_commit():
+    try:
+        result = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip()
+
+
+if __name__ == '__main__':
+    main()
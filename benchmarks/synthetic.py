@@ -0,0 +1,90 @@
+'''generate a synthetic, but vaguely realistic, stream of tasks'''
+
+import datetime
+import itertools
+import random
+from typing import Iterable, Iterator, TextIO
+
+from wastedyears import models
+
+_verbs = ['check', 'fix', 'review', 'write', 'read', 'plan', 'debug', 'test']
+_nouns = ['email', 'bug', 'docs', 'report', 'feature', 'build', 'meeting',
+          'design', 'release', 'backlog', 'notes', 'budget']
+_fixed = ['coffee', 'lunch', 'standup', 'watercooler', 'look busy']
+_url_hosts = ['bugs.example.com', 'wiki.example.com', 'github.com/example/app/pull']
+
+
+def vocabulary(size: int, rng: random.Random) -> list[str]:
+    '''return size distinct task descriptions, most common first
+
+    About one in ten mentions a URL, like a bug or code review link.
+    '''
+    descs = dict.fromkeys(_fixed)
+    while len(descs) < size:
+        desc = f'{rng.choice(_verbs)} {rng.choice(_nouns)} #{rng.randrange(10000)}'
+        if rng.random() < 0.1:
+            desc += f' https://{rng.choice(_url_hosts)}/{rng.randrange(100000)}'
+        descs[desc] = None
+    return list(descs)[:size]
+
+
+def generate_tasks(
+        num_tasks: int,
+        seed: int = 0,
+        start: datetime.date = datetime.date(2015, 1, 5),
+) -> Iterator[models.Task]:
+    '''Yield num_tasks finished tasks, starting on start.
+
+    Descriptions follow a Zipf-like distribution, tasks are back-to-back
+    (with short recording gaps) during office hours on weekdays, with a
+    lunch break, the odd day off, and two weeks of holiday every summer.
+    The same seed always gives the same tasks.
+    '''
+    rng = random.Random(seed)
+    descs = vocabulary(max(50, num_tasks // 20), rng)
+    cum_weights = list(itertools.accumulate(
+        1 / (rank + 1) for rank in range(len(descs))))
+
+    utc = datetime.timezone.utc
+    day = start
+    ts = None
+    lunch = None
+    for _ in range(num_tasks):
+        if ts is None or ts.hour >= 17:
+            day = _next_workday(day, rng)
+            ts = datetime.datetime(day.year, day.month, day.day, 7, 30, tzinfo=utc)
+            ts += datetime.timedelta(minutes=rng.randrange(120))
+            lunch = ts.replace(hour=12, minute=rng.randrange(45))
+
+        length = datetime.timedelta(seconds=int(rng.expovariate(1 / 900)) + 30)
+        gap = datetime.timedelta(seconds=rng.randrange(3, 20))
+        if lunch is not None and ts + length >= lunch:
+            gap += datetime.timedelta(minutes=rng.randrange(30, 75))
+            lunch = None
+        elif rng.random() < 0.02:
+            # forgot to record something
+            gap += datetime.timedelta(minutes=rng.randrange(5, 90))
+        (desc,) = rng.choices(descs, cum_weights=cum_weights)
+        yield models.Task(start_ts=ts, end_ts=ts + length, description=desc)
+        ts += length + gap
+
+
+def _next_workday(day: datetime.date, rng: random.Random) -> datetime.date:
+    while True:
+        day += datetime.timedelta(days=1)
+        holiday = day.month == 8 and day.day <= 14
+        if day.weekday() < 5 and not holiday and rng.random() >= 0.03:
+            return day
+
+
+def write_log(tasks: Iterable[models.Task], outfile: TextIO):
+    '''write tasks in the format read by wy ingest (which has no seconds,
+    and reads local times: so this writes UTC times, truncated)'''
+    day = None
+    for task in tasks:
+        assert task.start_ts is not None and task.end_ts is not None
+        if task.start_ts.date() != day:
+            day = task.start_ts.date()
+            outfile.write(f'\n{day}\n----------\n')
+        outfile.write(
+            f'{task.start_ts:%H:%M} .. {task.end_ts:%H:%M} {task.description}\n')
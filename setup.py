@@ -2,7 +2,6 @@ import setuptools
 
 install_requires = [
     'click >= 8.1',
-    'python-dateutil >= 2.8',
     'SQLAlchemy >= 1.4',
 ]
 dev_requires = [
@@ -11,21 +10,24 @@ dev_requires = [
     'pycodestyle >= 2.8.0',
     'pytest >= 7.1',
     'sqlalchemy-stubs >= 0.4',
-    'types-python-dateutil >= 2.8',
 ]
 
 setuptools.setup(
     name='wastedyears',
     version='0.0.1',
-    packages=setuptools.find_packages(),
+    packages=setuptools.find_packages(exclude=['benchmarks', 'benchmarks.*']),
     include_package_data=True,
+    python_requires='>= 3.10',
     install_requires=install_requires,
     extras_require={
         'dev': dev_requires,
+        # wy export/import, wy stats
+        'arrow': ['pyarrow >= 10'],
+        'numpy': ['numpy >= 1.21'],
     },
     entry_points={
         'console_scripts': [
-            'wy = wastedyears.cli:main',
+            'wy = wastedyears.capture:main',
         ],
     },
 )
@@ -0,0 +1,86 @@
+import asyncio
+import datetime
+import threading
+
+import pytest
+
+from wastedyears import aio, config, database
+
+
+def _minute(minute: int) -> datetime.datetime:
+    return datetime.datetime(2022, 7, 15, 9, minute, 0)
+
+
+def test_concurrent_writes(cfg: config.Config, make_task):
+    async def main():
+        async with await aio.AsyncWastedYearsDB.open(cfg) as db:
+            task_ids = await asyncio.gather(*(
+                db.add_task(make_task(_minute(minute), f'task {minute % 3}', minutes=0.5))
+                for minute in range(30)))
+            tasks = [task async for task in db.list_tasks(page_size=7)]
+            report = await db.get_word_report(
+                datetime.date(2022, 7, 15), datetime.date(2022, 7, 16))
+        return (task_ids, tasks, report)
+
+    (task_ids, tasks, report) = asyncio.run(main())
+
+    # one at a time, in order
+    assert task_ids == list(range(1, 31))
+    assert [task.task_id for task in tasks] == task_ids
+    assert [task.description for task in tasks] == [
+        f'task {minute % 3}' for minute in range(30)]
+    assert report['task'].total_count == 30
+    assert report['task'].total_elapsed == 30 * 30
+    assert report['0'].total_count == 10
+
+
+def test_read_during_write(cfg: config.Config, make_task):
+    in_write = threading.Event()
+    finish_write = threading.Event()
+
+    def slow_write(db: database.WastedYearsDB) -> int:
+        task_id = db.add_task(make_task(_minute(1), 'slow write'))
+        in_write.set()
+        assert finish_write.wait(timeout=10)
+        return task_id
+
+    async def main():
+        async with await aio.AsyncWastedYearsDB.open(cfg) as db:
+            await db.add_task(make_task(_minute(0), 'first'))
+
+            write = asyncio.create_task(db.write(slow_write))
+            queued = asyncio.create_task(db.add_task(make_task(_minute(2), 'queued')))
+            await asyncio.get_running_loop().run_in_executor(None, in_write.wait)
+
+            # the writer is stuck in the middle of a transaction, but
+            # reads carry on (and do not see the uncommitted task)
+            during = [task.description async for task in db.list_tasks()]
+            report = await db.get_word_report(
+                datetime.date(2022, 7, 15), datetime.date(2022, 7, 16))
+            assert not write.done() and not queued.done()
+
+            finish_write.set()
+            task_ids = (await write, await queued)
+            after = [task.description async for task in db.list_tasks()]
+        return (during, report, task_ids, after)
+
+    (during, report, task_ids, after) = asyncio.run(main())
+    assert during == ['first']
+    assert list(report) == ['first']
+    assert task_ids == (2, 3)
+    assert after == ['first', 'slow write', 'queued']
+
+
+def test_failed_write(cfg: config.Config, make_task):
+    def fail(db: database.WastedYearsDB):
+        db.add_task(make_task(_minute(0), 'rolled back'))
+        raise RuntimeError('oops')
+
+    async def main():
+        async with await aio.AsyncWastedYearsDB.open(cfg) as db:
+            with pytest.raises(RuntimeError):
+                await db.write(fail)
+            await db.add_task(make_task(_minute(1), 'kept'))
+            return [task.description async for task in db.list_tasks()]
+
+    assert asyncio.run(main()) == ['kept']
@@ -0,0 +1,119 @@
+import datetime
+import os
+import time
+from typing import Iterable
+
+import pytest
+
+from wastedyears import database, ingest, models
+
+np = pytest.importorskip('numpy')
+analytics = pytest.importorskip('wastedyears.analytics')
+
+
+@pytest.fixture
+def db(tmp_path):
+    engine = database.create_engine(f'sqlite:///{tmp_path}/test.sqlite')
+    db = database.WastedYearsDB(engine.connect())
+    db.init_schema()
+    filename = os.path.join(os.path.dirname(__file__), 'tasks.txt')
+    with open(filename) as infile:
+        db.bulk_load(ingest.ingest(db, infile))
+    # an unfinished task is left out
+    db.add_task(models.Task(
+        start_ts=datetime.datetime(2022, 7, 18, 9, 0, 0),
+        description='check email'))
+    yield db
+    db.close()
+
+
+def _words(words: Iterable[models.WordInfo]) -> list[tuple[str, int, int]]:
+    return [(wi.word, wi.total_count, wi.total_elapsed) for wi in words]
+
+
+def test_rank_words(db: database.WastedYearsDB):
+    tasks = analytics.TaskArrays.load(db)
+    assert len(tasks) == db.conn.execute(
+        'select count(*) from tasks where end_ts is not null').scalar()
+    assert _words(tasks.rank_words()) == _words(db.list_words('ecw'))
+    assert _words(tasks.rank_words(limit=3)) == _words(db.list_words('ecw'))[:3]
+
+    # same as summing the per-day rollup
+    since = datetime.datetime(2022, 6, 7)
+    until = datetime.datetime(2022, 6, 14)
+    report = db.get_word_report(since, until)
+    assert sorted(_words(tasks.window(since, until).rank_words())) == sorted(
+        _words(report.values()))
+    assert tasks.window(until=datetime.datetime(2000, 1, 1)).rank_words() == []
+
+
+def test_totals(db: database.WastedYearsDB):
+    tasks = analytics.TaskArrays.load(db)
+    expect = db.conn.execute(
+        "select date(start_ts), count(*),"
+        " sum(strftime('%s', end_ts) - strftime('%s', start_ts))"
+        ' from tasks where end_ts is not null group by 1 order by 1').fetchall()
+    assert [(day.isoformat(), count, elapsed)
+            for (day, count, elapsed) in tasks.totals('day')] == expect
+
+    weeks = tasks.totals('week')
+    assert all(day.weekday() == 0 for (day, _, _) in weeks)
+    assert sum(count for (_, count, _) in weeks) == len(tasks)
+    assert sum(elapsed for (_, _, elapsed) in weeks) == tasks.elapsed.sum()
+
+    heatmap = tasks.heatmap()
+    assert heatmap.shape == (7, 24)
+    assert heatmap.sum() == tasks.elapsed.sum()
+    assert tasks.median_elapsed() == np.median(tasks.elapsed)
+
+
+def test_heatmap():
+    # two tasks starting Monday 09:00 UTC and Sunday 23:30 UTC
+    start = np.array([1658134800, 1658100600], dtype=np.int64)
+    tasks = analytics.TaskArrays(
+        task_ids=np.array([1, 2]),
+        start=start,
+        end=start + np.array([1800, 600]),
+        word_ptr=np.array([0, 0, 0]),
+        word_idx=np.array([], dtype=np.int64),
+        words=[])
+    heatmap = tasks.heatmap()
+    assert heatmap[0, 9] == 1800
+    assert heatmap[6, 23] == 600
+    assert heatmap.sum() == 2400
+
+    # an hour east of UTC, the second task starts on Monday
+    heatmap = tasks.heatmap(offset=3600)
+    assert heatmap[0, 10] == 1800
+    assert heatmap[0, 0] == 600
+    assert tasks.median_elapsed() == 1200
+
+
+def test_local_offsets(monkeypatch):
+    # Central European Time, with summer time from 2022-03-27 01:00 UTC
+    monkeypatch.setenv('TZ', 'CET-1CEST,M3.5.0,M10.5.0/3')
+    time.tzset()
+    try:
+        # 2022-01-10 12:00, 2022-03-27 00:30, 02:30 and 2022-07-11 11:00 UTC
+        start = np.array([1641816000, 1648341000, 1648348200, 1657537200],
+                         dtype=np.int64)
+        tasks = analytics.TaskArrays(
+            task_ids=np.arange(4),
+            start=start,
+            end=start + 600,
+            word_ptr=np.zeros(5, dtype=np.int64),
+            word_idx=np.array([], dtype=np.int64),
+            words=[])
+        offsets = tasks.local_offsets()
+        assert offsets.tolist() == [3600, 3600, 7200, 7200]
+
+        # 13:00 local in winter and in summer; the night of the change
+        # is Sunday 01:30 CET and 04:30 CEST
+        heatmap = tasks.heatmap(offsets)
+        assert heatmap[0, 13] == 1200
+        assert (heatmap[6, 1], heatmap[6, 4]) == (600, 600)
+        assert [day.isoformat() for (day, _, _) in tasks.totals('week', offsets)] == [
+            '2022-01-10', '2022-03-21', '2022-07-11']
+    finally:
+        monkeypatch.undo()
+        time.tzset()
@@ -0,0 +1,98 @@
+import datetime
+import subprocess
+import sys
+
+from wastedyears import capture, config, database, models
+
+
+def test_capture(cfg: config.Config, monkeypatch):
+    times = iter([
+        datetime.datetime(2022, 7, 15, 9, 0, 0),
+        datetime.datetime(2022, 7, 15, 9, 5, 30),
+        datetime.datetime(2022, 7, 15, 9, 7, 0),
+    ])
+    monkeypatch.setattr(capture, '_now', lambda: next(times))
+
+    assert capture.capture(['t', 'check', 'email'])
+    assert capture.capture(['task', 'email', 'Bob'])
+    assert capture.capture(['done'])
+
+    # the same thing, the slow way
+    expect_cfg = config.Config(
+        data_dir=cfg.data_dir,
+        db_url=f'sqlite:///{cfg.data_dir}/expect.sqlite')
+    with database.open_db(expect_cfg) as db:
+        db.init_schema()
+        db.add_task(models.Task(
+            start_ts=datetime.datetime(2022, 7, 15, 9, 0, 0),
+            description='check email'))
+        db.end_last_task(datetime.datetime(2022, 7, 15, 9, 5, 30))
+        db.add_task(models.Task(
+            start_ts=datetime.datetime(2022, 7, 15, 9, 5, 30),
+            description='email Bob'))
+        db.end_last_task(datetime.datetime(2022, 7, 15, 9, 7, 0))
+        db.commit()
+
+    assert _dump(cfg) == _dump(expect_cfg)
+    assert _dump(cfg)['words'] == [
+        (1, 'check', 1, 330),
+        (2, 'email', 2, 420),
+        (3, 'Bob', 1, 90),
+    ]
+
+
+def test_capture_long_task(cfg: config.Config, monkeypatch):
+    # a weekend away, recorded at odd fractions of a second
+    times = iter([
+        datetime.datetime(2022, 7, 15, 17, 0, 0, 900000),
+        datetime.datetime(2022, 7, 18, 9, 0, 0, 100000),
+    ])
+    monkeypatch.setattr(capture, '_now', lambda: next(times))
+    assert capture.capture(['t', 'weekend'])
+    assert capture.capture(['done'])
+
+    # recomputing words from tasks finds what the fast path recorded
+    with database.open_db(cfg) as db:
+        assert db.check_words(workers=1) == []
+        assert db.check_rollups() == []
+        db.rebuild_words(workers=1)
+        assert db.check_words(workers=1) == []
+    assert _dump(cfg)['words'] == [(1, 'weekend', 1, 2 * 86400 + 16 * 3600)]
+
+
+def test_capture_fallback(cfg: config.Config):
+    # anything but "task WORDS" and "done" goes to the full CLI
+    assert not capture.capture([])
+    assert not capture.capture(['t'])
+    assert not capture.capture(['t', '--help'])
+    assert not capture.capture(['done', 'now'])
+    assert not capture.capture(['ls'])
+
+    # so does a database that needs migrating
+    conn = capture.connect(capture.sqlite_filename(cfg.db_url) or '')
+    with conn:
+        conn.execute('update schema_version set version = 1')
+    assert not capture.capture(['t', 'check', 'email'])
+
+
+def test_capture_imports():
+    # the whole point of the fast path is to not import these
+    code = ('import sys, wastedyears.capture; '
+            'print(sorted({"click", "sqlalchemy"} & sys.modules.keys()))')
+    result = subprocess.run(
+        [sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    assert result.stdout == '[]\n'
+
+
+def _dump(cfg: config.Config) -> dict[str, list[tuple]]:
+    conn = capture.connect(capture.sqlite_filename(cfg.db_url) or '')
+    queries = {
+        'tasks': 'select task_id, start_ts, end_ts, description_id from tasks',
+        'descriptions': 'select * from descriptions',
+        'words': 'select * from words',
+        'task_words': 'select * from task_words order by task_id, word_id',
+        'word_daily': 'select * from word_daily order by day, word_id',
+    }
+    dump = {name: conn.execute(sql).fetchall() for (name, sql) in queries.items()}
+    conn.close()
+    return dump
@@ -0,0 +1,182 @@
+import datetime
+import json
+import os
+
+import click
+from click.testing import CliRunner
+
+from wastedyears import cli, config, database, models
+
+
+def test_task_editor(cfg: config.Config, monkeypatch):
+
+    # tasks from three days ago, yesterday, and today (local noon)
+    today = datetime.datetime.now().astimezone().date()
+    with database.open_db(cfg) as db:
+        for (days_ago, description) in [(3, 'ancient history'),
+                                        (1, 'boring email to Bob'),
+                                        (1, 'check email'),
+                                        (0, 'check email'),
+                                        (0, 'coffee'),
+                                        (0, 'check email')]:
+            noon = cli._local_midnight(today - datetime.timedelta(days=days_ago))
+            noon += datetime.timedelta(hours=12)
+            db.end_last_task(noon)
+            db.add_task(models.Task(start_ts=noon, description=description))
+
+    edited = []
+
+    def edit(text):
+        edited.append(text)
+        return text.replace('here:\n', 'here:\nfix bug #321\n', 1)
+
+    monkeypatch.setattr(click, 'edit', edit)
+    result = CliRunner().invoke(cli.main, ['t'])
+    assert result.exit_code == 0, result.output
+
+    assert edited == ['\n'.join([
+        '# wy task editor; enter new task here:',
+        '',
+        '',
+        '# recent tasks from yesterday:',
+        'boring email to Bob',
+        'check email',
+        '',
+        '# recent tasks from today:',
+        'check email',
+        'coffee',
+        '',
+    ])]
+    with database.open_db(cfg) as db:
+        tasks = db.list_tasks()
+    assert [task.description for task in tasks[-2:]] == ['check email', 'fix bug #321']
+    assert tasks[-2].end_ts is not None
+    assert tasks[-1].end_ts is None
+
+    # nothing entered: no new task
+    monkeypatch.setattr(click, 'edit', lambda text: None)
+    result = CliRunner().invoke(cli.main, ['t'])
+    assert result.exit_code == 0
+    with database.open_db(cfg) as db:
+        assert len(db.list_tasks()) == len(tasks)
+
+
+def test_list_json(cfg: config.Config, monkeypatch):
+    runner = CliRunner()
+    result = runner.invoke(cli.main, ['ls-tasks', '--json'])
+    assert result.output == '[]\n'
+
+    with database.open_db(cfg) as db:
+        start_ts = datetime.datetime(2022, 6, 6, 9, 15)
+        for idx in range(3):
+            db.end_last_task(start_ts)
+            db.add_task(models.Task(start_ts=start_ts, description=f'fix bug #{idx}'))
+            start_ts += datetime.timedelta(minutes=20)
+
+    result = runner.invoke(cli.main, ['ls-tasks', '--json'])
+    assert result.exit_code == 0, result.output
+    tasks = json.loads(result.output)
+    assert [task['description'] for task in tasks] == [
+        'fix bug #0', 'fix bug #1', 'fix bug #2']
+    assert tasks[0]['start_ts'] == '2022-06-06T09:15:00Z'
+    assert tasks[0]['end_ts'] == '2022-06-06T09:35:00Z'
+    assert tasks[-1]['end_ts'] is None
+
+    # the same records, one per line, streamed in chunks
+    monkeypatch.setattr(cli._write_json, '__defaults__', (2,))
+    result = runner.invoke(cli.main, ['ls-tasks', '--ndjson', '--limit', '2'])
+    assert result.exit_code == 0, result.output
+    assert [json.loads(line) for line in result.output.splitlines()] == tasks[:2]
+
+    result = runner.invoke(cli.main, ['ls-words', '--ndjson'])
+    assert result.exit_code == 0, result.output
+    words = [json.loads(line) for line in result.output.splitlines()]
+    # only finished tasks count
+    fix = next(word for word in words if word['word'] == 'fix')
+    assert (fix['total_count'], fix['total_elapsed']) == (2, 2400)
+    result = runner.invoke(cli.main, ['ls-words', '--json'])
+    assert json.loads(result.output) == words
+
+
+def test_ingest_again(cfg: config.Config):
+    filename = os.path.join(os.path.dirname(__file__), 'tasks.txt')
+    runner = CliRunner()
+
+    result = runner.invoke(cli.main, ['ingest', filename])
+    assert result.exit_code == 0, result.output
+    with database.open_db(cfg) as db:
+        tasks = db.list_tasks()
+        words = db.list_words('w')
+
+    result = runner.invoke(cli.main, ['ingest', filename])
+    assert result.exit_code == 0, result.output
+    assert f'; {len(tasks)} skipped, 0 updated' in result.output
+    with database.open_db(cfg) as db:
+        assert db.list_tasks() == tasks
+        assert db.list_words('w') == words
+
+
+def test_at(cfg: config.Config):
+    day = datetime.date(2022, 6, 6)
+    with database.open_db(cfg) as db:
+        for (hour, description) in [(9, 'standup'), (10, 'code review')]:
+            start_ts = cli._local_midnight(day) + datetime.timedelta(hours=hour)
+            db.end_last_task(start_ts)
+            db.add_task(models.Task(start_ts=start_ts, description=description))
+        db.end_last_task(start_ts + datetime.timedelta(hours=1))
+
+    runner = CliRunner()
+    result = runner.invoke(cli.main, ['at', '2022-06-06 09:30'])
+    assert result.exit_code == 0, result.output
+    assert result.output.endswith(': standup\n')
+    result = runner.invoke(cli.main, ['at', '2022-06-06 12:00'])
+    assert result.exit_code == 0, result.output
+    assert result.output.startswith('no task at 2022-06-06 12:00')
+
+    assert runner.invoke(cli.main, ['overlaps']).output == ''
+    with database.open_db(cfg) as db:
+        db.conn.execute(
+            "update tasks set end_ts = datetime(end_ts, '+5 minutes') where task_id = 1")
+    result = runner.invoke(cli.main, ['overlaps'])
+    assert result.exit_code == 0, result.output
+    lines = result.output.splitlines()
+    assert len(lines) == 2
+    assert lines[0].endswith(': standup')
+    assert lines[1].startswith('  overlaps ') and lines[1].endswith(': code review')
+
+
+def test_switches_and_gaps(cfg: config.Config):
+    filename = os.path.join(os.path.dirname(__file__), 'tasks.txt')
+    runner = CliRunner()
+    assert runner.invoke(cli.main, ['ingest', filename]).exit_code == 0
+
+    result = runner.invoke(cli.main, ['switches', '--by', 'week'])
+    assert result.exit_code == 0, result.output
+    lines = result.output.splitlines()
+    assert lines[0].split() == ['tasks', 'switches', 'longest', 'streak']
+    assert lines[1].startswith('2022-02-28       1        0')
+
+    result = runner.invoke(cli.main, ['gaps', '--since', '2022-06-06'])
+    assert result.exit_code == 0, result.output
+    lines = result.output.splitlines()
+    assert lines[0].split() == ['gaps', 'total', 'longest', 'untracked']
+    # the test log has no gaps
+    assert lines[1].split() == ['2022-06-06', '0', '0s', '0s', '0s']
+
+
+def test_report_cache(cfg: config.Config):
+    filename = os.path.join(os.path.dirname(__file__), 'tasks.txt')
+    runner = CliRunner()
+    assert runner.invoke(cli.main, ['ingest', filename]).exit_code == 0
+
+    first = runner.invoke(cli.main, ['weekly', '--cache-stats'])
+    assert first.exit_code == 0, first.output
+    assert first.stderr.startswith('report cache: 0 hits, ')
+    weeks = first.stdout.count('\n\n')
+    assert weeks > 1
+
+    # nothing changed, so every week comes from the cache
+    second = runner.invoke(cli.main, ['weekly', '--cache-stats'])
+    assert second.exit_code == 0, second.output
+    assert second.stdout == first.stdout
+    assert second.stderr.startswith(f'report cache: {weeks} hits, 0 misses')
@@ -0,0 +1,50 @@
+import pytest
+
+from wastedyears import capture, config, database
+
+
+def _pragmas(execute) -> tuple:
+    return tuple(
+        execute(f'pragma {name}').fetchone()[0]
+        for name in ('journal_mode', 'synchronous', 'cache_size', 'busy_timeout'))
+
+
+def test_sqlite_defaults(config_home):
+    cfg = config.get_config()
+    assert cfg.sqlite == config.SQLiteConfig()
+    with database.open_db(cfg) as db:
+        # synchronous=normal is 1
+        assert _pragmas(db.conn.execute) == ('wal', 1, -16384, 5000)
+
+
+def test_sqlite_config(config_home):
+    (config_home / 'wastedyears.cfg').write_text(
+        '[sqlite]\n'
+        'journal_mode = DELETE\n'
+        'synchronous = full\n'
+        'cache_size = 500\n'
+        'busy_timeout = 100\n')
+    cfg = config.get_config()
+    assert cfg.sqlite.journal_mode == 'delete'
+    assert cfg.sqlite.mmap_size == config.SQLiteConfig.mmap_size
+
+    with database.open_db(cfg) as db:
+        db.init_schema()
+        db.commit()
+        assert _pragmas(db.conn.execute) == ('delete', 2, 500, 100)
+
+    # the fast path sets up its connection the same way
+    conn = capture.connect(capture.sqlite_filename(cfg.db_url) or '', cfg.sqlite)
+    try:
+        assert _pragmas(conn.execute) == ('delete', 2, 500, 100)
+    finally:
+        conn.close()
+
+
+def test_sqlite_invalid(config_home):
+    (config_home / 'wastedyears.cfg').write_text(
+        '[sqlite]\njournal_mode = wal; drop table tasks\n')
+    with pytest.raises(ValueError, match='journal_mode'):
+        config.get_config()
+    with pytest.raises(ValueError, match='synchronous'):
+        config.SQLiteConfig(synchronous='sometimes')
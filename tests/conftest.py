@@ -0,0 +1,43 @@
+import datetime
+import pathlib
+from typing import Callable
+
+import pytest
+
+from wastedyears import config, database, models
+
+TaskFactory = Callable[..., models.Task]
+
+
+@pytest.fixture
+def config_home(tmp_path, monkeypatch) -> pathlib.Path:
+    '''keep the config and data of wy in tmp_path; return the (empty)
+    config directory'''
+    monkeypatch.setenv('XDG_CONFIG_HOME', str(tmp_path / 'config'))
+    monkeypatch.setenv('XDG_DATA_HOME', str(tmp_path / 'data'))
+    config_home = tmp_path / 'config'
+    config_home.mkdir()
+    return config_home
+
+
+@pytest.fixture
+def cfg(config_home: pathlib.Path) -> config.Config:
+    '''the default config, with an initialized (empty) database'''
+    cfg = config.get_config()
+    with database.open_db(cfg) as db:
+        db.init_schema()
+    return cfg
+
+
+@pytest.fixture
+def make_task() -> TaskFactory:
+    '''make_task(start_ts, description, minutes=60) makes a finished task'''
+    def make_task(
+            start_ts: datetime.datetime,
+            description: str,
+            minutes: float = 60) -> models.Task:
+        return models.Task(
+            start_ts=start_ts,
+            end_ts=start_ts + datetime.timedelta(minutes=minutes),
+            description=description)
+    return make_task
@@ -1,6 +1,8 @@
+import dataclasses
 import datetime
 import os
 import shutil
+import sqlite3
 import tempfile
 from typing import Optional
 
@@ -8,7 +10,7 @@ import pytest
 import sqlalchemy as sa
 import sqlalchemy.engine.base
 
-from wastedyears import database, models
+from wastedyears import database, ingest, migrations, models
 
 _tmp_dir: Optional[str] = None
 _test_engine: Optional[sqlalchemy.engine.base.Engine] = None
@@ -100,9 +102,62 @@ class TestWastedYearsDB:
             (2, 'thing'),
         ]
 
+        # a repeated description is stored once, and its words are reused
+        task = models.Task(
+            start_ts=parse_ts('2022-07-15T12:03:16'),
+            end_ts=parse_ts('2022-07-15T12:04:16'),
+            description=description)
+        assert db.add_task(task) == 3
+        assert self._get_words(db) == [
+            ('device', 3, 186 + 375 + 60),
+            ('fiddle', 3, 186 + 375 + 60),
+            ('la', 2, 186 + 60),
+            ('thing', 1, 375)
+        ]
+        descs = db.tbl_descriptions
+        assert db.conn.execute(
+            sa.select([descs.c.description, descs.c.word_ids])
+            .order_by(descs.c.description_id)
+        ).fetchall() == [
+            ('fiddle la-la device', '1 2 3'),
+            ('fiddle /thing/ device!', '1 2 4'),
+        ]
+        assert [task.description for task in db.list_tasks()] == [
+            description, 'fiddle /thing/ device!', description]
+
+    def test_iter_tasks(self, db: database.WastedYearsDB):
+        start_ts = parse_ts('2022-07-15T09:00:00')
+        for hour in range(10):
+            db.add_task(models.Task(
+                start_ts=start_ts + datetime.timedelta(hours=hour),
+                end_ts=start_ts + datetime.timedelta(hours=hour, minutes=5),
+                description=f'task {hour}'))
+
+        def task_ids(**kwargs) -> list[Optional[int]]:
+            return [task.task_id for task in db.iter_tasks(page_size=3, **kwargs)]
+
+        assert task_ids() == list(range(1, 11))
+        assert task_ids(limit=4) == [1, 2, 3, 4]
+        assert task_ids(limit=6) == [1, 2, 3, 4, 5, 6]
+        assert task_ids(since=start_ts + datetime.timedelta(hours=2),
+                        until=start_ts + datetime.timedelta(hours=7)) == [3, 4, 5, 6, 7]
+        assert task_ids(since=start_ts + datetime.timedelta(hours=5), limit=2) == [6, 7]
+        assert task_ids(until=start_ts) == []
+
+        task = next(db.iter_tasks())
+        assert task.start_ts == start_ts
+        assert task.start_ts.tzinfo is datetime.timezone.utc
+        assert task.update_ts is not None
+        assert task.update_ts.tzinfo is datetime.timezone.utc
+        assert task.description == 'task 0'
+        assert not hasattr(task, '__dict__')
+
     def test_upsert_words(self, db: database.WastedYearsDB):
         ts = datetime.datetime(2000, 1, 1, 0, 0, 0, tzinfo=datetime.timezone.utc)
+        day = ts.date()
         rows = [{'task_id': task_id} for task_id in [1, 2, 3, 4, 5]]
+        db.conn.execute(
+            db.tbl_descriptions.insert().values(description_id=1, description=''))
         db.conn.execute(
             db.tbl_tasks.insert()
             .values(
@@ -110,7 +165,7 @@ class TestWastedYearsDB:
                 update_ts=ts,
                 start_ts=ts,
                 end_ts=ts,
-                description='',
+                description_id=1,
             ),
             rows,
         )
@@ -122,11 +177,11 @@ class TestWastedYearsDB:
                 .order_by(tbl.c.word)
             ).fetchall()
 
-        new_words = db.upsert_words(1, [], 10)
+        new_words = db.upsert_words(1, [], 10, day)
         assert new_words == {}
 
         # all new words
-        new_words = db.upsert_words(2, ['hello', 'd!ng/', 'bla9'], 5)
+        new_words = db.upsert_words(2, ['hello', 'd!ng/', 'bla9'], 5, day)
         assert new_words == {
             'hello': 1,
             'd!ng/': 2,
@@ -142,7 +197,7 @@ class TestWastedYearsDB:
         assert get_words() == expect
 
         # all existing words
-        new_words = db.upsert_words(3, ['hello', 'd!ng/', 'bla9'], 15)
+        new_words = db.upsert_words(3, ['hello', 'd!ng/', 'bla9'], 15, day)
         assert new_words == {}
 
         # make sure total_count, total_elapsed are updated
@@ -154,7 +209,7 @@ class TestWastedYearsDB:
         assert get_words() == expect
 
         # a mix of new and existing words
-        new_words = db.upsert_words(4, ['hello', 'foo', 'bla8', 'bla9'], 5)
+        new_words = db.upsert_words(4, ['hello', 'foo', 'bla8', 'bla9'], 5, day)
         assert new_words == {
             'foo': 4,
             'bla8': 5,
@@ -170,7 +225,508 @@ class TestWastedYearsDB:
         ]
         assert get_words() == expect
 
-    def _get_words(self, db: database.WastedYearsDB) -> list[str]:
+        # a word with zero totals is still not new
+        db.conn.execute(
+            "insert into words (word, total_count, total_elapsed) values ('zero', 0, 0)")
+        new_words = db.upsert_words(5, ['zero', 'brandnew'], 5, day)
+        assert new_words == {'brandnew': 7}
+        assert ('zero', 1, 5) in get_words()
+
+    def test_word_totals(self, db: database.WastedYearsDB):
+        # Replay a realistic log through add_task(), and check that word
+        # totals agree with the straightforward word-at-a-time definition
+        # (which is how upsert_words() used to compute them).
+        tasks = read_test_tasks(db)
+        tasks.append(models.Task(
+            start_ts=parse_ts('2022-07-15T09:00:00'),
+            end_ts=parse_ts('2022-07-15T09:05:00'),
+            description='email email email, check check'))
+
+        expect: dict[str, tuple[int, int]] = {}
+        for task in tasks:
+            db.add_task(task)
+
+            assert task.start_ts is not None and task.end_ts is not None
+            elapsed = models.elapsed_seconds(task.start_ts, task.end_ts)
+            for word in set(models.split_description(task.description)):
+                (count, total) = expect.get(word, (0, 0))
+                expect[word] = (count + 1, total + elapsed)
+
+        assert self._get_words(db) == [
+            (word, count, total)
+            for (word, (count, total)) in sorted(expect.items())
+        ]
+
+    def test_rollups(self, db: database.WastedYearsDB):
+        tasks = read_test_tasks(db)
+        db.bulk_load(tasks[:10], chunk_size=3)
+        for task in tasks[10:]:
+            db.add_task(task)
+
+        # an unfinished task only shows up in the rollup once it ends
+        db.add_task(models.Task(
+            start_ts=parse_ts('2022-06-14T23:50:00'),
+            description='check email'))
+        # (like the CLI, pass naive UTC)
+        db.end_last_task(datetime.datetime(2022, 6, 15, 0, 20, 0))
+
+        def get_rollup():
+            tbl_d = db.tbl_word_daily
+            tbl_w = db.tbl_words
+            return db.conn.execute(
+                sa.select([tbl_d.c.day, tbl_w.c.word,
+                           tbl_d.c.total_count, tbl_d.c.total_elapsed])
+                .select_from(tbl_d.join(tbl_w))
+                .order_by(tbl_d.c.day, tbl_w.c.word)
+            ).fetchall()
+
+        rollup = get_rollup()
+        assert rollup[-2:] == [
+            (datetime.date(2022, 6, 14), 'watercooler', 1, 60),
+            (datetime.date(2022, 6, 14), 'work', 2, 10320 + 2640),
+        ]
+        assert (datetime.date(2022, 6, 14), 'check', 2, 2580 + 1800) in rollup
+        assert db.check_rollups() == []
+
+        # the incrementally maintained rollup is what a rebuild produces
+        db.rebuild_rollups()
+        assert get_rollup() == rollup
+        assert db.check_rollups() == []
+
+        db.conn.execute(db.tbl_word_daily.delete().where(
+            db.tbl_word_daily.c.day == datetime.date(2022, 2, 28)))
+        assert db.check_rollups() == [
+            'daydreaming: words has 1 tasks, 900 s; word_daily has 0 tasks, 0 s',
+        ]
+
+    def test_long_tasks(self, db: database.WastedYearsDB):
+        # more than a day, with fractions of a second
+        db.add_task(models.Task(
+            start_ts=parse_ts('2022-07-15T09:00:00.900000'),
+            end_ts=parse_ts('2022-07-17T10:00:00.100000'),
+            description='long haul'))
+        db.add_task(models.Task(
+            start_ts=parse_ts('2022-07-19T09:00:00.500000'),
+            description='long haul'))
+        db.end_last_task(datetime.datetime(2022, 7, 20, 9, 0, 0, 250000))
+        # an ingested span that crosses midnight ends before it starts
+        db.bulk_load([models.Task(
+            start_ts=parse_ts('2022-07-21T23:00:00'),
+            end_ts=parse_ts('2022-07-21T01:00:00'),
+            description='late night')])
+
+        words = self._get_words(db)
+        assert words == [
+            ('haul', 2, 2 * 86400 + 3600 + 86400),
+            ('late', 1, -22 * 3600),
+            ('long', 2, 2 * 86400 + 3600 + 86400),
+            ('night', 1, -22 * 3600),
+        ]
+        pairs = self._get_pairs(db)
+        assert db.check_rollups() == []
+        assert db.check_words(workers=1) == []
+
+        # rebuilding agrees with what was recorded
+        db.rebuild_rollups()
+        db.rebuild_word_pairs()
+        assert db.check_rollups() == []
+        assert self._get_words(db) == words
+        assert self._get_pairs(db) == pairs
+
+    def test_iter_word_report(self, db: database.WastedYearsDB):
+        db.bulk_load(read_test_tasks(db))
+
+        # weekly report must agree with get_word_report() for each week
+        report = list(db.iter_word_report('week'))
+        assert [date.isoformat() for (date, _) in report] == [
+            '2022-02-28', '2022-06-06', '2022-06-13']
+        for (date, words) in report:
+            word_map = db.get_word_report(
+                start_ts=date, end_ts=date + datetime.timedelta(days=7))
+            assert sorted(
+                (wi.word, wi.total_count, wi.total_elapsed) for wi in words
+            ) == sorted(
+                (wi.word, wi.total_count, wi.total_elapsed) for wi in word_map.values()
+            )
+            assert words == sorted(
+                words, key=lambda wi: (-wi.total_elapsed, -wi.total_count, wi.word))
+
+        report = list(db.iter_word_report('month'))
+        assert [date.isoformat() for (date, _) in report] == [
+            '2022-02-01', '2022-06-01']
+
+        # restrict to a window of days
+        report = list(db.iter_word_report(
+            'day',
+            since=parse_ts('2022-06-06T00:00:00'),
+            until=parse_ts('2022-06-14T00:00:00')))
+        assert [date.isoformat() for (date, _) in report] == [
+            '2022-06-06', '2022-06-13']
+        assert report[1][1][0] == models.WordInfo(
+            word_id=report[1][1][0].word_id,
+            word='lunch',
+            total_count=1,
+            total_elapsed=10620)
+
+    def test_word_pairs(self, db: database.WastedYearsDB):
+        tasks = read_test_tasks(db)
+        db.bulk_load(tasks[:10], chunk_size=4)
+        for task in tasks[10:]:
+            db.add_task(task)
+
+        related = db.get_related_words('email')
+        assert [(wi.word, wi.total_count, wi.total_elapsed) for wi in related] == [
+            ('check', 6, 10770),
+        ]
+        related = db.get_related_words('work', order_by='cw')
+        assert [(wi.word, wi.total_count) for wi in related] == [
+            ('on', 4),
+            ('feature', 3),
+            ('http://bugs.example.com/1323', 3),
+            ('bug', 1),
+            ('http://bugs.example.com/2322', 1),
+        ]
+        assert db.get_related_words('work', limit=1) == related[:1]
+        assert db.get_related_words('nonesuch') == []
+
+        # the incrementally maintained table is what a rebuild produces
+        def get_pairs():
+            return db.conn.execute(
+                'select * from word_pairs order by word_id_a, word_id_b').fetchall()
+
+        pairs = get_pairs()
+        db.rebuild_word_pairs()
+        assert get_pairs() == pairs
+
+    def test_word_pairs_cap(self, db: database.WastedYearsDB):
+        db.pair_cap = 2
+        db.add_task(models.Task(
+            start_ts=parse_ts('2022-07-15T09:00:00'),
+            end_ts=parse_ts('2022-07-15T09:05:00'),
+            description='one two three'))
+        db.bulk_load([models.Task(
+            start_ts=parse_ts('2022-07-15T09:05:00'),
+            end_ts=parse_ts('2022-07-15T09:06:00'),
+            description='three two one four')])
+
+        pairs = [('one', 'three', 2, 360)]
+        assert self._get_pairs(db) == pairs
+        db.rebuild_word_pairs()
+        assert self._get_pairs(db) == pairs
+
+    def test_search_tasks(self, db: database.WastedYearsDB):
+        db.bulk_load(read_test_tasks(db))
+
+        def search(*args, **kwargs) -> list[tuple[Optional[int], str]]:
+            return [(task.task_id, task.description)
+                    for task in db.search_tasks(*args, **kwargs)]
+
+        assert search('feature') == [
+            (4, 'work on feature http://bugs.example.com/1323'),
+            (9, 'work on feature http://bugs.example.com/1323'),
+            (18, 'work on feature http://bugs.example.com/1323'),
+        ]
+        assert search('feature', order_by='elapsed', limit=2) == [
+            (18, 'work on feature http://bugs.example.com/1323'),
+            (9, 'work on feature http://bugs.example.com/1323'),
+        ]
+        assert search('feature', since=parse_ts('2022-06-07T00:00:00')) == [
+            (18, 'work on feature http://bugs.example.com/1323'),
+        ]
+        assert search('feature', until=parse_ts('2022-06-07T00:00:00')) == [
+            (4, 'work on feature http://bugs.example.com/1323'),
+            (9, 'work on feature http://bugs.example.com/1323'),
+        ]
+        assert search('"bugs.example.com/2322"') == [
+            (21, 'work on bug http://bugs.example.com/2322'),
+        ]
+        assert search('coffee OR daydream*') == [
+            (1, 'daydreaming'),
+            (11, 'coffee watercooler'),
+        ]
+
+        # the index follows updates to descriptions
+        tasks = db.tbl_tasks
+        descs = db.tbl_descriptions
+        description_id = db.conn.execute(
+            sa.select([tasks.c.description_id]).where(tasks.c.task_id == 21)
+        ).scalar()
+        db.conn.execute(
+            descs.update()
+            .values(description='finish feature')
+            .where(descs.c.description_id == description_id))
+        db.conn.execute(
+            db.tbl_task_words.delete().where(db.tbl_task_words.c.task_id == 4))
+        db.conn.execute(tasks.delete().where(tasks.c.task_id == 4))
+        assert search('feature') == [
+            (21, 'finish feature'),         # short description ranks higher
+            (9, 'work on feature http://bugs.example.com/1323'),
+            (18, 'work on feature http://bugs.example.com/1323'),
+        ]
+        assert search('2322') == []
+
+    def test_bulk_load(self, db: database.WastedYearsDB):
+        # an existing task, so bulk_load() has to update existing words
+        db.add_task(models.Task(
+            start_ts=parse_ts('2022-07-14T09:00:00'),
+            end_ts=parse_ts('2022-07-14T09:10:00'),
+            description='check email'))
+
+        tasks = [
+            models.Task(
+                start_ts=parse_ts('2022-07-15T09:00:00'),
+                end_ts=parse_ts('2022-07-15T09:05:00'),
+                description='check email email'),
+            models.Task(
+                start_ts=parse_ts('2022-07-15T09:05:00'),
+                end_ts=parse_ts('2022-07-15T09:06:00'),
+                description='coffee'),
+            models.Task(
+                start_ts=parse_ts('2022-07-15T09:06:00'),
+                end_ts=parse_ts('2022-07-15T10:06:00'),
+                description='fix bug, check email'),
+            models.Task(
+                start_ts=parse_ts('2022-07-15T10:06:00'),
+                description='coffee again'),
+        ]
+        stats = db.bulk_load(tasks, chunk_size=2)
+        assert stats.tasks == 4
+        # tasks + new descriptions + task_words + new words + updated words
+        # + updated rollups + updated word pairs
+        assert stats.rows == 4 + 4 + 7 + 3 + 7 + 7 + 7
+
+        tasks = db.list_tasks()
+        assert [task.task_id for task in tasks] == [1, 2, 3, 4, 5]
+        assert tasks[4].description == 'coffee again'
+        assert tasks[4].end_ts is None
+
+        # words of the unfinished task are not recorded (yet)
+        assert self._get_words(db) == [
+            ('bug', 1, 3600),
+            ('check', 3, 600 + 300 + 3600),
+            ('coffee', 1, 60),
+            ('email', 3, 600 + 300 + 3600),
+            ('fix', 1, 3600),
+        ]
+        assert self._get_task_words(db) == [
+            (1, 'check'),
+            (1, 'email'),
+            (2, 'check'),
+            (2, 'email'),
+            (3, 'coffee'),
+            (4, 'bug'),
+            (4, 'check'),
+            (4, 'email'),
+            (4, 'fix'),
+        ]
+
+    def test_bulk_load_again(self, db: database.WastedYearsDB):
+        tasks = read_test_tasks(db)
+        db.bulk_load(tasks, chunk_size=7)
+        words = self._get_words(db)
+        pairs = self._get_pairs(db)
+
+        # the same log again, with a new task at the end
+        new_task = models.Task(
+            start_ts=parse_ts('2022-07-01T09:00:00'),
+            end_ts=parse_ts('2022-07-01T09:30:00'),
+            description='look busy')
+        stats = db.bulk_load(tasks + [new_task], chunk_size=7, on_duplicate='skip')
+        assert (stats.tasks, stats.skipped, stats.updated) == (1, len(tasks), 0)
+        assert len(db.list_tasks()) == len(tasks) + 1
+        (before, after) = (
+            [(count, elapsed) for (word, count, elapsed) in rows if word == 'busy']
+            for rows in (words, self._get_words(db)))
+        assert after == [(before[0][0] + 1, before[0][1] + 30 * 60)]
+
+        # an edited log: the task at 09:15 on 2022-06-06 was really a
+        # meeting, so that task is replaced (keeping its task_id)
+        assert tasks[1].description == 'watercooler'
+        edited = dataclasses.replace(tasks[1], description='meeting')
+        stats = db.bulk_load(tasks[:3] + [edited], on_duplicate='update')
+        assert (stats.tasks, stats.skipped, stats.updated) == (1, 3, 1)
+        (_, task) = db.list_tasks()[:2]
+        assert (task.task_id, task.description) == (2, 'meeting')
+        assert db.check_words(workers=1) == []
+        assert db.check_rollups() == []
+        new_pairs = self._get_pairs(db)
+        db.rebuild_word_pairs()
+        assert self._get_pairs(db) == new_pairs != pairs
+
+        # back again
+        db.bulk_load([tasks[1]], on_duplicate='update')
+        db.delete_tasks([len(tasks) + 1])
+        # ('meeting' is gone from words, since no task has it)
+        assert self._get_words(db) == words
+        assert self._get_pairs(db) == pairs
+
+        with pytest.raises(sa.exc.IntegrityError):
+            db.bulk_load(tasks[:1])
+
+    def test_overlaps(self, db: database.WastedYearsDB):
+        for (start, end, description) in [
+                ('09:00', '10:00', 'standup'),
+                ('10:00', '11:00', 'code review'),
+                # edited by hand, and overlaps code review
+                ('10:30', '10:45', 'coffee'),
+                ('11:00', None, 'lunch')]:
+            db.add_task(models.Task(
+                start_ts=parse_ts(f'2022-07-15T{start}'),
+                end_ts=None if end is None else parse_ts(f'2022-07-15T{end}'),
+                description=description))
+
+        def at(time: str) -> list[str]:
+            tasks = db.tasks_at(parse_ts(f'2022-07-15T{time}'))
+            return [task.description for task in tasks]
+
+        assert at('08:59:59') == []
+        assert at('09:00') == ['standup']
+        assert at('10:00') == ['code review']
+        assert at('10:44:59') == ['code review', 'coffee']
+        assert at('10:45') == ['code review']
+        # (unfinished tasks are still going on)
+        assert at('23:00') == ['lunch']
+        assert [task.description for task in db.tasks_overlapping(
+            parse_ts('2022-07-15T09:59:59'), parse_ts('2022-07-15T10:30'))] == [
+            'standup', 'code review', 'coffee']
+
+        assert [(first.task_id, second.task_id)
+                for (first, second) in db.find_overlaps()] == [(2, 3)]
+        assert db.find_overlaps(since=parse_ts('2022-07-15T10:01')) == []
+        db.end_last_task(datetime.datetime(2022, 7, 15, 12, 0))
+        db.conn.execute(
+            "update tasks set start_ts = '2022-07-15 10:50:00.000000'"
+            " where task_id = 4")
+        assert [(first.task_id, second.task_id)
+                for (first, second) in db.find_overlaps()] == [(2, 3), (2, 4)]
+        assert at('11:30') == ['lunch']
+
+        # lookups are range searches of tasks_rtree, not scans of tasks
+        plan = db.conn.execute(
+            'explain query plan select task_id from tasks_rtree'
+            ' where start_s <= 1 and end_s >= 1').fetchall()
+        assert 'VIRTUAL TABLE INDEX 2:' in plan[0][-1]
+
+    def test_focus_report(self, db: database.WastedYearsDB):
+        for (start, end, description) in [
+                ('2022-07-14T09:00:00', '2022-07-14T09:30:00', 'check email'),
+                # 10 s to record the next task
+                ('2022-07-14T09:30:10', '2022-07-14T10:00:00', 'check email'),
+                ('2022-07-14T10:00:05', '2022-07-14T11:00:00', 'fix bug'),
+                # an hour's break that was not recorded ends the streak
+                ('2022-07-14T12:00:00', '2022-07-14T12:30:00', 'fix bug'),
+                ('2022-07-15T09:00:00', '2022-07-15T09:10:00', 'check email'),
+                ('2022-07-15T09:10:00', '2022-07-15T09:20:00', 'coffee'),
+                # Monday
+                ('2022-07-18T09:00:00', '2022-07-18T09:10:00', 'coffee')]:
+            db.add_task(models.Task(
+                start_ts=parse_ts(start), end_ts=parse_ts(end), description=description))
+        db.add_task(models.Task(start_ts=parse_ts('2022-07-18T09:10:00'),
+                                description='unfinished'))
+
+        assert list(db.iter_focus_report('day')) == [
+            models.FocusInfo(datetime.date(2022, 7, 14), tasks=4, switches=1,
+                             longest_streak=3595, gap_count=2, gap_total=15,
+                             longest_gap=10, untracked=3600),
+            models.FocusInfo(datetime.date(2022, 7, 15), tasks=2, switches=1,
+                             longest_streak=600),
+            models.FocusInfo(datetime.date(2022, 7, 18), tasks=1, longest_streak=600),
+        ]
+        (week, next_week) = db.iter_focus_report('week', max_gap=3600)
+        assert week == models.FocusInfo(
+            datetime.date(2022, 7, 11), tasks=6, switches=2,
+            longest_streak=3595 + 1800, gap_count=3, gap_total=3615, longest_gap=3600)
+        assert next_week.bucket == datetime.date(2022, 7, 18)
+        (day,) = db.iter_focus_report(
+            'month', since=datetime.datetime(2022, 7, 15),
+            until=datetime.datetime(2022, 7, 16))
+        assert (day.bucket, day.tasks, day.switches) == (datetime.date(2022, 7, 1), 2, 1)
+
+    def test_bulk_load_update_long(self, db: database.WastedYearsDB):
+        # updating a task takes out what adding it put in, even for a
+        # task of more than a day
+        task = models.Task(
+            start_ts=parse_ts('2022-07-15T09:00:00.900000'),
+            end_ts=parse_ts('2022-07-17T10:00:00.100000'),
+            description='long haul')
+        db.bulk_load([task])
+        words = self._get_words(db)
+        assert words[0] == ('haul', 1, 2 * 86400 + 3600)
+
+        stats = db.bulk_load([task], on_duplicate='update')
+        assert (stats.tasks, stats.skipped, stats.updated) == (0, 1, 0)
+        assert self._get_words(db) == words
+
+        edited = dataclasses.replace(task, description='long haul home')
+        stats = db.bulk_load([edited], on_duplicate='update')
+        assert (stats.tasks, stats.skipped, stats.updated) == (1, 0, 1)
+        assert db.check_words(workers=1) == []
+        assert db.check_rollups() == []
+        db.bulk_load([task], on_duplicate='update')
+        assert self._get_words(db) == words
+        assert db.check_rollups() == []
+
+    def test_bulk_load_update_words(self, db: database.WastedYearsDB):
+        # a word that an update takes the last task from is deleted, and
+        # comes back when a task has it again
+        task = models.Task(
+            start_ts=parse_ts('2022-07-15T09:00:00'),
+            end_ts=parse_ts('2022-07-15T10:00:00'),
+            description='daydreaming')
+        db.bulk_load([task])
+        edited = dataclasses.replace(task, description='working')
+        db.bulk_load([edited], on_duplicate='update')
+        assert self._get_words(db) == [('working', 1, 3600)]
+        assert db.check_words(workers=1) == []
+
+        # the replacement has the words of the task it replaces
+        longer = dataclasses.replace(edited, end_ts=parse_ts('2022-07-15T10:30:00'))
+        stats = db.bulk_load([longer], on_duplicate='update')
+        assert (stats.tasks, stats.updated) == (1, 1)
+        assert self._get_words(db) == [('working', 1, 5400)]
+
+        # and so does a later task with the description of a deleted one
+        db.add_task(models.Task(
+            start_ts=parse_ts('2022-07-15T11:00:00'),
+            end_ts=parse_ts('2022-07-15T11:30:00'),
+            description='daydreaming'))
+        assert self._get_words(db) == [('daydreaming', 1, 1800), ('working', 1, 5400)]
+        assert db.check_words(workers=1) == []
+        assert db.check_rollups() == []
+        assert db.get_related_words('working') == []
+
+    def test_rebuild_words(self, db: database.WastedYearsDB):
+        db.bulk_load(read_test_tasks(db), chunk_size=7)
+        words = self._get_words(db)
+        task_words = self._get_task_words(db)
+        pairs = self._get_pairs(db)
+        word_ids = db.conn.execute('select * from descriptions').fetchall()
+        assert db.check_words(chunk_size=5, workers=1) == []
+
+        # mess up the derived tables
+        db.conn.execute(
+            "update words set total_count = 99 where word = 'coffee'")
+        db.conn.execute(
+            "insert into words (word, total_count, total_elapsed)"
+            " values ('bogus', 1, 1)")
+        db.conn.execute('delete from word_pairs where total_count = 1')
+        db.conn.execute('update descriptions set word_ids = null')
+        problems = db.check_words(chunk_size=5, workers=1)
+        assert problems == [
+            'bogus: words has 1 tasks, 1 s; tasks have 0 tasks, 0 s',
+            'coffee: words has 99 tasks, 4560 s; tasks have 1 tasks, 4560 s',
+        ]
+
+        # in worker processes, small chunks
+        db.rebuild_words(chunk_size=2, workers=2)
+        assert self._get_words(db) == words
+        assert self._get_task_words(db) == task_words
+        assert self._get_pairs(db) == pairs
+        assert db.conn.execute('select * from descriptions').fetchall() == word_ids
+        assert db.check_words(workers=2) == []
+        assert db.check_rollups() == []
+
+    def _get_words(self, db: database.WastedYearsDB) -> list[tuple[str, int, int]]:
         tbl = db.tbl_words
         rows = db.conn.execute(
             sa.select([tbl.c.word, tbl.c.total_count, tbl.c.total_elapsed])
@@ -178,6 +734,14 @@ class TestWastedYearsDB:
         ).fetchall()
         return rows
 
+    def _get_pairs(self, db: database.WastedYearsDB) -> list[tuple[str, str, int, int]]:
+        return db.conn.execute(
+            'select a.word, b.word, p.total_count, p.total_elapsed'
+            ' from word_pairs p'
+            ' join words a on a.word_id = p.word_id_a'
+            ' join words b on b.word_id = p.word_id_b'
+            ' order by a.word, b.word').fetchall()
+
     def _get_task_words(self, db: database.WastedYearsDB) -> list[tuple[int, str]]:
         tbl_tw = db.tbl_task_words
         tbl_w = db.tbl_words
@@ -187,6 +751,147 @@ class TestWastedYearsDB:
         return db.conn.execute(join).fetchall()
 
 
+def test_migrate(tmp_path):
+    engine = database.create_engine(f'sqlite:///{tmp_path}/legacy.sqlite')
+    db = database.WastedYearsDB(engine.connect())
+
+    # not initialized yet: nothing to do
+    assert db.migrate() == 0
+
+    # recreate a database from before schema versioning
+    for stmt in _legacy_schema:
+        db.conn.execute(stmt)
+    db.conn.execute(
+        "insert into tasks (update_ts, start_ts, end_ts, description) values"
+        " (datetime(), '2022-07-15 11:00:00.000000', '2022-07-15 11:02:00.000000',"
+        "  'legacy task'),"
+        " (datetime(), '2022-07-15 11:02:00.000000', null, 'unfinished task'),"
+        " (datetime(), '2022-07-15 11:00:00.000000', '2022-07-15 11:02:00.000000',"
+        "  'legacy task')")
+    # (task 3 is task 1 ingested again, and no task has 'gone' any more)
+    db.conn.execute(
+        "insert into words (word, total_count, total_elapsed)"
+        " values ('legacy', 2, 240), ('task', 2, 240), ('gone', 0, 0)")
+    db.conn.execute(
+        'insert into task_words (task_id, word_id) values (1, 1), (1, 2), (3, 1), (3, 2)')
+
+    version = len(migrations.MIGRATIONS)
+    assert db.migrate() == version
+    assert db.conn.execute('select version from schema_version').fetchall() == [
+        (version,)]
+    assert db.check_rollups() == []
+    assert db.check_words(workers=1) == []
+    assert [(info.word, info.total_count, info.total_elapsed)
+            for info in db.list_words('w')] == [('legacy', 1, 120), ('task', 1, 120)]
+    indexes = {row.name for row in db.conn.execute(
+        "select name from sqlite_master where type = 'index'")}
+    assert {'ix_tasks_start_ts', 'ix_task_words_word_id',
+            'ux_tasks_natural_key'} <= indexes
+
+    # descriptions have been split out of tasks
+    assert [(task.task_id, task.description) for task in db.list_tasks()] == [
+        (1, 'legacy task'),
+        (2, 'unfinished task'),
+    ]
+    assert db.conn.execute(
+        'select description_id, description, word_ids from descriptions'
+    ).fetchall() == [
+        (1, 'legacy task', '1 2'),
+        (2, 'unfinished task', None),
+    ]
+    assert [task.task_id for task in db.search_tasks('task')] == [1, 2]
+    assert [task.task_id for task in db.tasks_at(parse_ts('2022-07-15T11:01'))] == [1]
+    assert [task.task_id for task in db.tasks_at(parse_ts('2022-07-16T11:01'))] == [2]
+    # reports cached from now on are keyed by these
+    assert list(db.get_bucket_versions('week')) == [datetime.date(2022, 7, 11)]
+    assert _not_null(db, 'tasks', 'description_id')
+
+    assert db.migrate() == 0
+    # (foreign keys are checked on commit)
+    db.commit()
+    db.close()
+
+
+def test_migrate_description_id(tmp_path):
+    filename = f'{tmp_path}/test.sqlite'
+    engine = database.create_engine(f'sqlite:///{filename}')
+    with database.WastedYearsDB(engine.connect()) as db:
+        db.init_schema()
+        db.add_task(models.Task(
+            start_ts=parse_ts('2022-07-15T09:00'), end_ts=parse_ts('2022-07-15T10:00'),
+            description='check email'))
+        db.add_task(models.Task(
+            start_ts=parse_ts('2022-07-15T10:00'), description='coffee'))
+
+    # as created before description_id was NOT NULL
+    conn = sqlite3.connect(filename)
+    conn.execute('pragma writable_schema = on')
+    conn.execute(
+        "update sqlite_master set sql = replace(sql, 'description_id INTEGER NOT NULL',"
+        " 'description_id INTEGER') where name = 'tasks'")
+    conn.execute(
+        'update schema_version set version = ?', (len(migrations.MIGRATIONS) - 1,))
+    conn.commit()
+    conn.close()
+    engine.dispose()
+
+    engine = database.create_engine(f'sqlite:///{filename}')
+    with database.WastedYearsDB(engine.connect()) as db:
+        assert not _not_null(db, 'tasks', 'description_id')
+        assert db.migrate() == 1
+        assert _not_null(db, 'tasks', 'description_id')
+        db.commit()
+        db.begin()
+
+        # the indexes and triggers on tasks are back
+        assert db.check_words(workers=1) == []
+        assert [task.description for task in db.list_tasks()] == ['check email', 'coffee']
+        assert [task.task_id for task in db.tasks_at(parse_ts('2022-07-15T11:00'))] == [2]
+        with pytest.raises(sa.exc.IntegrityError):
+            db.bulk_load([db.list_tasks()[0]])
+        db.rollback()
+        db.begin()
+        db.end_last_task(datetime.datetime(2022, 7, 15, 10, 30))
+        assert db.tasks_at(parse_ts('2022-07-15T11:00')) == []
+
+
+def _not_null(db: database.WastedYearsDB, table: str, column: str) -> bool:
+    rows = db.conn.execute(f'pragma table_info({table})').fetchall()
+    (notnull,) = [row[3] for row in rows if row[1] == column]
+    return bool(notnull)
+
+
+# the schema created by the first version of wastedyears
+_legacy_schema = [
+    '''create table tasks (
+        task_id integer not null,
+        update_ts datetime not null,
+        start_ts datetime not null,
+        end_ts datetime,
+        description text not null,
+        primary key (task_id))''',
+    '''create table words (
+        word_id integer not null,
+        word varchar not null,
+        total_count integer not null,
+        total_elapsed integer,
+        primary key (word_id),
+        unique (word))''',
+    '''create table task_words (
+        task_id integer,
+        word_id integer,
+        foreign key(task_id) references tasks (task_id),
+        foreign key(word_id) references words (word_id),
+        unique (task_id, word_id))''',
+]
+
+
+def read_test_tasks(db: database.WastedYearsDB) -> list[models.Task]:
+    filename = os.path.join(os.path.dirname(__file__), 'tasks.txt')
+    with open(filename) as infile:
+        return list(ingest.ingest(db, infile))
+
+
 def parse_ts(ts: str) -> datetime.datetime:
     dt = datetime.datetime.fromisoformat(ts)
     return dt.replace(tzinfo=datetime.timezone.utc)
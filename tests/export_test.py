@@ -0,0 +1,100 @@
+import datetime
+
+import pytest
+
+from wastedyears import config, database, export, models
+
+
+def _open(cfg: config.Config, name: str) -> database.WastedYearsDB:
+    cfg = config.Config(data_dir=cfg.data_dir, db_url=f'sqlite:///{cfg.data_dir}/{name}')
+    db = database.open_db(cfg)
+    db.init_schema()
+    return db
+
+
+def _dump(db: database.WastedYearsDB) -> dict[str, list]:
+    queries = {
+        'words': 'select word, total_count, total_elapsed from words order by word',
+        'task_words': 'select task_id, word from task_words join words using (word_id)'
+                      ' order by task_id, word',
+        'word_daily': 'select day, word, d.total_count, d.total_elapsed'
+                      ' from word_daily d join words using (word_id) order by day, word',
+    }
+    dump = {name: db.conn.execute(sql).fetchall() for (name, sql) in queries.items()}
+    dump['tasks'] = db.list_tasks()
+    return dump
+
+
+@pytest.mark.parametrize('fmt', export.FORMATS)
+def test_round_trip(cfg: config.Config, tmp_path, fmt: str):
+    pytest.importorskip('numpy' if fmt == 'npz' else 'pyarrow')
+
+    day = datetime.datetime(2022, 7, 15, 9, 0, 0)
+    with _open(cfg, 'source.sqlite') as db:
+        for (minutes, description) in [(0, 'check email'),
+                                       (5, 'coffee'),
+                                       (7, 'fix bug #321, check wiki'),
+                                       (60, 'check email'),
+                                       (65, 'tea? ünïcode')]:
+            ts = day + datetime.timedelta(minutes=minutes)
+            db.end_last_task(ts)
+            db.add_task(models.Task(start_ts=ts, description=description))
+        # a gap in the task IDs
+        db.conn.execute('delete from task_words where task_id = 2')
+        db.conn.execute('delete from tasks where task_id = 2')
+        db.rebuild_words(workers=1)
+        expect = _dump(db)
+
+        counts = export.export_db(db, str(tmp_path / 'out'), fmt, chunk_size=2)
+        assert counts == {'tasks': 4, 'descriptions': 4, 'words': 6, 'task_words': 9}
+
+    with _open(cfg, 'dest.sqlite') as db:
+        stats = export.import_db(db, str(tmp_path / 'out'), fmt, chunk_size=3)
+        assert stats.tasks == 4
+        assert _dump(db) == expect
+        assert db.check_words(workers=1) == []
+        assert db.check_rollups() == []
+
+        # only into an empty database
+        with pytest.raises(RuntimeError):
+            export.import_db(db, str(tmp_path / 'out'), fmt)
+
+
+@pytest.mark.parametrize('fmt', export.FORMATS)
+def test_round_trip_fractions(cfg: config.Config, tmp_path, fmt: str):
+    pytest.importorskip('numpy' if fmt == 'npz' else 'pyarrow')
+
+    with _open(cfg, 'source.sqlite') as db:
+        db.add_task(models.Task(
+            start_ts=datetime.datetime(1969, 12, 31, 23, 59, 59, 900000),
+            end_ts=datetime.datetime(1970, 1, 1, 0, 0, 0, 100000),
+            description='new year'))
+        db.add_task(models.Task(
+            start_ts=datetime.datetime(2022, 7, 15, 9, 0, 0, 900000),
+            end_ts=datetime.datetime(2022, 7, 15, 9, 5, 0, 5),
+            description='check email'))
+        expect = _dump(db)
+        export.export_db(db, str(tmp_path / 'out'), fmt)
+
+    with _open(cfg, 'dest.sqlite') as db:
+        export.import_db(db, str(tmp_path / 'out'), fmt)
+        assert _dump(db) == expect
+        assert [task.start_ts.microsecond for task in db.list_tasks()] == [900000] * 2
+
+
+def test_zero_copy(cfg: config.Config, tmp_path):
+    pa = pytest.importorskip('pyarrow')
+
+    with _open(cfg, 'source.sqlite') as db:
+        db.add_task(models.Task(
+            start_ts=datetime.datetime(2022, 7, 15, 9, 0, 0),
+            end_ts=datetime.datetime(2022, 7, 15, 9, 5, 0),
+            description='check email'))
+        export.export_db(db, str(tmp_path), 'arrow')
+
+    with pa.memory_map(str(tmp_path / 'tasks.arrow')) as source:
+        tasks = pa.ipc.open_file(source).read_all()
+    start_ts = tasks.column('start_ts').chunk(0).to_numpy(zero_copy_only=True)
+    assert start_ts.tolist() == [
+        int(datetime.datetime(2022, 7, 15, 9, 0, 0, tzinfo=datetime.timezone.utc)
+            .timestamp()) * 1000000]
@@ -0,0 +1,145 @@
+import datetime
+import json
+import os
+import pathlib
+
+import pytest
+from click.testing import CliRunner
+
+from wastedyears import cli, config, database, ingest, models, partitions
+
+
+@pytest.fixture
+def cfg(config_home: pathlib.Path) -> config.Config:
+    (config_home / 'wastedyears.cfg').write_text('[core]\nlayout = yearly\n')
+    return config.get_config()
+
+
+_utc = datetime.timezone.utc
+
+
+def test_partitions(cfg: config.Config, make_task):
+    # twelve years, more than can be attached at once
+    with partitions.PartitionedDB(cfg) as db:
+        db.bulk_load(
+            make_task(datetime.datetime(year, month, 1, 9, tzinfo=_utc),
+                      f'task {year % 3}', minutes=30)
+            for year in range(2000, 2012) for month in (1, 6))
+        # the last task is unfinished, and spans new year
+        task_id = db.add_task(models.Task(
+            start_ts=datetime.datetime(2011, 12, 31, 23, 0),
+            description='new year'))
+        assert task_id == 25
+
+    with partitions.PartitionedDB(cfg) as db:
+        db.end_last_task(datetime.datetime(2012, 1, 1, 1, 0))
+        db.add_task(make_task(
+            datetime.datetime(2012, 1, 1, 9, tzinfo=_utc), 'task 0', minutes=30))
+
+    assert sorted(os.listdir(cfg.data_dir)) == sorted(
+        ['catalog.sqlite'] +
+        [f'wastedyears-{year}.sqlite' for year in range(2000, 2013)])
+
+    with partitions.PartitionedDB(cfg) as db:
+        tasks = db.list_tasks()
+        assert [task.task_id for task in tasks] == list(range(1, 27))
+        assert tasks[-2].description == 'new year'
+        assert tasks[-2].end_ts == datetime.datetime(
+            2012, 1, 1, 1, 0, tzinfo=datetime.timezone.utc)
+
+        # only the partitions in range are read
+        since = datetime.datetime(2005, 3, 1)
+        until = datetime.datetime(2007, 1, 1)
+        assert [part.year for part in db.partitions(since, until)] == [2005, 2006]
+        assert [task.task_id for task in db.iter_tasks(since, until)] == [12, 13, 14]
+        assert [task.task_id for task in db.iter_tasks(since, limit=2)] == [12, 13]
+        assert db.get_task_dates(since, until) == [
+            datetime.date(2005, 6, 1), datetime.date(2006, 1, 1),
+            datetime.date(2006, 6, 1)]
+
+        # recent tasks come from the newest partitions only
+        statements: list[str] = []
+        db.conn.set_trace_callback(statements.append)
+        recent = db.get_recent_tasks(datetime.datetime(2000, 1, 1), limit=3)
+        db.conn.set_trace_callback(None)
+        assert [task.task_id for task in recent] == [26, 25, 24]
+        assert any('p2012' in stmt for stmt in statements)
+        assert not any('p2000' in stmt for stmt in statements)
+        recent = db.get_recent_tasks(datetime.datetime(2011, 3, 1))
+        assert [task.task_id for task in recent] == [26, 25, 24]
+
+        report = db.get_word_report(datetime.date(2000, 1, 1), datetime.date(2013, 1, 1))
+        assert report['task'].total_count == 25
+        assert report['task'].total_elapsed == 25 * 30 * 60
+        assert report['new'].total_elapsed == 2 * 3600
+        report = db.get_word_report(datetime.date(2005, 1, 1), datetime.date(2006, 1, 1))
+        assert {word: info.total_count for (word, info) in report.items()} == {
+            'task': 2, '1': 2}
+
+        (before, after) = db.freeze(2001)
+        assert after <= before
+        with pytest.raises(RuntimeError, match='read-only'):
+            db.add_task(make_task(
+                datetime.datetime(2001, 3, 1, 9, tzinfo=_utc), 'too late'))
+        with pytest.raises(RuntimeError, match='past years'):
+            db.freeze(datetime.datetime.now().year + 1)
+
+    with partitions.PartitionedDB(cfg) as db:
+        assert [part.read_only for part in db.partitions()][:3] == [False, True, False]
+        assert [task.description for task in db.iter_tasks(
+            datetime.datetime(2001, 1, 1), datetime.datetime(2002, 1, 1))] == [
+            'task 0', 'task 0']
+
+
+def test_cli(cfg: config.Config):
+    runner = CliRunner()
+    result = runner.invoke(cli.main, ['task', 'hello', 'world'])
+    assert result.exit_code == 0, result.output
+    assert runner.invoke(cli.main, ['done']).exit_code == 0
+
+    result = runner.invoke(cli.main, ['ls-tasks'])
+    assert result.exit_code == 0, result.output
+    assert result.output.endswith(': hello world\n')
+    result = runner.invoke(cli.main, ['ls-tasks', '--ndjson'])
+    assert result.exit_code == 0, result.output
+    record = json.loads(result.output)
+    assert record['description'] == 'hello world'
+    assert record['start_ts'] <= record['end_ts']
+    assert record['end_ts'].endswith('Z')
+
+    result = runner.invoke(cli.main, ['partitions'])
+    assert result.exit_code == 0, result.output
+    year = datetime.datetime.now(datetime.timezone.utc).year
+    assert result.output.startswith(f'{year}         1 tasks')
+
+    # other commands do not support this layout yet
+    result = runner.invoke(cli.main, ['ls-words'])
+    assert result.exit_code == 1
+    assert 'layout=yearly' in result.output
+
+
+def test_ingest(cfg: config.Config, tmp_path):
+    filename = os.path.join(os.path.dirname(__file__), 'tasks.txt')
+    runner = CliRunner()
+    result = runner.invoke(cli.main, ['ingest', filename])
+    assert result.exit_code == 0, result.output
+    with partitions.PartitionedDB(cfg) as db:
+        tasks = db.list_tasks()
+
+    # ingesting again skips the tasks that are already there
+    result = runner.invoke(cli.main, ['ingest', filename])
+    assert result.exit_code == 0, result.output
+    assert f'; {len(tasks)} skipped, 0 updated' in result.output
+    with partitions.PartitionedDB(cfg) as db:
+        assert db.list_tasks() == tasks
+
+    # rank-words adds up the partitions, like list_words() does for one file
+    engine = database.create_engine(f'sqlite:///{tmp_path}/single.sqlite')
+    with database.WastedYearsDB(engine.connect()) as single:
+        single.init_schema()
+        with open(filename) as infile:
+            single.bulk_load(ingest.ingest(single, infile))
+        expect = [str(info) for info in single.list_words(order_by='ecw')]
+    result = runner.invoke(cli.main, ['rank-words'])
+    assert result.exit_code == 0, result.output
+    assert result.output.splitlines() == expect
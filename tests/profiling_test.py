@@ -0,0 +1,44 @@
+import json
+
+from click.testing import CliRunner
+
+from wastedyears import cli, config, profiling
+
+
+def test_profile(cfg: config.Config, tmp_path, monkeypatch):
+    runner = CliRunner()
+
+    path = tmp_path / 'profile.json'
+    result = runner.invoke(cli.main, [
+        '--profile-format', 'json', '--profile-output', str(path),
+        'task', 'hello', 'world'])
+    assert result.exit_code == 0, result.output
+    assert profiling._profiler is None
+
+    profile = json.loads(path.read_text())
+    names = [phase['name'] for phase in profile['phases']]
+    assert names[:2] == ['import', 'command']
+    assert {'config', 'open db'} <= set(names)
+    assert profile['total_ms'] >= sum(
+        phase['duration_ms'] for phase in profile['phases']
+        if phase['name'] in ('import', 'command')) - 0.01
+    statements = {stmt['sql']: stmt for stmt in profile['statements']}
+    assert any(sql.startswith('INSERT INTO tasks') for sql in statements)
+    assert all(stmt['count'] >= 1 for stmt in statements.values())
+
+    # WY_TRACE picks the format, WY_TRACE_FILE the output
+    monkeypatch.setenv('WY_TRACE', 'chrome')
+    monkeypatch.setenv('WY_TRACE_FILE', str(path))
+    result = runner.invoke(cli.main, ['ls-tasks'])
+    assert result.exit_code == 0, result.output
+    assert result.output.endswith('hello world\n')
+    events = json.loads(path.read_text())['traceEvents']
+    assert {event['cat'] for event in events} == {'phase', 'sql'}
+    assert all(event['ph'] == 'X' and event['dur'] >= 0 for event in events)
+
+    monkeypatch.setenv('WY_TRACE', '1')
+    result = runner.invoke(cli.main, ['ls-words'])
+    assert result.exit_code == 0, result.output
+    report = path.read_text()
+    assert report.startswith('wy profile: ')
+    assert 'statements)' in report
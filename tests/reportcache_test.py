@@ -0,0 +1,102 @@
+import dataclasses
+import datetime
+
+import pytest
+
+from wastedyears import database, models, reportcache
+
+
+@pytest.fixture
+def db(tmp_path):
+    engine = database.create_engine(f'sqlite:///{tmp_path}/test.sqlite')
+    with database.WastedYearsDB(engine.connect()) as db:
+        db.init_schema()
+        yield db
+
+
+def _day(day: int) -> datetime.datetime:
+    # three weeks, starting on Monday 2022-08-01
+    return datetime.datetime(2022, 8, day, 9, 0)
+
+
+def _counts(cache: reportcache.ReportCache) -> tuple[int, int]:
+    return (cache.stats.hits, cache.stats.misses)
+
+
+def test_report_cache(db: database.WastedYearsDB, make_task):
+    db.bulk_load([make_task(_day(1), 'plan week'), make_task(_day(3), 'write code'),
+                  make_task(_day(9), 'write tests'),
+                  make_task(_day(17), 'write code', minutes=120)])
+    cache = reportcache.ReportCache(db)
+
+    expected = list(db.iter_word_report('week'))
+    assert [start for (start, _) in expected] == [
+        datetime.date(2022, 8, day) for day in (1, 8, 15)]
+    assert list(cache.iter_word_report('week')) == expected
+    assert _counts(cache) == (0, 3)
+    assert list(cache.iter_word_report('week')) == expected
+    assert _counts(cache) == (3, 3)
+
+    # an unfinished task has no words yet, so changes no bucket; ending
+    # it changes only its own week
+    db.add_task(models.Task(
+        start_ts=datetime.datetime(2022, 8, 18, 9, 0), description='write docs'))
+    assert list(cache.iter_word_report('week')) == expected
+    assert _counts(cache) == (6, 3)
+    db.end_last_task(datetime.datetime(2022, 8, 18, 10, 0))
+    expected = list(db.iter_word_report('week'))
+    assert list(cache.iter_word_report('week')) == expected
+    assert _counts(cache) == (8, 4)
+
+    # so does deleting a task, even the last one of a week
+    (task,) = db.search_tasks('tests')
+    assert task.task_id is not None
+    db.delete_tasks([task.task_id])
+    expected = list(db.iter_word_report('week'))
+    assert len(expected) == 2
+    assert list(cache.iter_word_report('week')) == expected
+    assert _counts(cache) == (10, 5)
+
+    # buckets cut short by since or until are computed, not cached
+    since = datetime.datetime(2022, 8, 3, tzinfo=datetime.timezone.utc)
+    until = datetime.datetime(2022, 8, 18)
+    expected = list(db.iter_word_report('week', since, until))
+    assert [(start.day, [info.word for info in words])
+            for (start, words) in expected] == [
+        (1, ['code', 'write']), (15, ['code', 'write'])]
+    assert list(cache.iter_word_report('week', since, until)) == expected
+    assert list(cache.iter_word_report('week', since, until)) == expected
+    # (the empty week in between is a hit)
+    assert _counts(cache) == (12, 9)
+
+    # other bucket sizes are cached separately
+    expected = list(db.iter_word_report('day'))
+    assert list(cache.iter_word_report('day')) == expected
+    assert _counts(cache) == (12, 14)
+    assert cache.stats.evictions == 0
+    assert list(reportcache.ReportCache(db).iter_word_report('month')) == list(
+        db.iter_word_report('month'))
+
+
+def test_eviction(db: database.WastedYearsDB, make_task):
+    db.bulk_load(make_task(_day(day), f'task {day}') for day in range(1, 15))
+    cache = reportcache.ReportCache(db)
+    list(cache.iter_word_report('day'))
+    list(cache.iter_word_report('week'))
+    size = cache.stats.size
+    assert cache.stats.evictions == 0
+
+    # the day buckets were used longest ago, and go first
+    small = reportcache.ReportCache(db, max_size=size // 2)
+    expected = list(db.iter_word_report('week'))
+    assert list(small.iter_word_report('week')) == expected
+    assert small.stats.hits == 2
+    assert 0 < small.stats.evictions <= 14
+    assert small.stats.size <= size // 2
+    assert list(small.iter_word_report('week')) == expected
+    assert small.stats.hits == 4
+
+    # max_size 0 turns the cache off
+    off = reportcache.ReportCache(db, max_size=0)
+    assert list(off.iter_word_report('week')) == expected
+    assert dataclasses.astuple(off.stats) == (0, 0, 0, 0)
@@ -0,0 +1,108 @@
+import io
+import threading
+from typing import Optional
+
+import pytest
+
+from wastedyears import client, config, database, server
+
+
+@pytest.fixture
+def daemon(cfg: config.Config):
+    # the connection must be opened in the thread that uses it
+    started = threading.Event()
+    servers = []
+
+    def run():
+        with database.open_db(cfg) as db:
+            with server.Server(cfg, db) as srv:
+                servers.append(srv)
+                started.set()
+                srv.serve_forever()
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    started.wait()
+    yield servers[0]
+    servers[0].shutdown()
+    thread.join()
+
+
+def _send(path: str, request: list[str]) -> tuple[Optional[str], list[str]]:
+    lines: list[str] = []
+    status = client.send(path, request, lines.append)
+    return (status, lines)
+
+
+def test_no_daemon(cfg: config.Config):
+    assert _send(cfg.socket_path, ['done']) == (None, [])
+    assert not client.forward(['done'])
+
+
+def test_requests(cfg: config.Config, daemon, capsys):
+    path = cfg.socket_path
+    assert _send(path, ['task', 'check', 'email']) == ('ok', [])
+    assert _send(path, ['task', 'coffee']) == ('ok', [])
+    assert _send(path, ['done']) == ('ok', [])
+
+    (status, lines) = _send(path, ['ls-tasks'])
+    assert status == 'ok'
+    assert [line.split(': ', 2)[2] for line in lines] == ['check email', 'coffee']
+
+    # committed, so visible to other connections
+    with database.open_db(cfg) as db:
+        assert [task.description for task in db.list_tasks()] == [
+            'check email', 'coffee']
+
+    (status, lines) = _send(path, ['daily'])
+    assert status == 'ok'
+    assert sorted(line.split()[-1] for line in lines[1:-1]) == [
+        'check', 'coffee', 'email']
+
+    assert _send(path, ['bogus']) == ('error invalid request: ["bogus"]', [])
+
+    # the CLI forwards what the daemon understands
+    assert client.forward(['ls'])
+    assert capsys.readouterr().out.count('\n') == 2
+    assert not client.forward(['t'])
+    assert not client.forward(['ls-words'])
+    assert not client.forward(['done', '--help'])
+
+
+def test_request_whitespace(cfg: config.Config, daemon):
+    # arguments arrive as they would be when running wy task directly
+    words = ['two  spaces', 'a\ttab', 'a\nnewline']
+    assert _send(cfg.socket_path, ['task'] + words) == ('ok', [])
+    assert _send(cfg.socket_path, ['done']) == ('ok', [])
+    with database.open_db(cfg) as db:
+        assert [task.description for task in db.list_tasks()] == [' '.join(words)]
+
+
+def test_streaming(cfg: config.Config, daemon, monkeypatch):
+    # output reaches the client while the command is still running, and
+    # only the last line is the status
+    printed = threading.Event()
+    big = 'x' * io.DEFAULT_BUFFER_SIZE
+
+    def run(db, request, cache_size):
+        yield f'first {big}'
+        yield 'ok'
+        yield f'second {big}'
+        assert printed.wait(5)
+        yield 'last'
+
+    monkeypatch.setattr(server, 'run', run)
+    lines: list[str] = []
+
+    def output(line: str):
+        lines.append(line)
+        printed.set()
+
+    assert client.send(cfg.socket_path, ['ls-tasks'], output) == 'ok'
+    assert [line.split()[0] for line in lines] == ['first', 'ok', 'second', 'last']
+
+
+def test_one_daemon(cfg: config.Config, daemon):
+    with database.open_db(cfg) as db:
+        with pytest.raises(RuntimeError):
+            server.Server(cfg, db)
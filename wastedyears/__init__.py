@@ -0,0 +1,4 @@
+import time
+
+# when wastedyears was first imported: wy --profile counts startup from here
+import_started = time.perf_counter()
@@ -0,0 +1,113 @@
+'''asyncio interface to the wastedyears database, for GUIs and other
+programs built around an event loop
+
+SQLite calls block, so AsyncWastedYearsDB runs them in worker threads:
+one thread owns a connection for writing, so writes are serialized and
+each one is committed as soon as it is done; another owns a second
+connection for reading, so that reports and task listings carry on
+while a write is in progress.
+'''
+
+from __future__ import annotations
+import asyncio
+import concurrent.futures
+import datetime
+from typing import AsyncIterator, Callable, Optional, TypeVar
+
+from . import config, database, models
+
+T = TypeVar('T')
+
+
+class AsyncWastedYearsDB:
+    '''Open with "async with await AsyncWastedYearsDB.open(cfg) as db".'''
+
+    def __init__(self, cfg: config.Config):
+        self.cfg = cfg
+        # a SQLite connection must stay in the thread that opened it
+        self._writer = concurrent.futures.ThreadPoolExecutor(
+            1, thread_name_prefix='wastedyears-writer')
+        self._reader = concurrent.futures.ThreadPoolExecutor(
+            1, thread_name_prefix='wastedyears-reader')
+        self._write_db: Optional[database.WastedYearsDB] = None
+        self._read_db: Optional[database.WastedYearsDB] = None
+
+    @classmethod
+    async def open(cls, cfg: config.Config) -> AsyncWastedYearsDB:
+        db = cls(cfg)
+        # open the writer first: it applies any pending migrations
+        db._write_db = await db._run(db._writer, db._open)
+        db._read_db = await db._run(db._reader, db._open)
+        return db
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, type_, value, traceback):
+        await self.close()
+
+    async def close(self):
+        for (executor, db) in [(self._writer, self._write_db),
+                               (self._reader, self._read_db)]:
+            if db is not None:
+                await self._run(executor, db.close)
+            executor.shutdown()
+        self._write_db = self._read_db = None
+
+    async def write(self, func: Callable[[database.WastedYearsDB], T]) -> T:
+        '''Run func(db) in the writer thread, and commit. Writes run one
+        at a time, in the order they were made.'''
+        return await self._run(self._writer, self._write, func)
+
+    async def read(self, func: Callable[[database.WastedYearsDB], T]) -> T:
+        '''Run func(db) in the reader thread. It sees only committed
+        writes.'''
+        assert self._read_db is not None
+        return await self._run(self._reader, func, self._read_db)
+
+    async def add_task(self, task: models.Task) -> int:
+        return await self.write(lambda db: db.add_task(task))
+
+    async def end_last_task(self, end_ts: datetime.datetime):
+        await self.write(lambda db: db.end_last_task(end_ts))
+
+    async def list_tasks(self, page_size: int = 500) -> AsyncIterator[models.Task]:
+        '''yield all tasks, fetching page_size tasks at a time'''
+        after = None
+        while True:
+            page = await self.read(
+                lambda db: db.list_tasks(after=after, limit=page_size))
+            for task in page:
+                yield task
+            if len(page) < page_size:
+                return
+            after = page[-1].task_id
+
+    async def get_word_report(
+            self,
+            start_ts: datetime.date,
+            end_ts: datetime.date) -> dict[str, models.WordInfo]:
+        return await self.read(lambda db: db.get_word_report(start_ts, end_ts))
+
+    def _open(self) -> database.WastedYearsDB:
+        db = database.open_db(self.cfg)
+        db.commit()
+        db.begin()
+        return db
+
+    def _write(self, func: Callable[[database.WastedYearsDB], T]) -> T:
+        db = self._write_db
+        assert db is not None
+        try:
+            result = func(db)
+        except BaseException:
+            db.rollback()
+            db.begin()
+            raise
+        db.commit()
+        db.begin()
+        return result
+
+    async def _run(self, executor, func: Callable[..., T], *args) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, func, *args)
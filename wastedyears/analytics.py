@@ -0,0 +1,208 @@
+'''reports computed in memory with NumPy
+
+TaskArrays.load() reads every finished task once, into flat arrays:
+start and end times as epoch seconds, and a CSR-style index from each
+task to the words of its description. Reports are then vectorized
+group-by operations over those arrays, which is fast enough to explore
+a long history interactively.
+
+Needs numpy (pip install wastedyears[numpy]).
+'''
+
+from __future__ import annotations
+import dataclasses
+import datetime
+from typing import Optional, Union
+
+import numpy as np
+
+from . import database, models, wordsql
+
+_day = 86400
+# 1970-01-01 was a Thursday
+_epoch_weekday = 3
+
+_utc = datetime.timezone.utc
+
+
+@dataclasses.dataclass
+class TaskArrays:
+    '''Finished tasks, one array element per task, in task_id order.
+
+    The word indexes of task i are word_idx[word_ptr[i]:word_ptr[i + 1]],
+    and index into words (the word strings).
+    '''
+    task_ids: np.ndarray
+    start: np.ndarray
+    end: np.ndarray
+    word_ptr: np.ndarray
+    word_idx: np.ndarray
+    words: list[str]
+
+    @classmethod
+    def load(cls, db: database.WastedYearsDB) -> TaskArrays:
+        # Words come from descriptions.word_ids, so only distinct
+        # descriptions have to be parsed, not every row of task_words.
+        # (wy rebuild-words fills in any word_ids that are missing.)
+        # Fetch through the DB-API connection: NumPy converts plain tuples
+        # much faster than SQLAlchemy rows.
+        raw = db.conn.connection
+        tasks = np.array(raw.execute(
+            "select task_id, cast(strftime('%s', start_ts) as integer),"
+            "  cast(strftime('%s', end_ts) as integer),"
+            '  description_id'
+            ' from tasks where end_ts is not null order by task_id').fetchall(),
+            dtype=np.int64).reshape(-1, 4)
+        (ids, words) = _columns(raw.execute(
+            'select word_id, word from words order by word_id').fetchall(), 2)
+        word_ids = np.array(ids, dtype=np.int64)
+
+        desc_ids = []
+        desc_words: list[int] = []
+        desc_ptr = [0]
+        for (description_id, desc_word_ids) in raw.execute(
+                'select description_id, word_ids from descriptions'
+                ' order by description_id'):
+            desc_ids.append(description_id)
+            desc_words.extend(wordsql.parse_word_ids(desc_word_ids or ''))
+            desc_ptr.append(len(desc_words))
+
+        # expand the description -> words index into a task -> words index
+        desc_pos = np.searchsorted(np.array(desc_ids, dtype=np.int64), tasks[:, 3])
+        ptr = np.array(desc_ptr, dtype=np.int64)
+        desc_start = ptr[:-1][desc_pos]
+        counts = (ptr[1:] - ptr[:-1])[desc_pos]
+        word_ptr = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+        gather = (np.repeat(desc_start - word_ptr[:-1], counts) +
+                  np.arange(word_ptr[-1], dtype=np.int64))
+        word_idx = np.searchsorted(
+            word_ids, np.array(desc_words, dtype=np.int64)[gather])
+
+        return cls(
+            task_ids=tasks[:, 0].copy(),
+            start=tasks[:, 1].copy(),
+            end=tasks[:, 2].copy(),
+            word_ptr=word_ptr,
+            word_idx=word_idx,
+            words=list(words))
+
+    def __len__(self):
+        return len(self.task_ids)
+
+    @property
+    def elapsed(self) -> np.ndarray:
+        return self.end - self.start
+
+    def window(
+            self,
+            since: Optional[datetime.datetime] = None,
+            until: Optional[datetime.datetime] = None) -> TaskArrays:
+        '''return the tasks that started in [since, until) (naive means UTC)'''
+        mask = np.ones(len(self), dtype=bool)
+        if since is not None:
+            mask &= self.start >= _epoch(since)
+        if until is not None:
+            mask &= self.start < _epoch(until)
+        counts = np.diff(self.word_ptr)
+        return TaskArrays(
+            task_ids=self.task_ids[mask],
+            start=self.start[mask],
+            end=self.end[mask],
+            word_ptr=np.concatenate(([0], np.cumsum(counts[mask]))).astype(np.int64),
+            word_idx=self.word_idx[np.repeat(mask, counts)],
+            words=self.words)
+
+    def rank_words(self, limit: Optional[int] = None) -> list[models.WordInfo]:
+        '''words by total elapsed time, then count, most first (like
+        WastedYearsDB.list_words('ecw'))'''
+        counts = np.bincount(self.word_idx, minlength=len(self.words))
+        elapsed = np.bincount(
+            self.word_idx,
+            weights=np.repeat(self.elapsed, np.diff(self.word_ptr)),
+            minlength=len(self.words)).astype(np.int64)
+        used = np.flatnonzero(counts)
+        # lexsort sorts by the last key first
+        order = used[np.lexsort((np.array(self.words, dtype=object)[used],
+                                 -counts[used], -elapsed[used]))]
+        return [
+            models.WordInfo(
+                word=self.words[idx],
+                total_count=int(counts[idx]),
+                total_elapsed=int(elapsed[idx]))
+            for idx in order[:limit]
+        ]
+
+    def local_offsets(self) -> np.ndarray:
+        '''Return the local UTC offset in seconds at the start of each task
+        (what astimezone() gives), for offset in totals() and heatmap().
+
+        The offset only changes at DST transitions, so it is looked up
+        once per UTC day, and per task only on days when it changes.
+        '''
+        days = self.start // _day
+        (keys, inverse) = np.unique(days, return_inverse=True)
+        day_offsets = np.array(
+            [_local_offset(int(day) * _day) for day in keys], dtype=np.int64)
+        changed = day_offsets != np.array(
+            [_local_offset((int(day) + 1) * _day) for day in keys], dtype=np.int64)
+        offsets = day_offsets[inverse]
+        for idx in np.flatnonzero(changed[inverse]):
+            offsets[idx] = _local_offset(int(self.start[idx]))
+        return offsets
+
+    def totals(
+            self,
+            bucket: str,
+            offset: Union[int, np.ndarray] = 0,
+    ) -> list[tuple[datetime.date, int, int]]:
+        '''Return (bucket start date, task count, elapsed seconds) for each
+        day or week (starting Monday) with tasks.
+
+        offset is added to start times (in seconds) before bucketing,
+        e.g. local_offsets() to use local days rather than UTC days.
+        '''
+        days = (self.start + offset) // _day
+        if bucket == 'week':
+            days = days - (days + _epoch_weekday) % 7
+        elif bucket != 'day':
+            raise ValueError(f'invalid bucket: {bucket!r}')
+        (keys, inverse) = np.unique(days, return_inverse=True)
+        counts = np.bincount(inverse, minlength=len(keys))
+        elapsed = np.bincount(inverse, weights=self.elapsed, minlength=len(keys))
+        epoch = datetime.date(1970, 1, 1)
+        return [
+            (epoch + datetime.timedelta(days=int(day)), int(count), int(total))
+            for (day, count, total) in zip(keys, counts, elapsed)
+        ]
+
+    def heatmap(self, offset: Union[int, np.ndarray] = 0) -> np.ndarray:
+        '''Return a 7x24 array of elapsed seconds by weekday (Monday
+        first) and hour at which tasks started (plus offset, as in
+        totals()).'''
+        seconds = self.start + offset
+        weekday = (seconds // _day + _epoch_weekday) % 7
+        hour = seconds % _day // 3600
+        cells = np.bincount(weekday * 24 + hour, weights=self.elapsed, minlength=7 * 24)
+        return cells.astype(np.int64).reshape(7, 24)
+
+    def median_elapsed(self) -> float:
+        '''median task length in seconds (0 if there are no tasks)'''
+        return float(np.median(self.elapsed)) if len(self) else 0.0
+
+
+def _epoch(value: datetime.datetime) -> int:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=_utc)
+    return int(value.timestamp())
+
+
+def _local_offset(seconds: int) -> int:
+    '''the local UTC offset at seconds since the epoch'''
+    local = datetime.datetime.fromtimestamp(seconds, _utc).astimezone()
+    utc_offset = local.utcoffset()
+    return int(utc_offset.total_seconds()) if utc_offset else 0
+
+
+def _columns(rows: list, num_columns: int) -> list[tuple]:
+    '''transpose rows into columns (which zip(*rows) cannot do for no rows)'''
+    return list(zip(*rows)) or [()] * num_columns
@@ -0,0 +1,142 @@
+'''fast path for capturing tasks: wy task, wy done
+
+Recording a task is the one thing wastedyears does dozens of times a
+day, so it has to start fast. If "wy serve" is running, main() hands
+the command to it. Otherwise, this module talks to SQLite through the
+standard library sqlite3 module, and only imports click and SQLAlchemy
+(via cli) when it has to fall back to the full command-line interface.
+
+The SQL that maintains words and the tables derived from them is in
+wordsql, which WastedYearsDB uses too, so that both write exactly the
+same rows.
+'''
+
+import datetime
+import os
+import sqlite3
+import sys
+from typing import Optional
+
+from . import client, config, migrations, models, wordsql
+
+# how SQLAlchemy stores DateTime columns in SQLite
+_ts_format = '%Y-%m-%d %H:%M:%S.%f'
+
+
+def main():
+    '''entry point for the wy command'''
+    args = sys.argv[1:]
+    # WY_TRACE profiles the full CLI (neither shortcut is instrumented)
+    tracing = os.environ.get('WY_TRACE', '') not in ('', '0')
+    if tracing or not (client.forward(args) or capture(args)):
+        from . import cli
+        cli.main()
+
+
+def capture(args: list[str]) -> bool:
+    '''Handle "task WORDS..." or "done" without the full CLI.
+
+    Return False if args are anything else (including options), or if
+    the database is not a single SQLite database with the current
+    schema: the caller must then fall back to the full CLI.
+    '''
+    if not args or any(arg.startswith('-') for arg in args):
+        return False
+    (cmd, words) = (args[0], args[1:])
+    description: Optional[str]
+    if cmd in ('t', 'task') and words:
+        description = ' '.join(words)
+    elif cmd == 'done' and not words:
+        description = None
+    else:
+        return False
+
+    cfg = config.get_config()
+    filename = sqlite_filename(cfg.db_url)
+    if cfg.layout != 'single' or filename is None or not os.path.exists(filename):
+        return False
+
+    conn = connect(filename, cfg.sqlite)
+    try:
+        if not schema_is_current(conn):
+            return False
+
+        now = _now()
+        with conn:
+            end_last_task(conn, now, cfg.pair_cap)
+            if description is not None:
+                add_task(conn, now, description)
+    finally:
+        conn.close()
+    return True
+
+
+def sqlite_filename(db_url: str) -> Optional[str]:
+    '''return the filename from a sqlite:/// URL (None for other URLs)'''
+    prefix = 'sqlite:///'
+    if db_url.startswith(prefix):
+        return db_url[len(prefix):]
+    return None
+
+
+def connect(
+        filename: str,
+        sqlite: Optional[config.SQLiteConfig] = None) -> sqlite3.Connection:
+    '''same setup as database.create_engine()'''
+    conn = sqlite3.connect(filename)
+    for pragma in (sqlite or config.SQLiteConfig()).pragmas():
+        conn.execute(pragma)
+    return conn
+
+
+def schema_is_current(conn: sqlite3.Connection) -> bool:
+    try:
+        row = conn.execute('select version from schema_version').fetchone()
+    except sqlite3.OperationalError:
+        return False
+    return row is not None and row[0] == len(migrations.MIGRATIONS)
+
+
+def end_last_task(
+        conn: sqlite3.Connection,
+        end_ts: datetime.datetime,
+        pair_cap: int):
+    '''same as WastedYearsDB.end_last_task()'''
+    row = conn.execute(
+        'select t.task_id, t.start_ts, t.end_ts,'
+        '  d.description_id, d.description, d.word_ids'
+        ' from tasks t join descriptions d using (description_id)'
+        ' order by t.task_id desc limit 1').fetchone()
+    if row is None or row[2] is not None:
+        return
+
+    (task_id, start_ts, _, description_id, description, word_ids) = row
+    conn.execute(
+        'update tasks set end_ts = ? where task_id = ?',
+        (end_ts.strftime(_ts_format), task_id))
+
+    start_ts = datetime.datetime.fromisoformat(start_ts)
+    elapsed = models.elapsed_seconds(start_ts, end_ts)
+    wordsql.record_words(
+        conn.execute, task_id, (description_id, description, word_ids),
+        elapsed, start_ts.date(), pair_cap)
+
+
+def add_task(conn: sqlite3.Connection, start_ts: datetime.datetime, description: str):
+    '''same as WastedYearsDB.add_task() for an unfinished task'''
+    (description_id, _, _) = wordsql.intern_description(conn.execute, description)
+    conn.execute(
+        'insert into tasks (update_ts, start_ts, end_ts, description_id)'
+        ' values (datetime(), ?, null, ?)',
+        (start_ts.strftime(_ts_format), description_id))
+
+
+def _now() -> datetime.datetime:
+    '''return current time, in UTC, truncated to second'''
+    now = datetime.datetime.utcnow()
+    now = now.replace(microsecond=0)
+    return now
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,16 @@
 '''wastedyears, the command-line interface'''
 
+import dataclasses
 import datetime
+import itertools
+import json
 import sys
-from typing import Tuple
+from typing import Iterator, Optional, Tuple, Union
 
 import click
-from dateutil import relativedelta as rdelta
+import sqlalchemy as sa
 
-from . import config, models, database
+from . import config, models, database, partitions, profiling, reportcache
 
 
 class AliasedGroup(click.Group):
@@ -24,7 +27,25 @@ class AliasedGroup(click.Group):
             'task',
             'ls-tasks',
             'ls-words',
+            'rank-words',
+            'stats',
+            'search',
+            'related',
+            'at',
+            'overlaps',
+            'switches',
+            'gaps',
+            'daily',
+            'weekly',
+            'monthly',
             'ingest',
+            'export',
+            'import',
+            'serve',
+            'partitions',
+            'rebuild-rollups',
+            'rebuild-pairs',
+            'rebuild-words',
         ]
 
     def get_command(self, ctx, cmd_name):
@@ -33,8 +54,85 @@ class AliasedGroup(click.Group):
 
 
 @click.group(cls=AliasedGroup)
-def main():
-    pass
+@click.option('--profile', is_flag=True,
+              help='report time spent per phase and SQL statement (or set WY_TRACE)')
+@click.option('--profile-format', type=click.Choice(profiling.FORMATS),
+              help='format of the profile  [default: text, or WY_TRACE]')
+@click.option('--profile-output', type=click.Path(dir_okay=False),
+              envvar='WY_TRACE_FILE',
+              help='write the profile here (default: stderr)')
+@click.pass_context
+def main(ctx: click.Context,
+         profile: bool,
+         profile_format: Optional[str],
+         profile_output: Optional[str]):
+    env_format = profiling.env_format()
+    if profile or profile_format or env_format:
+        fmt = profile_format or env_format or 'text'
+        profiling.start()
+        ctx.call_on_close(lambda: _write_profile(fmt, profile_output))
+
+
+def _write_profile(fmt: str, path: Optional[str]):
+    if path is None:
+        profiling.stop(fmt)
+        return
+    with open(path, 'w') as outfile:
+        profiling.stop(fmt, outfile)
+
+
+def _window_options(func):
+    '''add --since and --until options to a command'''
+    date_type = click.DateTime(['%Y-%m-%d'])
+    func = click.option(
+        '--until', type=date_type,
+        help='only tasks that started before this date')(func)
+    func = click.option(
+        '--since', type=date_type,
+        help='only tasks that started on or after this date')(func)
+    return func
+
+
+def _output_options(func):
+    '''add --json and --ndjson options to a command'''
+    func = click.option(
+        '--ndjson', 'output', flag_value='ndjson',
+        help='print one JSON object per line')(func)
+    func = click.option(
+        '--json', 'output', flag_value='json',
+        help='print a JSON array of objects')(func)
+    return func
+
+
+def _cache_stats_option(func):
+    '''add a --cache-stats option to a report command'''
+    return click.option(
+        '--cache-stats', is_flag=True,
+        help='print the hits and misses of the report cache to stderr')(func)
+
+
+def _write_json(records: Iterator[dict], output: str, chunk_size: int = 1000):
+    '''Encode records to stdout as they arrive, as a JSON array (output
+    'json') or as newline-delimited JSON ('ndjson').
+
+    Records are written and flushed chunk_size at a time, so a consumer
+    sees the first ones right away and memory use stays flat.
+    '''
+    encode = json.JSONEncoder(ensure_ascii=False).encode
+    out = sys.stdout
+    if output == 'json':
+        out.write('[')
+    first = True
+    it = iter(records)
+    while chunk := list(itertools.islice(it, chunk_size)):
+        if output == 'json':
+            out.write(('\n' if first else ',\n') + ',\n'.join(map(encode, chunk)))
+        else:
+            out.write(''.join(encode(record) + '\n' for record in chunk))
+        out.flush()
+        first = False
+    if output == 'json':
+        out.write(']\n' if first else '\n]\n')
 
 
 @main.command()
@@ -42,8 +140,8 @@ def main():
               help='drop all tables before recreating them')
 def init(drop: bool):
     '''initialize wastedyears (database only -- no config file yet)'''
-    cfg = config.get_config()
-    with database.open_db(cfg) as db:
+    cfg = _get_config()
+    with _open_db(cfg) as db:
         if drop:
             db.destroy_schema()
         db.init_schema()
@@ -52,7 +150,7 @@ def init(drop: bool):
 @main.command()
 def nuke():
     '''destroy the database (no takebacks)'''
-    cfg = config.get_config()
+    cfg = _get_config()
     database.nuke_db(cfg)
 
 
@@ -60,110 +158,562 @@ def nuke():
 @click.argument('taskword', nargs=-1)
 def task(taskword: Tuple[str]):
     '''start a new task (and mark the previous one done)'''
-    cfg = config.get_config()
+    cfg = _get_config()
 
     now = _now()
     taskwords = list(taskword)
     if taskwords:
         task = models.Task(start_ts=now, description=' '.join(taskwords))
-    else:
-        task = _run_editor()
+        with _open_tasks(cfg) as db:
+            db.end_last_task(now)
+            db.add_task(task)
+        return
 
-    with database.open_db(cfg) as db:
+    # The previous task ends when the editor opens, and the new one
+    # starts when it closes.
+    today = datetime.datetime.now().astimezone().date()
+    since = _local_midnight(today - datetime.timedelta(days=1))
+    with _open_tasks(cfg) as db:
         db.end_last_task(now)
-        db.add_task(task)
+        recent = db.get_recent_tasks(since)
+
+    description = _run_editor(recent, today)
+    if description is None:
+        print('no task entered', file=sys.stderr)
+        return
+    with _open_tasks(cfg) as db:
+        db.add_task(models.Task(start_ts=_now(), description=description))
 
 
 @main.command()
 def done():
     '''mark the current task done without starting a new one'''
-    cfg = config.get_config()
-    with database.open_db(cfg) as db:
+    cfg = _get_config()
+    with _open_tasks(cfg) as db:
         db.end_last_task(_now())
 
 
-def _run_editor():
-    raise NotImplementedError()
+def _run_editor(recent: list[models.Task], today: datetime.date) -> Optional[str]:
+    '''Let the user enter a task description in their editor, which
+    shows the distinct descriptions of recent tasks from yesterday and
+    today to copy from.
+
+    Return the first non-comment line, or None if there is none.
+    '''
+    days: dict[datetime.date, set[str]] = {
+        today - datetime.timedelta(days=1): set(),
+        today: set(),
+    }
+    for task in recent:
+        assert task.start_ts is not None
+        day = task.start_ts.astimezone().date()
+        if day in days:
+            days[day].add(task.description)
+
+    lines = ['# wy task editor; enter new task here:', '', '']
+    for (day, descriptions) in days.items():
+        if descriptions:
+            name = 'today' if day == today else 'yesterday'
+            lines.append(f'# recent tasks from {name}:')
+            lines.extend(sorted(descriptions))
+            lines.append('')
+
+    text = click.edit('\n'.join(lines))
+    for line in (text or '').splitlines():
+        line = line.strip()
+        if line and not line.startswith('#'):
+            return line
+    return None
+
+
+def _local_midnight(day: datetime.date) -> datetime.datetime:
+    '''return the start of day in local time, as naive UTC (like the database)'''
+    midnight = datetime.datetime.combine(day, datetime.time()).astimezone()
+    return midnight.astimezone(datetime.timezone.utc).replace(tzinfo=None)
 
 
 @main.command('ls-tasks')
-def list_tasks():
-    '''list all tasks in the database'''
-    cfg = config.get_config()
-    with database.open_db(cfg) as db:
-        tasks = db.list_tasks()
+@_window_options
+@click.option('-n', '--limit', type=int, help='number of tasks to show  [default: all]')
+@_output_options
+def list_tasks(since: Optional[datetime.datetime],
+               until: Optional[datetime.datetime],
+               limit: Optional[int],
+               output: Optional[str]):
+    '''list tasks in the database, oldest first'''
+    cfg = _get_config()
+    with _open_tasks(cfg) as db:
+        if output is not None:
+            _write_json(
+                db.iter_task_records(since=since, until=until, limit=limit), output)
+            return
+        for task in db.iter_tasks(since=since, until=until, limit=limit):
+            _print_task(task)
+
+
+def _print_task(task: models.Task):
+    if task.start_ts is None:
+        print(f'warning: invalid task {task.task_id} in database ' +
+              '(start_ts not set)',
+              file=sys.stderr)
+        return
+
+    print(_format_task(task))
+
+
+def _format_task(task: models.Task) -> str:
+    assert task.start_ts is not None
+    date = task.start_ts.strftime('%Y-%m-%d')
+    start_time = task.start_ts.strftime('%H:%M:%S')
+    end_time = '   --   '
+    if task.end_ts is not None:
+        end_time = task.end_ts.strftime('%H:%M:%S')
+
+    return f'{date}: {start_time} … {end_time}: {task.description}'
 
-    for task in tasks:
-        if task.start_ts is None:
-            print(f'warning: invalid task {task.task_id} in database ' +
-                  '(start_ts not set)',
-                  file=sys.stderr)
-            continue
 
-        date = task.start_ts.strftime('%Y-%m-%d')
-        start_time = task.start_ts.strftime('%H:%M:%S')
-        end_time = '   --   '
-        if task.end_ts is not None:
-            end_time = task.end_ts.strftime('%H:%M:%S')
+@main.command('ls-words')
+@_output_options
+def list_words(output: Optional[str]):
+    '''list all unique words in the database'''
+    cfg = _get_config()
+    with _open_db(cfg) as db:
+        # WordInfo objects sorted by descending elapsed, count
+        words = db.iter_words(order_by='ec')
+        if output is not None:
+            _write_json((dataclasses.asdict(info) for info in words), output)
+            return
+        for wordinfo in words:
+            print(wordinfo)
+
+
+@main.command('rank-words')
+@_window_options
+@click.option('-n', '--limit', type=int, help='number of words to show  [default: all]')
+def rank_words(since: Optional[datetime.datetime],
+               until: Optional[datetime.datetime],
+               limit: Optional[int]):
+    '''list words from most elapsed time to least'''
+    cfg = _get_config()
+    with _open_tasks(cfg) as db:
+        if since is None and until is None and isinstance(db, database.WastedYearsDB):
+            words = db.list_words(order_by='ecw')
+        else:
+            # get_word_report() needs both bounds
+            report = db.get_word_report(
+                since or datetime.datetime.min, until or datetime.datetime.max)
+            words = sorted(
+                report.values(),
+                key=lambda wi: (-wi.total_elapsed, -wi.total_count, wi.word))
 
-        print(f'{date}: {start_time} … {end_time}: {task.description}')
+    for wordinfo in words[:limit]:
+        print(wordinfo)
 
 
-@main.command('ls-words')
-def list_words():
-    '''list all unique words in the database'''
-    cfg = config.get_config()
-    with database.open_db(cfg) as db:
-        # list of WordInfo objects sorted by descending elapsed, count
-        words = db.list_words(order_by='ec')
+@main.command('stats')
+@_window_options
+@click.option('--by', type=click.Choice(['day', 'week']), default='week',
+              show_default=True, help='period for totals')
+def stats(since: Optional[datetime.datetime],
+          until: Optional[datetime.datetime],
+          by: str):
+    '''show totals, median task length and a weekday/hour heatmap (local time)'''
+    try:
+        from . import analytics
+    except ImportError:
+        sys.exit('wy: stats needs numpy (pip install wastedyears[numpy])')
+
+    cfg = _get_config()
+    with _open_db(cfg) as db:
+        tasks = analytics.TaskArrays.load(db).window(since, until)
+
+    # each task's own offset, so that tasks on the other side of a DST
+    # change land in the right hour
+    offset = tasks.local_offsets()
+    total = int(tasks.elapsed.sum())
+    print(f'{len(tasks)} tasks, {_hms(total)} total, '
+          f'median task {_hms(int(tasks.median_elapsed()))}')
+    print()
+    for (date, count, elapsed) in tasks.totals(by, offset):
+        print(f'{date}  {count:6}  {_hms(elapsed):>10}')
+    print()
+    print('hours by weekday and hour started:')
+    print('    ' + ''.join(f'{hour:3}' for hour in range(24)))
+    weekdays = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+    for (weekday, row) in zip(weekdays, tasks.heatmap(offset)):
+        cells = (f'{seconds / 3600:3.0f}' if seconds else '  .' for seconds in row)
+        print(f'{weekday} ' + ''.join(cells))
+
+
+def _hms(seconds: int) -> str:
+    return f'{seconds // 3600}:{seconds // 60 % 60:02}:{seconds % 60:02}'
+
+
+@main.command('rebuild-rollups')
+def rebuild_rollups():
+    '''regenerate the per-day word rollup and check it for consistency'''
+    cfg = _get_config()
+    with _open_db(cfg) as db:
+        db.init_schema()            # in case word_daily is missing
+        db.rebuild_rollups()
+        problems = db.check_rollups()
+
+    for problem in problems:
+        print(f'inconsistent: {problem}', file=sys.stderr)
+    if problems:
+        sys.exit(1)
+
+
+@main.command('search')
+@_window_options
+@click.option('--by', type=click.Choice(['rank', 'elapsed']), default='rank',
+              show_default=True, help='order by relevance or by elapsed time')
+@click.option('-n', '--limit', type=int, default=50, show_default=True,
+              help='maximum number of tasks to show')
+@click.option('--raw', is_flag=True,
+              help='QUERY is in SQLite FTS5 syntax (default: plain words)')
+@click.argument('query', nargs=-1, required=True)
+def search(since: Optional[datetime.datetime],
+           until: Optional[datetime.datetime],
+           by: str,
+           limit: int,
+           raw: bool,
+           query: Tuple[str]):
+    '''find tasks whose description matches QUERY'''
+    if raw:
+        fts_query = ' '.join(query)
+    else:
+        # match all words, without interpreting any FTS5 operators
+        fts_query = ' '.join('"' + word.replace('"', '""') + '"' for word in query)
+
+    cfg = _get_config()
+    with _open_db(cfg) as db:
+        try:
+            tasks = db.search_tasks(
+                fts_query, since=since, until=until, order_by=by, limit=limit)
+        except sa.exc.OperationalError as err:
+            raise click.BadParameter(str(err.orig), param_hint='QUERY')
+
+    for task in tasks:
+        _print_task(task)
+
+
+@main.command('rebuild-pairs')
+def rebuild_pairs():
+    '''regenerate the word co-occurrence table'''
+    cfg = _get_config()
+    with _open_db(cfg) as db:
+        db.rebuild_word_pairs()
+
+
+@main.command('rebuild-words')
+@click.option('--check', is_flag=True,
+              help='only compare recomputed word totals with the stored ones')
+@click.option('--workers', type=int,
+              help='number of processes splitting descriptions  [default: one per CPU]')
+@click.option('--chunk-size', type=int, default=1000, show_default=True,
+              help='number of descriptions per batch')
+def rebuild_words(check: bool, workers: Optional[int], chunk_size: int):
+    '''regenerate words and everything derived from them from tasks'''
+    cfg = _get_config()
+    with _open_db(cfg) as db:
+        if check:
+            problems = db.check_words(chunk_size=chunk_size, workers=workers)
+        else:
+            db.rebuild_words(chunk_size=chunk_size, workers=workers)
+            problems = db.check_rollups()
+
+    for problem in problems:
+        print(f'inconsistent: {problem}', file=sys.stderr)
+    if problems:
+        sys.exit(1)
+
+
+@main.command('related')
+@click.option('-n', '--limit', type=int, default=10, show_default=True,
+              help='number of words to show')
+@click.option('--by', type=click.Choice(['elapsed', 'count']), default='elapsed',
+              show_default=True, help='rank words by shared time or shared tasks')
+@click.argument('word')
+def related_words(limit: int, by: str, word: str):
+    '''list the words that occur most often together with WORD'''
+    order_by = {'elapsed': 'ec', 'count': 'ce'}[by]
+    cfg = _get_config()
+    with _open_db(cfg) as db:
+        words = db.get_related_words(word, limit=limit, order_by=order_by)
 
     for wordinfo in words:
         print(wordinfo)
 
 
+@main.command('at')
+@click.argument('when', type=click.DateTime(
+    ['%Y-%m-%d %H:%M', '%Y-%m-%d %H:%M:%S', '%H:%M', '%H:%M:%S']))
+def tasks_at(when: datetime.datetime):
+    '''show what you were doing at WHEN (local time, today if no date)'''
+    if when.year == 1900:
+        # only a time of day
+        today = datetime.datetime.now().astimezone().date()
+        when = datetime.datetime.combine(today, when.time())
+    ts = when.astimezone().astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    cfg = _get_config()
+    with _open_db(cfg) as db:
+        tasks = db.tasks_at(ts)
+
+    if not tasks:
+        print(f'no task at {when}', file=sys.stderr)
+    for task in tasks:
+        _print_task(task)
+
+
+@main.command('overlaps')
+@_window_options
+def overlaps(since: Optional[datetime.datetime],
+             until: Optional[datetime.datetime]):
+    '''list pairs of tasks that overlap in time'''
+    cfg = _get_config()
+    with _open_db(cfg) as db:
+        pairs = db.find_overlaps(since=since, until=until)
+
+    for (first, second) in pairs:
+        print(_format_task(first))
+        print(f'  overlaps {_format_task(second)}')
+
+
+@main.command('daily')
+@_window_options
+@_cache_stats_option
+def daily_report(since: Optional[datetime.datetime],
+                 until: Optional[datetime.datetime],
+                 cache_stats: bool):
+    '''report activity by day'''
+    _print_report('day', since, until, cache_stats)
+
+
 @main.command('weekly')
-def weekly_report():
+@_window_options
+@_cache_stats_option
+def weekly_report(since: Optional[datetime.datetime],
+                  until: Optional[datetime.datetime],
+                  cache_stats: bool):
     '''report activity by week'''
+    _print_report('week', since, until, cache_stats)
+
+
+@main.command('monthly')
+@_window_options
+@_cache_stats_option
+def monthly_report(since: Optional[datetime.datetime],
+                   until: Optional[datetime.datetime],
+                   cache_stats: bool):
+    '''report activity by month'''
+    _print_report('month', since, until, cache_stats)
+
+
+def _print_report(
+        bucket: str,
+        since: Optional[datetime.datetime],
+        until: Optional[datetime.datetime],
+        cache_stats: bool = False):
     import logging
     logging.basicConfig(
         format='%(levelname)-1.1s %(name)s: %(message)s'
     )
     # logging.getLogger('sqlalchemy.engine').setLevel(logging.INFO)
 
-    cfg = config.get_config()
-    with database.open_db(cfg) as db:
-        # Get the list of all dates visible in the database as task start_ts.
-        # Wind back to the previous Monday to get the set of distinct
-        # weeks (as Monday dates).
-        task_dates = db.get_task_dates()
-        delta = rdelta.relativedelta(weekday=rdelta.MO(-1))
-        week_starts = sorted({date - delta for date in task_dates})
-
-        for date in week_starts:
-            print(f'{date}')
-            word_map = db.get_word_report(
-                start_ts=date, end_ts=date + datetime.timedelta(days=7))
-
-            words = sorted(
-                word_map.values(),
-                key=lambda wi: (-wi.total_elapsed, -wi.total_count))
-
-            for wordinfo in words:
-                print(wordinfo)
-            print()
+    cfg = _get_config()
+    with _open_db(cfg) as db:
+        reports = reportcache.ReportCache(db, cfg.report_cache_size)
+        for line in _report_lines(reports, bucket, since, until):
+            print(line)
+    if cache_stats:
+        print(reports.stats, file=sys.stderr)
+
+
+def _report_lines(
+        reports: Union[database.WastedYearsDB, reportcache.ReportCache],
+        bucket: str,
+        since: Optional[datetime.datetime],
+        until: Optional[datetime.datetime]) -> Iterator[str]:
+    for (date, words) in reports.iter_word_report(bucket, since, until):
+        yield f'{date}'
+        for wordinfo in words:
+            yield str(wordinfo)
+        yield ''
+
+
+def _bucket_option(func):
+    '''add a --by option for the size of report buckets'''
+    buckets = list(database.WastedYearsDB.bucket_modifiers)
+    return click.option(
+        '--by', 'bucket', type=click.Choice(buckets), default='day', show_default=True,
+        help='report per day, week (starting Monday) or month')(func)
+
+
+@main.command('switches')
+@_window_options
+@_bucket_option
+def switches_report(since: Optional[datetime.datetime],
+                    until: Optional[datetime.datetime],
+                    bucket: str):
+    '''report how often you switched tasks, and your longest focus streak'''
+    cfg = _get_config()
+    with _open_db(cfg) as db:
+        print(f'{"":10}  {"tasks":>6} {"switches":>8} {"longest streak":>15}')
+        for info in db.iter_focus_report(bucket, since, until):
+            print(f'{info.bucket}  {info.tasks:6} {info.switches:8}'
+                  f' {info.longest_streak:14}s')
+
+
+@main.command('gaps')
+@_window_options
+@_bucket_option
+@click.option('--max-gap', type=int, default=300, show_default=True,
+              help='longer gaps (in seconds) are untracked time, not overhead')
+def gaps_report(since: Optional[datetime.datetime],
+                until: Optional[datetime.datetime],
+                bucket: str,
+                max_gap: int):
+    '''report the gaps between tasks: the overhead of recording them'''
+    cfg = _get_config()
+    with _open_db(cfg) as db:
+        print(f'{"":10}  {"gaps":>6} {"total":>8} {"longest":>8} {"untracked":>10}')
+        for info in db.iter_focus_report(bucket, since, until, max_gap=max_gap):
+            print(f'{info.bucket}  {info.gap_count:6} {info.gap_total:7}s'
+                  f' {info.longest_gap:7}s {info.untracked:9}s')
+
+
+@main.command('export')
+@click.option('--format', 'fmt', type=click.Choice(['arrow', 'parquet', 'npz']),
+              default='arrow', show_default=True)
+@click.option('--chunk-size', type=int, default=10000, show_default=True,
+              help='number of rows to write per batch')
+@click.argument('out_dir', type=click.Path(file_okay=False))
+def export(fmt: str, chunk_size: int, out_dir: str):
+    '''write tasks, descriptions, words and task_words to columnar files in OUT_DIR'''
+    from . import export as export_
+
+    cfg = _get_config()
+    with _open_db(cfg) as db:
+        try:
+            counts = export_.export_db(db, out_dir, fmt, chunk_size=chunk_size)
+        except RuntimeError as err:
+            sys.exit(f'wy: {err}')
+
+    for (table, count) in counts.items():
+        print(f'{table}: {count} rows', file=sys.stderr)
+
+
+@main.command('import')
+@click.option('--format', 'fmt', type=click.Choice(['arrow', 'parquet', 'npz']),
+              default='arrow', show_default=True)
+@click.option('--chunk-size', type=int, default=10000, show_default=True,
+              help='number of tasks to write per batch')
+@click.argument('in_dir', type=click.Path(exists=True, file_okay=False))
+def import_(fmt: str, chunk_size: int, in_dir: str):
+    '''load tasks exported by "wy export" into an empty database'''
+    from . import export as export_
+
+    cfg = _get_config()
+    with _open_db(cfg) as db:
+        db.init_schema()
+        try:
+            stats = export_.import_db(db, in_dir, fmt, chunk_size=chunk_size)
+        except RuntimeError as err:
+            sys.exit(f'wy: {err}')
+
+    print(stats, file=sys.stderr)
+
+
+@main.command('serve')
+def serve():
+    '''keep the database open and run task, done, ls-tasks and reports
+    for other wy commands (stop with ^C)'''
+    from . import server
+
+    cfg = _get_config()
+    print(f'listening on {cfg.socket_path}', file=sys.stderr)
+    try:
+        server.serve(cfg)
+    except RuntimeError as err:
+        sys.exit(f'wy: {err}')
+
+
+@main.command('partitions')
+@click.option('--freeze', type=int, metavar='YEAR',
+              help='compact the partition of a past year and make it read-only')
+def list_partitions(freeze: Optional[int]):
+    '''list the partitions of the yearly layout'''
+    cfg = _get_config()
+    if cfg.layout != 'yearly':
+        sys.exit('wy: partitions needs layout=yearly in wastedyears.cfg')
+    with partitions.PartitionedDB(cfg) as db:
+        if freeze is not None:
+            try:
+                (before, after) = db.freeze(freeze)
+            except RuntimeError as err:
+                sys.exit(f'wy: {err}')
+            print(f'froze {freeze}: {before} -> {after} bytes', file=sys.stderr)
+
+        for part in db.partitions():
+            read_only = '  read-only' if part.read_only else ''
+            print(f'{part.year}  {part.num_tasks:8} tasks'
+                  f'  {part.min_start_ts} .. {part.max_start_ts}'
+                  f'  {part.filename}{read_only}')
 
 
 @main.command('ingest')
+@click.option('--chunk-size', type=int, default=1000, show_default=True,
+              help='number of tasks to write per batch')
+@click.option('--on-duplicate', type=click.Choice(database.ON_DUPLICATE),
+              default='skip', show_default=True,
+              help='what to do with tasks that are already in the database: '
+              'insert them again, skip them, or update them if changed')
 @click.argument('infile', type=click.File('rt'))
-def ingest(infile):
-    '''read old tasks from a text file into the database'''
+def ingest(chunk_size: int, on_duplicate: str, infile):
+    '''read old tasks from a text file into the database
+
+    Ingesting the same file again (or a longer version of it) only adds
+    the tasks that are not in the database yet.
+    '''
     from . import ingest as ingest_
 
-    cfg = config.get_config()
-    with database.open_db(cfg) as db:
-        for task in ingest_.ingest(db, infile):
+    def echo(tasks):
+        for task in tasks:
             print(task)
-            db.add_task(task)
+            yield task
+
+    cfg = _get_config()
+    with _open_tasks(cfg) as db:
+        tasks = ingest_.ingest(db, infile)
+        try:
+            stats = db.bulk_load(
+                echo(tasks), chunk_size=chunk_size, on_duplicate=on_duplicate)
+        except RuntimeError as err:
+            # (a frozen partition)
+            sys.exit(f'wy: {err}')
+
+    print(stats, file=sys.stderr)
+
+
+def _open_db(cfg: config.Config) -> database.WastedYearsDB:
+    try:
+        return database.open_db(cfg)
+    except RuntimeError as err:
+        sys.exit(f'wy: {err}')
+
+
+def _open_tasks(
+        cfg: config.Config) -> Union[database.WastedYearsDB, partitions.PartitionedDB]:
+    '''open the database for the commands that also support layout=yearly'''
+    if cfg.layout == 'yearly':
+        return partitions.PartitionedDB(cfg)
+    return _open_db(cfg)
+
+
+def _get_config() -> config.Config:
+    with profiling.phase('config'):
+        return config.get_config()
 
 
 def _now() -> datetime.datetime:
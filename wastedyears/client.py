@@ -0,0 +1,113 @@
+'''talk to a running "wy serve" daemon
+
+Like capture, this module only uses the standard library, so that
+forwarding a command to the daemon costs no more than starting Python.
+
+The protocol is one request per connection. The client sends a single
+line: the command and its arguments as a JSON array of strings, so that
+arguments with any whitespace in them (even newlines) arrive intact,
+just as they would be when running the command directly. The daemon
+replies with the command's output, line by line as the command produces
+it, then a status line, "ok" or "error MESSAGE", and closes the
+connection. So the status is always the last line: the client holds
+back one line, and prints the rest as they arrive.
+'''
+
+import json
+import socket
+import sys
+from typing import Callable, Optional
+
+from . import config
+
+# commands that the daemon understands, and their aliases
+COMMANDS = {
+    't': 'task',
+    'task': 'task',
+    'done': 'done',
+    'ls': 'ls-tasks',
+    'ls-tasks': 'ls-tasks',
+    'daily': 'daily',
+    'weekly': 'weekly',
+    'monthly': 'monthly',
+}
+
+
+def forward(args: list[str]) -> bool:
+    '''Run the command in args on the daemon, if it is running and
+    understands the command; print its output.
+
+    Return False if the caller must run the command itself.
+    '''
+    request = parse_request(args)
+    if request is None:
+        return False
+    cfg = config.get_config()
+    status = send(cfg.socket_path, request, print)
+    if status is None:
+        return False
+
+    if status != 'ok':
+        sys.exit(f'wy: {status}')
+    return True
+
+
+def parse_request(args: list[str]) -> Optional[list[str]]:
+    '''return args as a request for the daemon (None if it cannot handle them)'''
+    if not args or any(arg.startswith('-') for arg in args):
+        return None
+    cmd = COMMANDS.get(args[0])
+    # "task" needs words (without, it opens an editor); the rest take none
+    if cmd is None or (cmd == 'task') != bool(args[1:]):
+        return None
+    return [cmd] + args[1:]
+
+
+def encode_request(request: list[str]) -> bytes:
+    '''return request as a line to send to the daemon'''
+    return (json.dumps(request) + '\n').encode('utf-8')
+
+
+def decode_request(line: bytes) -> Optional[list[str]]:
+    '''return the request in line (from encode_request()), or None if it
+    is not a valid request'''
+    try:
+        args = json.loads(line)
+    except ValueError:
+        return None
+    if not isinstance(args, list) or not all(isinstance(arg, str) for arg in args):
+        return None
+    return parse_request(args)
+
+
+def send(
+        path: str,
+        request: list[str],
+        output: Callable[[str], None]) -> Optional[str]:
+    '''Send request to the daemon listening on path, and pass each line
+    of its output to output as it arrives.
+
+    Return its status line, or None if no daemon is listening.
+    '''
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            sock.connect(path)
+        except (FileNotFoundError, ConnectionRefusedError):
+            return None
+        sock.sendall(encode_request(request))
+        sock.shutdown(socket.SHUT_WR)
+        # the last line is the status, so output each line once the next
+        # one has arrived
+        last = None
+        with sock.makefile('r', encoding='utf-8', newline='\n') as infile:
+            for line in infile:
+                if last is not None:
+                    output(last)
+                last = line.rstrip('\n')
+    finally:
+        sock.close()
+
+    if last is None:
+        return 'error no response from daemon'
+    return last
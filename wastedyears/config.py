@@ -6,6 +6,19 @@ import configparser
 import dataclasses
 import os
 
+# by default, only pair up 12 words of a task (66 pairs): the ones with
+# the lowest word_ids, i.e. that were first seen longest ago
+DEFAULT_PAIR_CAP = 12
+
+# bytes of report buckets to keep in the report cache (see reportcache.py)
+DEFAULT_REPORT_CACHE_SIZE = 32 * 1024 * 1024
+
+# single: one database file; yearly: one per year (see partitions.py)
+LAYOUTS = ('single', 'yearly')
+
+JOURNAL_MODES = ('delete', 'truncate', 'persist', 'memory', 'wal', 'off')
+SYNCHRONOUS_LEVELS = ('off', 'normal', 'full', 'extra')
+
 
 def get_config() -> Config:
     '''return a Config object ready to use'''
@@ -17,9 +30,23 @@ def get_config() -> Config:
     parser.read_string(defaults)
     parser.read(os.path.join(config_home, 'wastedyears.cfg'))
 
+    layout = parser.get('core', 'layout').lower()
+    if layout not in LAYOUTS:
+        raise ValueError(f'invalid layout: {layout!r}')
+
     return Config(
         data_dir=parser.get('core', 'data_dir'),
         db_url=parser.get('core', 'db_url'),
+        layout=layout,
+        pair_cap=parser.getint('words', 'pair_cap'),
+        report_cache_size=parser.getint('reports', 'cache_size'),
+        sqlite=SQLiteConfig(
+            journal_mode=parser.get('sqlite', 'journal_mode'),
+            synchronous=parser.get('sqlite', 'synchronous'),
+            mmap_size=parser.getint('sqlite', 'mmap_size'),
+            cache_size=parser.getint('sqlite', 'cache_size'),
+            busy_timeout=parser.getint('sqlite', 'busy_timeout'),
+        ),
     )
 
 
@@ -27,10 +54,25 @@ def get_default_config() -> str:
     '''return a hardcoded default config'''
     # from https://specifications.freedesktop.org/basedir-spec/basedir-spec-0.6.html
     data_home = _xdg_dir('XDG_DATA_HOME', '.local', 'share')
+    sqlite = SQLiteConfig()
 
     return f'''[core]
 data_dir={os.path.join(data_home, 'wastedyears')}
 db_url=sqlite:///%(data_dir)s/wastedyears.sqlite
+layout=single
+
+[words]
+pair_cap={DEFAULT_PAIR_CAP}
+
+[reports]
+cache_size={DEFAULT_REPORT_CACHE_SIZE}
+
+[sqlite]
+journal_mode={sqlite.journal_mode}
+synchronous={sqlite.synchronous}
+mmap_size={sqlite.mmap_size}
+cache_size={sqlite.cache_size}
+busy_timeout={sqlite.busy_timeout}
 '''
 
 
@@ -40,6 +82,45 @@ def _xdg_dir(env_var, *default_path):
         os.path.join(os.environ['HOME'], *default_path))
 
 
+@dataclasses.dataclass
+class SQLiteConfig:
+    '''How every connection to a SQLite database is set up (the [sqlite]
+    section of wastedyears.cfg; see https://sqlite.org/pragma.html).
+
+    The defaults let readers (reports, the GUI) carry on while wy task
+    or the daemon writes: in WAL mode a reader never blocks a writer or
+    vice versa. synchronous=normal is durable across application
+    crashes; a power cut may lose the last few commits.
+    '''
+    journal_mode: str = 'wal'
+    synchronous: str = 'normal'
+    # bytes of the database file to memory-map
+    mmap_size: int = 256 * 1024 * 1024
+    # pages if positive, KiB if negative (as in "pragma cache_size")
+    cache_size: int = -16 * 1024
+    # milliseconds to wait for a lock before "database is locked"
+    busy_timeout: int = 5000
+
+    def __post_init__(self):
+        self.journal_mode = self.journal_mode.lower()
+        self.synchronous = self.synchronous.lower()
+        if self.journal_mode not in JOURNAL_MODES:
+            raise ValueError(f'invalid sqlite journal_mode: {self.journal_mode!r}')
+        if self.synchronous not in SYNCHRONOUS_LEVELS:
+            raise ValueError(f'invalid sqlite synchronous: {self.synchronous!r}')
+
+    def pragmas(self) -> list[str]:
+        '''statements to run on every new connection'''
+        return [
+            f'pragma busy_timeout={int(self.busy_timeout)}',
+            f'pragma journal_mode={self.journal_mode}',
+            f'pragma synchronous={self.synchronous}',
+            f'pragma mmap_size={int(self.mmap_size)}',
+            f'pragma cache_size={int(self.cache_size)}',
+            'pragma foreign_keys=on',
+        ]
+
+
 @dataclasses.dataclass
 class Config:
     '''An object that encapsulates all config settings for wastedyears.
@@ -48,6 +129,20 @@ class Config:
     '''
     data_dir: str
     db_url: str
+    layout: str = 'single'
+
+    # maximum number of words per task that go into word_pairs
+    pair_cap: int = DEFAULT_PAIR_CAP
+
+    # size limit of the report cache in bytes (0 turns it off)
+    report_cache_size: int = DEFAULT_REPORT_CACHE_SIZE
+
+    sqlite: SQLiteConfig = dataclasses.field(default_factory=SQLiteConfig)
+
+    @property
+    def socket_path(self) -> str:
+        '''where "wy serve" listens'''
+        return os.path.join(self.data_dir, 'wy.sock')
 
     def create_data_dir(self):
         if not os.path.isdir(self.data_dir):
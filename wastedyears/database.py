@@ -1,20 +1,35 @@
 '''the wastedyears database interface'''
 
 from __future__ import annotations
+import collections
+import concurrent.futures
+import contextlib
+import dataclasses
 import datetime
+import itertools
 import os
-from typing import Optional
+import time
+from typing import Iterable, Iterator, Optional
 
 import sqlalchemy as sa
 from sqlalchemy import event
 
-from . import config, models
+from . import config, migrations, models, profiling, wordsql
+
+# what bulk_load() does with a task that is already in the database
+ON_DUPLICATE = ('insert', 'skip', 'update')
 
 
 def open_db(cfg: config.Config) -> WastedYearsDB:
-    cfg.create_data_dir()
-    engine = create_engine(cfg.db_url)
-    return WastedYearsDB(engine.connect())
+    if cfg.layout != 'single':
+        raise RuntimeError(
+            f'this command does not support layout={cfg.layout} (yet)')
+    with profiling.phase('open db'):
+        cfg.create_data_dir()
+        engine = create_engine(cfg.db_url, cfg.sqlite)
+        db = WastedYearsDB(engine.connect(), pair_cap=cfg.pair_cap)
+        db.migrate()
+        return db
 
 
 def nuke_db(cfg: config.Config):
@@ -30,19 +45,21 @@ def nuke_db(cfg: config.Config):
     raise RuntimeError(f'cannot nuke database: {cfg.db_url}')
 
 
-def create_engine(db_url: str) -> sa.engine.base.Engine:
+def create_engine(
+        db_url: str,
+        sqlite: Optional[config.SQLiteConfig] = None) -> sa.engine.base.Engine:
+    '''create an engine whose connections are set up by sqlite (by default,
+    config.SQLiteConfig())'''
     engine = sa.create_engine(db_url)
     engine = engine.execution_options(autocommit=False)
-    event.listen(
-        engine,
-        'connect',
-        lambda conn, conn_record: conn.execute('pragma foreign_keys=on'),
-    )
+    pragmas = (sqlite or config.SQLiteConfig()).pragmas()
 
-    # make sure it actually works
-    with engine.connect():
-        pass
+    def connect(conn, conn_record):
+        for pragma in pragmas:
+            conn.execute(pragma)
 
+    event.listen(engine, 'connect', connect)
+    profiling.attach(engine)
     return engine
 
 
@@ -55,7 +72,26 @@ class WastedYearsDB:
         sa.Column('update_ts', sa.DateTime, nullable=False),
         sa.Column('start_ts', sa.DateTime, nullable=False),
         sa.Column('end_ts', sa.DateTime, nullable=True),
-        sa.Column('description', sa.Text, nullable=False),
+        sa.Column('description_id', sa.Integer,
+                  sa.ForeignKey('descriptions.description_id'), nullable=False),
+        # covers date-range queries
+        sa.Index('ix_tasks_start_ts', 'start_ts', 'end_ts'),
+        # natural key of finished tasks, so that a log can be ingested
+        # again (zero-length tasks are exempt: two quick "wy task" in the
+        # same second may make identical ones)
+        sa.Index('ux_tasks_natural_key', 'start_ts', 'end_ts', 'description_id',
+                 unique=True, sqlite_where=sa.text('end_ts > start_ts')),
+    )
+
+    # every distinct task description, stored once, along with the
+    # word_ids of its words (space-separated; null until the first task
+    # with this description is finished)
+    tbl_descriptions = sa.Table(
+        'descriptions',
+        metadata,
+        sa.Column('description_id', sa.Integer, primary_key=True),
+        sa.Column('description', sa.Text, unique=True, nullable=False),
+        sa.Column('word_ids', sa.Text, nullable=True),
     )
     tbl_words = sa.Table(
         'words',
@@ -74,14 +110,97 @@ class WastedYearsDB:
         sa.Column('task_id', sa.Integer, sa.ForeignKey('tasks.task_id')),
         sa.Column('word_id', sa.Integer, sa.ForeignKey('words.word_id')),
         sa.UniqueConstraint('task_id', 'word_id'),
+        sa.Index('ix_task_words_word_id', 'word_id', 'task_id'),
+    )
+
+    # per-day rollup of task_words, so that reports sum a few precomputed
+    # rows rather than scanning every task
+    tbl_word_daily = sa.Table(
+        'word_daily',
+        metadata,
+        sa.Column('day', sa.Date, nullable=False),
+        sa.Column('word_id', sa.Integer, sa.ForeignKey('words.word_id'),
+                  nullable=False),
+        sa.Column('total_count', sa.Integer, nullable=False),
+        sa.Column('total_elapsed', sa.Integer, nullable=False),
+        sa.PrimaryKeyConstraint('day', 'word_id'),
+    )
+
+    # how often, and for how long, two words occur in the same task
+    # (word_id_a < word_id_b, so each unordered pair is stored once)
+    tbl_word_pairs = sa.Table(
+        'word_pairs',
+        metadata,
+        sa.Column('word_id_a', sa.Integer, sa.ForeignKey('words.word_id'),
+                  nullable=False),
+        sa.Column('word_id_b', sa.Integer, sa.ForeignKey('words.word_id'),
+                  nullable=False),
+        sa.Column('total_count', sa.Integer, nullable=False),
+        sa.Column('total_elapsed', sa.Integer, nullable=False),
+        sa.PrimaryKeyConstraint('word_id_a', 'word_id_b'),
+        sa.Index('ix_word_pairs_b', 'word_id_b', 'word_id_a'),
+    )
+
+    # per-day data version, bumped by triggers whenever word_daily changes
+    # on that day (see migrations.create_version_triggers())
+    tbl_data_versions = sa.Table(
+        'data_versions',
+        metadata,
+        sa.Column('day', sa.Date, primary_key=True),
+        sa.Column('version', sa.Integer, nullable=False),
+    )
+
+    # report buckets computed earlier, each with the data version it was
+    # computed from (see reportcache.py); used orders them for eviction
+    tbl_report_cache = sa.Table(
+        'report_cache',
+        metadata,
+        sa.Column('report', sa.String, nullable=False),
+        sa.Column('bucket', sa.String, nullable=False),
+        sa.Column('bucket_start', sa.Date, nullable=False),
+        sa.Column('version', sa.Integer, nullable=False),
+        sa.Column('data', sa.Text, nullable=False),
+        sa.Column('size', sa.Integer, nullable=False),
+        sa.Column('used', sa.Integer, nullable=False),
+        sa.PrimaryKeyConstraint('report', 'bucket', 'bucket_start'),
+        sa.Index('ix_report_cache_used', 'used'),
     )
 
+    # R*Tree index of the span of each task, in seconds since the epoch
+    # (a virtual table, so not in metadata: see migrations.create_rtree())
+    tbl_tasks_rtree = sa.table(
+        'tasks_rtree',
+        sa.column('task_id'),
+        sa.column('start_s'),
+        sa.column('end_s'),
+    )
+
+    # single row: the number of migrations applied to this database
+    tbl_schema_version = sa.Table(
+        'schema_version',
+        metadata,
+        sa.Column('version', sa.Integer, nullable=False),
+    )
+
+    # SQLite date() modifiers that wind a date back to the start of its
+    # report bucket (weeks start on Monday)
+    bucket_modifiers = {
+        'day': (),
+        'week': ('weekday 0', '-6 days'),
+        'month': ('start of month',),
+    }
+
     conn: sa.engine.base.Connection
     txn: Optional[sa.engine.base.Transaction]
+    pair_cap: int
 
-    def __init__(self, conn: sa.engine.base.Connection):
+    def __init__(
+            self,
+            conn: sa.engine.base.Connection,
+            pair_cap: int = config.DEFAULT_PAIR_CAP):
         self.conn = conn
         self.txn = conn.begin()
+        self.pair_cap = pair_cap
 
     def __enter__(self):
         return self
@@ -105,22 +224,71 @@ class WastedYearsDB:
         self.txn.commit()
         self.txn = None
 
+    def rollback(self):
+        """Roll back the current transaction."""
+        assert self.txn is not None
+        self.txn.rollback()
+        self.txn = None
+
     def init_schema(self):
+        fresh = not sa.inspect(self.conn).has_table('tasks')
         self.metadata.create_all(bind=self.conn)
+        if fresh:
+            # create_all() made the current schema, except for what
+            # metadata cannot express
+            migrations.create_fts(self)
+            migrations.create_rtree(self)
+            migrations.create_version_triggers(self)
+            self.conn.execute(
+                self.tbl_schema_version.insert()
+                .values(version=len(migrations.MIGRATIONS)))
+        else:
+            self.migrate()
+
+    def migrate(self) -> int:
+        '''Apply any migrations that this database is missing.
+
+        Does nothing if the database has not been initialized yet.
+        Return the number of migrations applied.
+        '''
+        if not sa.inspect(self.conn).has_table('tasks'):
+            return 0
+
+        tbl = self.tbl_schema_version
+        tbl.create(bind=self.conn, checkfirst=True)
+        version = self.conn.execute(sa.select([tbl.c.version])).scalar()
+        if version is None:
+            # created before schema versioning
+            version = 0
+            self.conn.execute(tbl.insert().values(version=version))
+
+        pending = migrations.MIGRATIONS[version:]
+        for migration in pending:
+            migration(self)
+        if pending:
+            self.conn.execute(tbl.update().values(version=len(migrations.MIGRATIONS)))
+        return len(pending)
 
     def destroy_schema(self):
+        # virtual tables are not in metadata
+        self.conn.execute('drop table if exists descriptions_fts')
+        self.conn.execute('drop table if exists tasks_rtree')
         self.metadata.drop_all(bind=self.conn)
 
     def end_last_task(self, end_ts: datetime.datetime):
         '''update the most recently added task: set end_ts, if not already set'''
         tbl = self.tbl_tasks
+        descs = self.tbl_descriptions
         result = self.conn.execute(
             sa.select([
                 tbl.c.task_id,
                 tbl.c.start_ts,
                 tbl.c.end_ts,
-                tbl.c.description,
+                descs.c.description_id,
+                descs.c.description,
+                descs.c.word_ids,
             ])
+            .select_from(tbl.join(descs))
             .order_by(tbl.c.task_id.desc())
             .limit(1)
         )
@@ -135,12 +303,17 @@ class WastedYearsDB:
 
             # Store the words for this task (since end_ts was null, we must
             # have skipped this when the task was previously added).
-            elapsed = (end_ts - row.start_ts).seconds
-            words = models.split_description(row.description)
-            self.upsert_words(row.task_id, words, elapsed)
+            elapsed = models.elapsed_seconds(row.start_ts, end_ts)
+            desc = (row.description_id, row.description, row.word_ids)
+            wordsql.record_words(
+                self.conn.execute, row.task_id, desc, elapsed,
+                _utc_date(row.start_ts), self.pair_cap)
 
     def add_task(self, task: models.Task) -> int:
+        '''Insert task, with task.task_id if set (else a new ID). Return
+        its task_id.'''
         # Unconditionally insert the task itself.
+        desc = wordsql.intern_description(self.conn.execute, task.description)
         insert = (
             self.tbl_tasks
             .insert()
@@ -148,7 +321,9 @@ class WastedYearsDB:
                 update_ts=sa.text('datetime()'),
                 start_ts=task.start_ts,
                 end_ts=task.end_ts,
-                description=task.description))
+                description_id=desc[0]))
+        if task.task_id is not None:
+            insert = insert.values(task_id=task.task_id)
         result = self.conn.execute(insert)
         task_id = result.inserted_primary_key[0]
         assert isinstance(task_id, int)
@@ -157,10 +332,10 @@ class WastedYearsDB:
             # If the end time is known, that's enough to insert/update
             # the words in the task. If not, wait until end_last_task().
             assert task.start_ts is not None
-            elapsed = (task.end_ts - task.start_ts).seconds
-
-            words = models.split_description(task.description)
-            self.upsert_words(task_id, words, elapsed)
+            elapsed = models.elapsed_seconds(task.start_ts, task.end_ts)
+            wordsql.record_words(
+                self.conn.execute, task_id, desc, elapsed,
+                _utc_date(task.start_ts), self.pair_cap)
 
         return task_id
 
@@ -169,66 +344,652 @@ class WastedYearsDB:
             task_id: int,
             words: list[str],
             elapsed: int,
+            day: datetime.date,
     ) -> dict[str, int]:
-        '''Insert words that are not already in the database.
-        Ignore words that are there.
+        '''Insert words that are not already in the database, and add
+        1 and elapsed to the totals of words that are there (overall, for
+        day, and for pairs of words).
 
         Return a map of word to word_id for newly inserted words.
         '''
-        if not words:
-            return {}
-
-        new_words: dict[str, int] = {}
-
-        # Cannot use sqlalchemy.dialect.sqlite.insert() here: it does not
-        # support '.returning()'.
-        upsert = (
-            'insert into words (word, total_count, total_elapsed) values ' +
-            ' (?, ?, ?)' +
-            ' on conflict do nothing' +
-            ' returning word, word_id')
-        for word in words:
-            result = self.conn.execute(upsert, (word, 1, elapsed))
-            row = result.fetchone()
-            if row:
-                new_words[row.word] = row.word_id
+        return wordsql.upsert_words(
+            self.conn.execute, task_id, words, elapsed, day, self.pair_cap)
+
+    def bulk_load(
+            self,
+            tasks: Iterable[models.Task],
+            chunk_size: int = 1000,
+            on_duplicate: str = 'insert',
+    ) -> models.LoadStats:
+        '''Insert many tasks at once, e.g. when ingesting old logs.
+
+        Tasks are buffered into chunks of chunk_size, and each chunk is
+        written with a handful of multi-row statements rather than several
+        statements per task. The word -> word_id and description ->
+        (description_id, word_ids) maps are kept in memory for the whole
+        run, and word totals are applied once per chunk as aggregated
+        deltas.
+
+        Tasks that already have a task_id or update_ts keep them (e.g.
+        when importing an export); the others get new ones.
+
+        on_duplicate says what to do with finished tasks that are already
+        in the database (or earlier in tasks), e.g. when ingesting a log
+        again: 'insert' them anyway (which fails on the natural key of
+        start_ts, end_ts and description), 'skip' those with the same
+        natural key, or 'update' those that start at the same time as an
+        existing task, replacing it if its end_ts or description changed.
+        Either way, word totals only change for new and replaced tasks.
+        '''
+        if on_duplicate not in ON_DUPLICATE:
+            raise ValueError(f'invalid on_duplicate: {on_duplicate!r}')
+        started = time.perf_counter()
+        stats = models.LoadStats()
+
+        tbl = self.tbl_words
+        word_ids: dict[str, int] = dict(
+            self.conn.execute(sa.select([tbl.c.word, tbl.c.word_id])).fetchall())
+
+        descs: dict[str, _Description] = {}
+        tbl = self.tbl_descriptions
+        for row in self.conn.execute(tbl.select()):
+            descs[row.description] = _Description(
+                row.description_id,
+                None if row.word_ids is None else wordsql.parse_word_ids(row.word_ids))
+
+        # Assign task IDs ourselves, since executemany() cannot tell us
+        # what SQLite picked.
+        tbl = self.tbl_tasks
+        max_id = self.conn.execute(sa.select([sa.func.max(tbl.c.task_id)])).scalar()
+        next_task_id = (max_id or 0) + 1
+
+        for chunk in _chunked(tasks, chunk_size):
+            if on_duplicate != 'insert':
+                chunk = self._dedupe_chunk(
+                    chunk, on_duplicate, word_ids, descs, stats)
+                if not chunk:
+                    continue
+            next_task_id = self._load_chunk(chunk, next_task_id, word_ids, descs, stats)
+
+        stats.seconds = time.perf_counter() - started
+        return stats
+
+    def _dedupe_chunk(
+            self,
+            chunk: list[models.Task],
+            on_duplicate: str,
+            word_ids: dict[str, int],
+            descs: dict[str, _Description],
+            stats: models.LoadStats) -> list[models.Task]:
+        '''Drop the tasks of chunk that bulk_load() should skip, and remove
+        the tasks that it should replace from the database (giving their
+        task_id to the replacement). Return the tasks left to load.
+
+        Existing tasks are found with one range scan of ix_tasks_start_ts
+        covering the whole chunk.
+        '''
+        # natural keys of the finished tasks of chunk; a description that
+        # is not in the database yet has no ID, but is still a duplicate
+        # if an earlier task of chunk has it
+        chunk_keys: list[Optional[tuple]] = []
+        for task in chunk:
+            if task.start_ts is None or task.end_ts is None:
+                chunk_keys.append(None)
+                continue
+            desc = descs.get(task.description)
+            chunk_keys.append((
+                _naive_utc(task.start_ts), _naive_utc(task.end_ts),
+                task.description if desc is None else desc.description_id))
+        finished = [key[0] for key in chunk_keys if key is not None]
+        if not finished:
+            return chunk
+
+        # tasks already there, by natural key and by start_ts
+        tasks = self.tbl_tasks
+        result = self.conn.execute(
+            sa.select([tasks.c.task_id, tasks.c.start_ts, tasks.c.end_ts,
+                       tasks.c.description_id])
+            .where(tasks.c.start_ts >= min(finished))
+            .where(tasks.c.start_ts <= max(finished))
+            .where(tasks.c.end_ts.isnot(None)))
+        keys: set[tuple] = set()
+        starts: dict[datetime.datetime, tuple[int, tuple]] = {}
+        for (task_id, start_ts, end_ts, description_id) in result:
+            keys.add((start_ts, end_ts, description_id))
+            starts[start_ts] = (task_id, (start_ts, end_ts, description_id))
+
+        load = []
+        replaced = []
+        for (task, key) in zip(chunk, chunk_keys):
+            if key is None:
+                load.append(task)
+                continue
+            if key in keys:
+                stats.skipped += 1
+                continue
+            keys.add(key)
+            if on_duplicate == 'update' and key[0] in starts:
+                (task_id, old_key) = starts.pop(key[0])
+                keys.discard(old_key)
+                task = dataclasses.replace(task, task_id=task_id)
+                replaced.append(task_id)
+                stats.updated += 1
+            load.append(task)
+
+        unused = self.delete_tasks(replaced, stats)
+        if unused:
+            # forget the words that are gone, and the word_ids of the
+            # descriptions that had them, so that _load_chunk() adds them
+            # again if need be
+            for word in [word for (word, word_id) in word_ids.items()
+                         if word_id in unused]:
+                del word_ids[word]
+            for desc in descs.values():
+                if desc.word_ids is not None and unused.intersection(desc.word_ids):
+                    desc.word_ids = None
+        return load
+
+    def delete_tasks(
+            self,
+            task_ids: list[int],
+            stats: Optional[models.LoadStats] = None) -> set[int]:
+        '''Delete tasks, taking their words out of the word totals.
+
+        Return the word_ids of the words that no task has any more, which
+        are deleted too (see drop_unused_words()).
+        '''
+        stats = stats or models.LoadStats()
+        if not task_ids:
+            return set()
+        tasks = self.tbl_tasks
+        task_words = self.tbl_task_words
+        result = self.conn.execute(
+            sa.select([
+                tasks.c.task_id,
+                sa.func.date(tasks.c.start_ts),
+                _elapsed_seconds(tasks),
+                task_words.c.word_id,
+            ])
+            .select_from(tasks.join(task_words))
+            .where(tasks.c.task_id.in_(task_ids))
+            .order_by(tasks.c.task_id, task_words.c.word_id))
+        task_words_rows = [
+            (task_id, elapsed, datetime.date.fromisoformat(day),
+             [row.word_id for row in rows])
+            for ((task_id, day, elapsed), rows) in itertools.groupby(
+                result.fetchall(), key=lambda row: tuple(row[:3]))]
+        self._apply_word_deltas(task_words_rows, -1, stats)
+
+        for tbl in (task_words, tasks):
+            self.conn.execute(tbl.delete().where(tbl.c.task_id.in_(task_ids)))
+        stats.rows += len(task_ids)
+
+        # like rebuild_words(), keep no words for zero tasks
+        return self.drop_unused_words(
+            {word_id for (_, _, _, ids) in task_words_rows for word_id in ids})
+
+    def drop_unused_words(self, word_ids: Optional[Iterable[int]] = None) -> set[int]:
+        '''Delete the words (of word_ids, or all of them) whose total_count
+        is 0, i.e. that no finished task has. Return their word_ids.
 
+        Descriptions with those words have no finished tasks either; their
+        word_ids are reset, so that the next task to use one records its
+        words afresh.
+        '''
         tbl = self.tbl_words
-        old_words = set(words) - new_words.keys()
-        for word in old_words:
+        stmt = sa.select([tbl.c.word_id]).where(tbl.c.total_count == 0)
+        if word_ids is None:
+            unused = {row.word_id for row in self.conn.execute(stmt)}
+        else:
+            unused = set()
+            for chunk in _chunked(word_ids, 500):
+                unused.update(
+                    row.word_id for row in self.conn.execute(
+                        stmt.where(tbl.c.word_id.in_(chunk))))
+        if not unused:
+            return unused
+
+        descs = self.tbl_descriptions
+        result = self.conn.execute(
+            sa.select([descs.c.description_id, descs.c.word_ids])
+            .where(descs.c.word_ids.isnot(None)))
+        stale = [
+            {'d_description_id': row.description_id}
+            for row in result.fetchall()
+            if unused.intersection(wordsql.parse_word_ids(row.word_ids))]
+        if stale:
+            self.conn.execute(
+                descs.update()
+                .values(word_ids=None)
+                .where(descs.c.description_id == sa.bindparam('d_description_id')),
+                stale)
+
+        self.conn.execute(
+            tbl.delete().where(tbl.c.word_id == sa.bindparam('d_word_id')),
+            [{'d_word_id': word_id} for word_id in unused])
+        return unused
+
+    def _load_chunk(
+            self,
+            chunk: list[models.Task],
+            next_task_id: int,
+            word_ids: dict[str, int],
+            descs: dict[str, _Description],
+            stats: models.LoadStats) -> int:
+        '''write one chunk of bulk_load(); return the next free task_id'''
+        # Only tokenize a description the first time a finished task
+        # uses it: after that, its word_ids are known.
+        new_descs: list[str] = []
+        tokenized: dict[str, set[str]] = {}
+        for task in chunk:
+            desc = descs.get(task.description)
+            if desc is None:
+                desc = descs[task.description] = _Description(None, None)
+                new_descs.append(task.description)
+            if (task.end_ts is not None and
+                    desc.word_ids is None and
+                    task.description not in tokenized):
+                tokenized[task.description] = set(
+                    models.split_description(task.description))
+
+        # Insert words never seen before with zero totals, then look up
+        # their IDs in one query.
+        unknown: set[str] = set()
+        for words in tokenized.values():
+            unknown.update(word for word in words if word not in word_ids)
+        if unknown:
+            self.conn.execute(
+                'insert into words (word, total_count, total_elapsed)'
+                ' values (?, 0, 0) on conflict do nothing',
+                [(word,) for word in unknown])
+            tbl = self.tbl_words
+            result = self.conn.execute(
+                sa.select([tbl.c.word, tbl.c.word_id])
+                .where(tbl.c.word.in_(unknown)))
+            word_ids.update(result.fetchall())
+            stats.rows += len(unknown)
+
+        # Record the word_ids of newly tokenized descriptions, inserting
+        # new descriptions along the way.
+        updated_descs = []
+        for (description, words) in tokenized.items():
+            desc = descs[description]
+            desc.word_ids = sorted(word_ids[word] for word in words)
+            if desc.description_id is not None:
+                updated_descs.append({
+                    'd_description_id': desc.description_id,
+                    'd_word_ids': wordsql.format_word_ids(desc.word_ids),
+                })
+
+        if new_descs:
+            tbl = self.tbl_descriptions
+            self.conn.execute(
+                tbl.insert(),
+                [{'description': description,
+                  'word_ids': _format_word_ids(descs[description].word_ids)}
+                 for description in new_descs])
+            result = self.conn.execute(
+                sa.select([tbl.c.description, tbl.c.description_id])
+                .where(tbl.c.description.in_(new_descs)))
+            for (description, description_id) in result:
+                descs[description].description_id = description_id
+            stats.rows += len(new_descs)
+
+        if updated_descs:
+            tbl = self.tbl_descriptions
+            self.conn.execute(
+                tbl.update()
+                .values(word_ids=sa.bindparam('d_word_ids'))
+                .where(tbl.c.description_id == sa.bindparam('d_description_id')),
+                updated_descs)
+            stats.rows += len(updated_descs)
+
+        task_rows = []
+        task_words: list[tuple[int, int, datetime.date, list[int]]] = []
+        for task in chunk:
+            task_id = next_task_id if task.task_id is None else task.task_id
+            next_task_id = max(next_task_id, task_id + 1)
+            desc = descs[task.description]
+            task_rows.append({
+                'task_id': task_id,
+                't_update_ts': task.update_ts,
+                'start_ts': task.start_ts,
+                'end_ts': task.end_ts,
+                'description_id': desc.description_id,
+            })
+            if task.end_ts is not None:
+                # same as add_task(): words of unfinished tasks are only
+                # recorded by end_last_task()
+                assert task.start_ts is not None and desc.word_ids is not None
+                elapsed = models.elapsed_seconds(task.start_ts, task.end_ts)
+                task_words.append(
+                    (task_id, elapsed, _utc_date(task.start_ts), desc.word_ids))
+
+        self.conn.execute(
+            self.tbl_tasks.insert().values(update_ts=sa.func.coalesce(
+                sa.bindparam('t_update_ts', type_=sa.DateTime),
+                sa.text('datetime()'))),
+            task_rows)
+        stats.tasks += len(task_rows)
+        stats.rows += len(task_rows)
+
+        assoc_rows = [
+            {'task_id': task_id, 'word_id': word_id}
+            for (task_id, _, _, ids) in task_words for word_id in ids]
+        if assoc_rows:
+            self.conn.execute(self.tbl_task_words.insert(), assoc_rows)
+            stats.rows += len(assoc_rows)
+
+        self._apply_word_deltas(task_words, 1, stats)
+        return next_task_id
+
+    def _apply_word_deltas(
+            self,
+            task_words: list[tuple[int, int, datetime.date, list[int]]],
+            sign: int,
+            stats: models.LoadStats):
+        '''Add (sign 1) or subtract (sign -1) the (task_id, elapsed, day,
+        word_ids) of tasks to or from the word totals, overall, per day and
+        per pair, aggregated into one delta per row.'''
+        deltas: dict[int, list[int]] = {}
+        daily_deltas: dict[tuple[datetime.date, int], list[int]] = {}
+        pair_deltas: dict[tuple[int, int], list[int]] = {}
+        for (_, elapsed, day, ids) in task_words:
+            for word_id in ids:
+                for delta in (deltas.setdefault(word_id, [0, 0]),
+                              daily_deltas.setdefault((day, word_id), [0, 0])):
+                    delta[0] += sign
+                    delta[1] += sign * elapsed
+            for pair in wordsql.word_pairs(ids, self.pair_cap):
+                delta = pair_deltas.setdefault(pair, [0, 0])
+                delta[0] += sign
+                delta[1] += sign * elapsed
+
+        if deltas:
+            tbl = self.tbl_words
             self.conn.execute(
                 tbl.update()
                 .values(
-                    total_count=sa.text('total_count + 1'),
-                    total_elapsed=tbl.c.total_elapsed + elapsed,
+                    total_count=tbl.c.total_count + sa.bindparam('d_count'),
+                    total_elapsed=tbl.c.total_elapsed + sa.bindparam('d_elapsed'),
                 )
-                .where(tbl.c.word == word),
-            )
+                .where(tbl.c.word_id == sa.bindparam('d_word_id')),
+                [{'d_word_id': word_id, 'd_count': count, 'd_elapsed': elapsed}
+                 for (word_id, (count, elapsed)) in deltas.items()])
+            stats.rows += len(deltas)
 
-        # Update task_words to associate all words with task_id.
-        word_ids: set[int] = set(new_words.values())
-        existing_words = set(words) - new_words.keys()
-        if existing_words:
-            rows = self.conn.execute(
-                tbl
-                .select()
-                .where(tbl.c.word.in_(existing_words))
-            )
-            for row in rows:
-                word_ids.add(row.word_id)
-
-        insert = self.tbl_task_words.insert()
-        values = [{'task_id': task_id, 'word_id': word_id}
-                  for word_id in word_ids]
-        self.conn.execute(insert, values)
+        if daily_deltas:
+            daily_rows = [(day.isoformat(), word_id, count, elapsed)
+                          for ((day, word_id), (count, elapsed)) in daily_deltas.items()]
+            self.conn.execute(wordsql.upsert_word_daily_sql(1), daily_rows)
+            stats.rows += len(daily_deltas)
+            if sign < 0:
+                # like rebuild_rollups(), keep no rows for zero tasks
+                self.conn.execute(
+                    'delete from word_daily'
+                    ' where day = ? and word_id = ? and total_count = 0',
+                    [row[:2] for row in daily_rows])
 
-        return new_words
+        if pair_deltas:
+            pair_rows = [(id_a, id_b, count, elapsed)
+                         for ((id_a, id_b), (count, elapsed)) in pair_deltas.items()]
+            self.conn.execute(wordsql.upsert_word_pairs_sql(1), pair_rows)
+            stats.rows += len(pair_deltas)
+            if sign < 0:
+                self.conn.execute(
+                    'delete from word_pairs'
+                    ' where word_id_a = ? and word_id_b = ? and total_count = 0',
+                    [row[:2] for row in pair_rows])
 
-    def list_tasks(self):
-        stmt = self.tbl_tasks.select()
+    def list_tasks(
+            self,
+            after: Optional[int] = None,
+            limit: Optional[int] = None) -> list[models.Task]:
+        '''Return tasks in task_id order: all of them, or (to fetch them
+        a page at a time) up to limit tasks with task_id > after.'''
+        stmt = self._select_tasks().limit(limit)
+        if after is not None:
+            stmt = stmt.where(self.tbl_tasks.c.task_id > after)
         rows = self.conn.execute(stmt)
         return [self.load_task(row) for row in rows]
 
+    def iter_tasks(
+            self,
+            since: Optional[datetime.datetime] = None,
+            until: Optional[datetime.datetime] = None,
+            limit: Optional[int] = None,
+            page_size: int = 1000) -> Iterator[models.Task]:
+        '''Yield tasks that started in [since, until), in task_id order,
+        up to limit of them.
+
+        Tasks are fetched page_size at a time (see _task_pages()).
+        '''
+        for rows in self._task_pages(
+                self._select_tasks(), since, until, limit, page_size):
+            for row in rows:
+                yield self.load_task(row)
+
+    def iter_task_records(
+            self,
+            since: Optional[datetime.datetime] = None,
+            until: Optional[datetime.datetime] = None,
+            limit: Optional[int] = None,
+            page_size: int = 1000) -> Iterator[dict]:
+        '''Like iter_tasks(), but yield dicts ready to encode as JSON, with
+        timestamps as ISO 8601 UTC strings.
+
+        SQLite formats the timestamps as part of the query, so there is
+        no per-row datetime parsing and strftime() in Python.
+        '''
+        tasks = self.tbl_tasks
+        stmt = sa.select([
+            tasks.c.task_id,
+            _iso_timestamp(tasks.c.update_ts).label('update_ts'),
+            _iso_timestamp(tasks.c.start_ts).label('start_ts'),
+            _iso_timestamp(tasks.c.end_ts).label('end_ts'),
+            self.tbl_descriptions.c.description,
+        ]).select_from(tasks.join(self.tbl_descriptions)).order_by(tasks.c.task_id)
+        for rows in self._task_pages(stmt, since, until, limit, page_size):
+            yield from map(dict, rows)
+
+    def _task_pages(
+            self,
+            stmt: sa.sql.Select,
+            since: Optional[datetime.datetime],
+            until: Optional[datetime.datetime],
+            limit: Optional[int],
+            page_size: int) -> Iterator[list]:
+        '''Yield the rows of stmt (which must select task_id from tasks,
+        in task_id order) for tasks that started in [since, until), a page
+        of rows at a time, up to limit rows in all.
+
+        Each page starts after the last task_id of the one before, so
+        memory use does not grow with the size of the history and each
+        page is a primary key range scan.
+        '''
+        tasks = self.tbl_tasks
+        if since is not None:
+            stmt = stmt.where(tasks.c.start_ts >= since)
+        if until is not None:
+            stmt = stmt.where(tasks.c.start_ts < until)
+
+        after = None
+        while limit is None or limit > 0:
+            size = page_size if limit is None else min(page_size, limit)
+            page = stmt.limit(size)
+            if after is not None:
+                page = page.where(tasks.c.task_id > after)
+            # fetch the whole page, so no cursor is left open between
+            # yields (the caller may write to the database meanwhile)
+            rows = self.conn.execute(page).fetchall()
+            if rows:
+                yield rows
+            if len(rows) < size:
+                return
+            after = rows[-1].task_id
+            if limit is not None:
+                limit -= len(rows)
+
+    def _select_tasks(self, from_=None) -> sa.sql.Select:
+        '''select the columns of models.Task from tasks (or from from_,
+        which must join tasks and descriptions)'''
+        tasks = self.tbl_tasks
+        descs = self.tbl_descriptions
+        if from_ is None:
+            from_ = tasks.join(descs)
+        return (
+            sa.select([
+                tasks.c.task_id,
+                tasks.c.update_ts,
+                tasks.c.start_ts,
+                tasks.c.end_ts,
+                descs.c.description,
+            ])
+            .select_from(from_)
+            .order_by(tasks.c.task_id)
+        )
+
+    def search_tasks(
+            self,
+            query: str,
+            since: Optional[datetime.datetime] = None,
+            until: Optional[datetime.datetime] = None,
+            order_by: str = 'rank',
+            limit: Optional[int] = None) -> list[models.Task]:
+        '''Return tasks whose description matches query (in SQLite FTS5
+        syntax) and that started in [since, until).
+
+        order_by is 'rank' (best match first) or 'elapsed' (longest
+        first).
+        '''
+        tasks = self.tbl_tasks
+        descs = self.tbl_descriptions
+        fts = sa.table('descriptions_fts', sa.column('rowid'), sa.column('rank'))
+        order_map = {
+            'rank': fts.c.rank,
+            'elapsed': _elapsed_seconds(tasks).desc(),
+        }
+
+        # The index covers distinct descriptions, so find those first and
+        # then the tasks that use them.
+        stmt = (
+            self._select_tasks(
+                fts
+                .join(descs, descs.c.description_id == fts.c.rowid)
+                .join(tasks))
+            .where(sa.text('descriptions_fts match :query').bindparams(query=query))
+            .order_by(None)
+            .order_by(order_map[order_by], tasks.c.task_id)
+            .limit(limit)
+        )
+        if since is not None:
+            stmt = stmt.where(tasks.c.start_ts >= since)
+        if until is not None:
+            stmt = stmt.where(tasks.c.start_ts < until)
+
+        return [self.load_task(row) for row in self.conn.execute(stmt)]
+
+    def get_recent_tasks(
+            self,
+            since: datetime.datetime,
+            limit: int = 500) -> list[models.Task]:
+        '''Return up to limit tasks that started at or after since, most
+        recent first.
+
+        This is a range scan of ix_tasks_start_ts, so it costs the same
+        however much history is in the database.
+        '''
+        tasks = self.tbl_tasks
+        stmt = (
+            self._select_tasks()
+            .where(tasks.c.start_ts >= since)
+            .order_by(None)
+            .order_by(tasks.c.start_ts.desc())
+            .limit(limit)
+        )
+        return [self.load_task(row) for row in self.conn.execute(stmt)]
+
+    def tasks_at(self, ts: datetime.datetime) -> list[models.Task]:
+        '''Return the tasks that were going on at ts: usually one, or none
+        in a gap, but more where tasks overlap.'''
+        return self.tasks_overlapping(ts, ts)
+
+    def tasks_overlapping(
+            self,
+            start: datetime.datetime,
+            end: datetime.datetime) -> list[models.Task]:
+        '''Return the tasks whose span [start_ts, end_ts) overlaps [start,
+        end], in start_ts order (unfinished tasks are still going on).
+
+        Candidates come from a search of tasks_rtree, so this takes time
+        logarithmic in the number of tasks, plus the number found.
+        '''
+        (start, end) = (_naive_utc(start), _naive_utc(end))
+        tasks = self.tbl_tasks
+        rtree = self.tbl_tasks_rtree
+        candidates = (
+            sa.select([rtree.c.task_id])
+            .where(rtree.c.start_s <= _epoch_seconds(end))
+            .where(rtree.c.end_s >= _epoch_seconds(start))
+        )
+        stmt = (
+            self._select_tasks()
+            .where(tasks.c.task_id.in_(candidates))
+            .where(tasks.c.start_ts <= end)
+            .where(sa.or_(tasks.c.end_ts > start, tasks.c.end_ts.is_(None)))
+            .order_by(None)
+            .order_by(tasks.c.start_ts, tasks.c.task_id)
+        )
+        return [self.load_task(row) for row in self.conn.execute(stmt)]
+
+    def find_overlaps(
+            self,
+            since: Optional[datetime.datetime] = None,
+            until: Optional[datetime.datetime] = None,
+    ) -> list[tuple[models.Task, models.Task]]:
+        '''Return the pairs of tasks whose spans overlap, where the first
+        one started in [since, until) and no later than the second.
+
+        Each task in the window is joined with its candidates from
+        tasks_rtree, so this takes time proportional to the tasks in the
+        window (times a logarithm), not to the square of them.
+        '''
+        # CROSS JOIN makes SQLite keep this join order: otherwise it may
+        # scan all of tasks_rtree and look up the window for each entry
+        a_start_s = migrations.epoch_seconds_sql('a.start_ts')
+        a_end_s = migrations.epoch_seconds_sql('a.end_ts')
+        stmt = sa.text(f'''
+            select a.task_id, b.task_id
+            from tasks a
+            cross join tasks_rtree r
+            cross join tasks b
+            where a.start_ts >= :since and a.start_ts < :until
+            and r.start_s <= coalesce({a_end_s}, {migrations.OPEN_END})
+            and r.end_s >= {a_start_s}
+            and b.task_id = r.task_id
+            and (b.start_ts < a.end_ts or a.end_ts is null)
+            and (b.end_ts > a.start_ts or b.end_ts is null)
+            and (b.start_ts > a.start_ts or
+                 (b.start_ts = a.start_ts and b.task_id > a.task_id))
+            order by a.start_ts, a.task_id, b.start_ts, b.task_id
+            ''').bindparams(
+                sa.bindparam('since', type_=sa.DateTime),
+                sa.bindparam('until', type_=sa.DateTime))
+        params = {
+            'since': datetime.datetime.min if since is None else _naive_utc(since),
+            'until': datetime.datetime.max if until is None else _naive_utc(until),
+        }
+        pairs = self.conn.execute(stmt, params).fetchall()
+
+        task_ids = {task_id for pair in pairs for task_id in pair}
+        tasks: dict[int, models.Task] = {}
+        for chunk in _chunked(task_ids, 500):
+            result = self.conn.execute(
+                self._select_tasks().where(self.tbl_tasks.c.task_id.in_(chunk)))
+            for row in result:
+                tasks[row.task_id] = self.load_task(row)
+        return [(tasks[id_a], tasks[id_b]) for (id_a, id_b) in pairs]
+
     def get_task_dates(self) -> list[datetime.datetime]:
         '''return the list of distinct dates on which a task started'''
         tbl = self.tbl_tasks
@@ -242,6 +1003,14 @@ class WastedYearsDB:
         return [row[0] for row in result]
 
     def list_words(self, order_by: str) -> list[models.WordInfo]:
+        return list(self.iter_words(order_by))
+
+    def iter_words(self, order_by: str) -> Iterator[models.WordInfo]:
+        '''Yield all words, like list_words(), straight from the cursor.
+
+        The statement stays open until the iterator is exhausted or
+        closed, so do not write to the database while iterating.
+        '''
         tbl = self.tbl_words
         order_map = {
             'i': tbl.c.word_id,
@@ -260,52 +1029,573 @@ class WastedYearsDB:
             tbl.c.total_elapsed,
         ]
 
-        result = self.conn.execute(
+        result = self.conn.execution_options(stream_results=True).execute(
             sa.select(columns).order_by(*order_cols))
-        return [models.WordInfo(**row) for row in result]
+        with contextlib.closing(result):
+            for row in result:
+                yield models.WordInfo(**row)
 
     def get_word_report(
             self,
-            start_ts: datetime.datetime,
-            end_ts: datetime.datetime) -> dict[str, models.WordInfo]:
+            start_ts: datetime.date,
+            end_ts: datetime.date) -> dict[str, models.WordInfo]:
+        '''Report count and elapsed time per word for tasks that started
+        in [start_ts, end_ts).
+
+        This sums the per-day rollup, so both bounds are truncated to
+        whole (UTC) days.
+        '''
+        daily = self.tbl_word_daily
+        words = self.tbl_words
         result = self.conn.execute(
             sa.select([
-                self.tbl_tasks.c.start_ts,
-                self.tbl_tasks.c.end_ts,
-                self.tbl_task_words.c.word_id,
-                self.tbl_words.c.word,
+                words.c.word_id,
+                words.c.word,
+                sa.func.sum(daily.c.total_count).label('total_count'),
+                sa.func.sum(daily.c.total_elapsed).label('total_elapsed'),
             ])
-            .select_from(
-                self.tbl_tasks
-                .join(self.tbl_task_words)
-                .join(self.tbl_words)
-            )
+            .select_from(daily.join(words))
             .where(sa.and_(
-                self.tbl_tasks.c.start_ts >= start_ts,
-                self.tbl_tasks.c.start_ts < end_ts,
+                daily.c.day >= _utc_date(start_ts),
+                daily.c.day < _utc_date(end_ts),
             ))
+            .group_by(words.c.word_id)
+        )
+        return {row.word: models.WordInfo(**row) for row in result}
+
+    def get_bucket_versions(
+            self,
+            bucket: str,
+            since: Optional[datetime.datetime] = None,
+            until: Optional[datetime.datetime] = None,
+    ) -> dict[datetime.date, int]:
+        '''Return the data version of each day, week or month (bucket) that
+        has (or had) words in [since, until), truncated to whole days.
+
+        The version of a bucket is the sum of the versions of its days,
+        so it changes whenever word_daily changes on any of them.
+        '''
+        tbl = self.tbl_data_versions
+        bucket_start = sa.func.date(tbl.c.day, *self.bucket_modifiers[bucket],
+                                    type_=sa.Date)
+        stmt = (
+            sa.select([bucket_start.label('bucket'), sa.func.sum(tbl.c.version)])
+            .group_by(sa.text('bucket'))
+        )
+        if since is not None:
+            stmt = stmt.where(tbl.c.day >= _utc_date(since))
+        if until is not None:
+            stmt = stmt.where(tbl.c.day < _utc_date(until))
+        return dict(self.conn.execute(stmt).fetchall())
+
+    def iter_word_report(
+            self,
+            bucket: str,
+            since: Optional[datetime.datetime] = None,
+            until: Optional[datetime.datetime] = None,
+    ) -> Iterator[tuple[datetime.date, list[models.WordInfo]]]:
+        '''Report count and elapsed time per word for each day, week, or
+        month (bucket) with tasks that started in [since, until).
+
+        This is a single grouped query over the per-day rollup, so since
+        and until are truncated to whole (UTC) days. Yields
+        (bucket_start, words) in bucket order, with words sorted by
+        descending elapsed, count.
+        '''
+        daily = self.tbl_word_daily
+        words = self.tbl_words
+
+        modifiers = self.bucket_modifiers[bucket]
+        bucket_start = sa.func.date(daily.c.day, *modifiers, type_=sa.Date)
+        elapsed = sa.func.sum(daily.c.total_elapsed)
+        count = sa.func.sum(daily.c.total_count)
+
+        stmt = (
+            sa.select([
+                bucket_start.label('bucket'),
+                words.c.word_id,
+                words.c.word,
+                count.label('total_count'),
+                elapsed.label('total_elapsed'),
+            ])
+            .select_from(daily.join(words))
+            .group_by(sa.text('bucket'), words.c.word_id)
+            .order_by(sa.text('bucket'), elapsed.desc(), count.desc(), words.c.word)
+        )
+        if since is not None:
+            stmt = stmt.where(daily.c.day >= _utc_date(since))
+        if until is not None:
+            stmt = stmt.where(daily.c.day < _utc_date(until))
+
+        result = self.conn.execute(stmt)
+        for (bucket_date, rows) in itertools.groupby(result, lambda row: row.bucket):
+            yield (bucket_date, [
+                models.WordInfo(
+                    word_id=row.word_id,
+                    word=row.word,
+                    total_count=row.total_count,
+                    total_elapsed=row.total_elapsed,
+                )
+                for row in rows
+            ])
+
+    def iter_focus_report(
+            self,
+            bucket: str,
+            since: Optional[datetime.datetime] = None,
+            until: Optional[datetime.datetime] = None,
+            max_gap: int = 300,
+    ) -> Iterator[models.FocusInfo]:
+        '''Report task switches, focus streaks and gaps for each day, week
+        or month (bucket) with finished tasks that started in [since,
+        until), in bucket order.
+
+        Only consecutive tasks on the same (UTC) day are compared, so the
+        night is neither a switch nor a gap. Gaps of more than max_gap
+        seconds are untracked time rather than recording overhead.
+
+        This is a single query: LAG() compares each task with the one
+        before it, in the order of ix_tasks_start_ts (so without sorting),
+        and a running SUM() numbers the runs of tasks with the same
+        description.
+        '''
+        # timestamps are parsed once per row, into seconds since the epoch,
+        # so that day numbers and gaps are integer arithmetic
+        tasks = self.tbl_tasks
+        order = [tasks.c.start_ts, tasks.c.end_ts, tasks.c.task_id]
+        start_s = sa.cast(sa.func.strftime('%s', tasks.c.start_ts), sa.Integer)
+        end_s = sa.cast(sa.func.strftime('%s', tasks.c.end_ts), sa.Integer)
+        stmt = (
+            sa.select([
+                sa.func.row_number().over(order_by=order).label('seq'),
+                tasks.c.description_id,
+                start_s.label('start_s'),
+                end_s.label('end_s'),
+                sa.func.lag(start_s).over(order_by=order).label('prev_start_s'),
+                sa.func.lag(end_s).over(order_by=order).label('prev_end_s'),
+                sa.func.lag(tasks.c.description_id).over(order_by=order)
+                .label('prev_description_id'),
+            ])
+            .where(tasks.c.end_ts.isnot(None))
+        )
+        if since is not None:
+            stmt = stmt.where(tasks.c.start_ts >= since)
+        if until is not None:
+            stmt = stmt.where(tasks.c.start_ts < until)
+        steps = stmt.cte('steps')
+
+        same_day = sa.func.coalesce(
+            steps.c.prev_start_s / 86400 == steps.c.start_s / 86400, False)
+        gap = sa.case([(same_day, steps.c.start_s - steps.c.prev_end_s)], else_=0)
+        same_description = steps.c.prev_description_id == steps.c.description_id
+        # a run of tasks ends with a switch, a long gap, or the day
+        new_run = sa.case(
+            [(sa.and_(same_day, same_description, gap <= max_gap), 0)], else_=1)
+        runs = sa.select([
+            (steps.c.start_s / 86400).label('day_number'),
+            (steps.c.end_s - steps.c.start_s).label('elapsed'),
+            gap.label('gap'),
+            sa.case([(sa.and_(same_day, sa.not_(same_description)), 1)],
+                    else_=0).label('switch'),
+            sa.func.sum(new_run).over(order_by=steps.c.seq, rows=(None, 0)).label('run'),
+        ]).cte('runs')
+
+        run_gap = runs.c.gap
+        overhead = sa.and_(run_gap > 0, run_gap <= max_gap)
+        per_run = (
+            sa.select([
+                sa.func.min(runs.c.day_number).label('day_number'),
+                sa.func.count().label('tasks'),
+                sa.func.sum(runs.c.switch).label('switches'),
+                sa.func.sum(runs.c.elapsed).label('streak'),
+                sa.func.sum(sa.case([(overhead, 1)], else_=0)).label('gap_count'),
+                sa.func.sum(sa.case([(overhead, run_gap)], else_=0)).label('gap_total'),
+                sa.func.max(sa.case([(overhead, run_gap)], else_=0)).label('longest_gap'),
+                sa.func.sum(sa.case([(run_gap > max_gap, run_gap)], else_=0))
+                .label('untracked'),
+            ])
+            .group_by(runs.c.run)
+        ).cte('per_run')
+
+        modifiers = self.bucket_modifiers[bucket]
+        bucket_start = sa.func.date(
+            per_run.c.day_number * 86400, 'unixepoch', *modifiers, type_=sa.Date)
+        result = self.conn.execute(
+            sa.select([
+                bucket_start.label('bucket'),
+                sa.func.sum(per_run.c.tasks),
+                sa.func.sum(per_run.c.switches),
+                sa.func.max(per_run.c.streak),
+                sa.func.sum(per_run.c.gap_count),
+                sa.func.sum(per_run.c.gap_total),
+                sa.func.max(per_run.c.longest_gap),
+                sa.func.sum(per_run.c.untracked),
+            ])
+            .group_by(sa.text('bucket'))
+            .order_by(sa.text('bucket'))
         )
-        word_map: dict[str, models.WordInfo] = {}
         for row in result:
-            word_info = word_map.get(row.word)
-            if word_info is None:
-                word_info = word_map[row.word] = models.WordInfo(word=row.word)
+            yield models.FocusInfo(*row)
+
+    def rebuild_rollups(self):
+        '''regenerate the word_daily rollup from tasks and task_words'''
+        tasks = self.tbl_tasks
+        task_words = self.tbl_task_words
+        daily = self.tbl_word_daily
+
+        self.conn.execute(daily.delete())
+        self.conn.execute(
+            daily.insert().from_select(
+                ['day', 'word_id', 'total_count', 'total_elapsed'],
+                sa.select([
+                    sa.func.date(tasks.c.start_ts),
+                    task_words.c.word_id,
+                    sa.func.count(),
+                    sa.func.sum(_elapsed_seconds(tasks)),
+                ])
+                .select_from(tasks.join(task_words))
+                .group_by(sa.func.date(tasks.c.start_ts), task_words.c.word_id)
+            )
+        )
+
+    def check_rollups(self) -> list[str]:
+        '''Compare the word_daily rollup with the overall totals in words.
+
+        Return a list of human-readable problems (empty if consistent).
+        '''
+        words = self.tbl_words
+        daily = self.tbl_word_daily
+        daily_count = sa.func.coalesce(sa.func.sum(daily.c.total_count), 0)
+        daily_elapsed = sa.func.coalesce(sa.func.sum(daily.c.total_elapsed), 0)
+        result = self.conn.execute(
+            sa.select([
+                words.c.word,
+                words.c.total_count,
+                words.c.total_elapsed,
+                daily_count.label('daily_count'),
+                daily_elapsed.label('daily_elapsed'),
+            ])
+            .select_from(words.outerjoin(daily))
+            .group_by(words.c.word_id)
+            .having(sa.or_(
+                words.c.total_count != daily_count,
+                words.c.total_elapsed != daily_elapsed,
+            ))
+            .order_by(words.c.word)
+        )
+        return [
+            f'{row.word}: words has {row.total_count} tasks, '
+            f'{row.total_elapsed} s; word_daily has {row.daily_count} tasks, '
+            f'{row.daily_elapsed} s'
+            for row in result
+        ]
+
+    def rebuild_word_pairs(self):
+        '''regenerate word_pairs from tasks and task_words'''
+        # Same rule as wordsql.word_pairs(): only the pair_cap lowest
+        # word_ids of each task are paired up.
+        self.conn.execute(self.tbl_word_pairs.delete())
+        self.conn.execute(
+            sa.text('''
+            with capped as (
+                select task_id, word_id from (
+                    select task_id, word_id, row_number() over (
+                        partition by task_id order by word_id) as rank
+                    from task_words)
+                where rank <= :pair_cap
+            )
+            insert into word_pairs
+                (word_id_a, word_id_b, total_count, total_elapsed)
+            select a.word_id, b.word_id, count(*),
+                sum(strftime('%s', t.end_ts) - strftime('%s', t.start_ts))
+            from capped a
+            join capped b on b.task_id = a.task_id and b.word_id > a.word_id
+            join tasks t on t.task_id = a.task_id
+            group by a.word_id, b.word_id
+            '''),
+            {'pair_cap': self.pair_cap},
+        )
+
+    def rebuild_words(self, chunk_size: int = 1000, workers: Optional[int] = None):
+        '''Regenerate words and task_words from tasks, e.g. after the
+        tokenizer has changed, along with everything derived from them
+        (descriptions.word_ids, word_daily and word_pairs).
 
-            elapsed = (row.end_ts - row.start_ts).seconds
-            word_info.total_count += 1
-            word_info.total_elapsed += elapsed
+        Words that are still in use keep their word_id. Everything happens
+        in the current transaction, so other connections see either the
+        old tables or the new ones.
+        '''
+        (totals, desc_words) = self._recompute_words(chunk_size, workers)
+
+        tbl = self.tbl_words
+        old_ids = dict(
+            self.conn.execute(sa.select([tbl.c.word, tbl.c.word_id])).fetchall())
+        next_id = max(old_ids.values(), default=0) + 1
+        word_ids: dict[str, int] = {}
+        for word in totals:
+            if word in old_ids:
+                word_ids[word] = old_ids[word]
+            else:
+                word_ids[word] = next_id
+                next_id += 1
+
+        for derived in (self.tbl_word_pairs, self.tbl_word_daily,
+                        self.tbl_task_words, self.tbl_words):
+            self.conn.execute(derived.delete())
+
+        if totals:
+            self.conn.execute(
+                tbl.insert(),
+                [{'word_id': word_ids[word], 'word': word,
+                  'total_count': count, 'total_elapsed': elapsed}
+                 for (word, (count, elapsed)) in totals.items()])
+
+        descs = self.tbl_descriptions
+        self.conn.execute(descs.update().values(word_ids=None))
+        desc_ids = {
+            description_id: sorted(word_ids[word] for word in words)
+            for (description_id, words) in desc_words.items()}
+        if desc_ids:
+            self.conn.execute(
+                descs.update()
+                .values(word_ids=sa.bindparam('d_word_ids'))
+                .where(descs.c.description_id == sa.bindparam('d_description_id')),
+                [{'d_description_id': description_id,
+                  'd_word_ids': wordsql.format_word_ids(ids)}
+                 for (description_id, ids) in desc_ids.items()])
+
+        tasks = self.tbl_tasks
+        result = self.conn.execute(
+            sa.select([tasks.c.task_id, tasks.c.description_id])
+            .where(tasks.c.end_ts.isnot(None))).fetchall()
+        assoc_rows = (
+            (task_id, word_id)
+            for (task_id, description_id) in result
+            for word_id in desc_ids.get(description_id, []))
+        for chunk in _chunked(assoc_rows, chunk_size):
+            self.conn.execute(
+                'insert into task_words (task_id, word_id) values (?, ?)', chunk)
+
+        self.rebuild_rollups()
+        self.rebuild_word_pairs()
+
+    def check_words(
+            self,
+            chunk_size: int = 1000,
+            workers: Optional[int] = None,
+    ) -> list[str]:
+        '''Recompute word totals from tasks and compare them with words,
+        without writing anything.
+
+        Return a list of human-readable problems (empty if consistent).
+        '''
+        (totals, _) = self._recompute_words(chunk_size, workers)
+
+        tbl = self.tbl_words
+        result = self.conn.execute(
+            sa.select([tbl.c.word, tbl.c.total_count, tbl.c.total_elapsed]))
+        stored = {row.word: (row.total_count, row.total_elapsed) for row in result}
+
+        problems = []
+        for word in sorted(stored.keys() | totals.keys()):
+            (count, elapsed) = stored.get(word, (0, 0))
+            (expect_count, expect_elapsed) = totals.get(word, (0, 0))
+            if (count, elapsed) != (expect_count, expect_elapsed):
+                problems.append(
+                    f'{word}: words has {count} tasks, {elapsed} s; '
+                    f'tasks have {expect_count} tasks, {expect_elapsed} s')
+        return problems
+
+    def _recompute_words(
+            self,
+            chunk_size: int,
+            workers: Optional[int],
+    ) -> tuple[dict[str, tuple[int, int]], dict[int, list[str]]]:
+        '''Work out word totals from scratch.
 
-        return word_map
+        Descriptions of finished tasks are streamed in chunks of
+        chunk_size and split into words by a pool of workers processes
+        (or in this process, if workers is 1). The per-description task
+        counts and elapsed times, summed by SQLite, are then reduced into
+        per-word totals.
+
+        Return a map of word to (total_count, total_elapsed), and a map of
+        description_id to the distinct words of that description.
+        '''
+        tasks = self.tbl_tasks
+        descs = self.tbl_descriptions
+        result = self.conn.execute(
+            sa.select([
+                descs.c.description_id,
+                descs.c.description,
+                sa.func.count(),
+                sa.func.sum(_elapsed_seconds(tasks)),
+            ])
+            .select_from(descs.join(tasks))
+            .where(tasks.c.end_ts.isnot(None))
+            .group_by(descs.c.description_id)
+        )
+
+        totals: dict[str, tuple[int, int]] = {}
+        desc_words: dict[int, list[str]] = {}
+        for (chunk, words_of) in _split_chunks(_chunked(result, chunk_size), workers):
+            for ((description_id, _, count, elapsed), words) in zip(chunk, words_of):
+                desc_words[description_id] = words
+                for word in words:
+                    (word_count, word_elapsed) = totals.get(word, (0, 0))
+                    totals[word] = (word_count + count, word_elapsed + elapsed)
+        return (totals, desc_words)
+
+    def get_related_words(
+            self,
+            word: str,
+            limit: int = 10,
+            order_by: str = 'ec') -> list[models.WordInfo]:
+        '''Return the words that most often occur in the same task as word.
+
+        total_count and total_elapsed of the returned words are for the
+        tasks they share with word. order_by is like for list_words().
+        '''
+        words = self.tbl_words
+        pairs = self.tbl_word_pairs
+        word_id = self.conn.execute(
+            sa.select([words.c.word_id]).where(words.c.word == word)).scalar()
+        if word_id is None:
+            return []
+
+        # both halves are index lookups: on the primary key (a, b) and on
+        # ix_word_pairs_b (b, a)
+        partners = sa.union_all(
+            sa.select([
+                pairs.c.word_id_b.label('word_id'),
+                pairs.c.total_count,
+                pairs.c.total_elapsed,
+            ]).where(pairs.c.word_id_a == word_id),
+            sa.select([
+                pairs.c.word_id_a.label('word_id'),
+                pairs.c.total_count,
+                pairs.c.total_elapsed,
+            ]).where(pairs.c.word_id_b == word_id),
+        ).alias('partners')
+
+        order_map = {
+            'i': partners.c.word_id,
+            'w': words.c.word,
+            'c': partners.c.total_count.desc(),
+            'e': partners.c.total_elapsed.desc(),
+        }
+        result = self.conn.execute(
+            sa.select([
+                partners.c.word_id,
+                words.c.word,
+                partners.c.total_count,
+                partners.c.total_elapsed,
+            ])
+            .select_from(partners.join(words, words.c.word_id == partners.c.word_id))
+            .order_by(*(order_map[letter] for letter in order_by))
+            .limit(limit)
+        )
+        return [models.WordInfo(**row) for row in result]
 
     def load_task(self, row) -> models.Task:
-        task = models.Task(**row)
+        '''make a Task from a row of _select_tasks()'''
+        (task_id, update_ts, start_ts, end_ts, description) = row
+        return models.Task(
+            task_id, _utc(update_ts), _utc(start_ts), _utc(end_ts), description)
+
+
+@dataclasses.dataclass
+class _Description:
+    '''in-memory copy of a row of descriptions, for bulk_load()'''
+    description_id: Optional[int]
+    word_ids: Optional[list[int]]
+
+
+def _utc(value: Optional[datetime.datetime]) -> Optional[datetime.datetime]:
+    # SQLite has no knowledge of timezones, but we always write datetimes
+    # to the database in UTC. Make that explicit on the way back in.
+    return None if value is None else value.replace(tzinfo=datetime.timezone.utc)
+
+
+def _iso_timestamp(col: sa.Column) -> sa.sql.ColumnElement:
+    '''SQL expression formatting timestamp column col as ISO 8601 UTC (our
+    timestamps are truncated to the second)'''
+    return sa.func.strftime('%Y-%m-%dT%H:%M:%SZ', col)
+
+
+def _epoch_seconds(value: datetime.datetime) -> float:
+    '''return naive UTC value as seconds since the epoch, like tasks_rtree'''
+    return value.replace(tzinfo=datetime.timezone.utc).timestamp()
+
+
+def _naive_utc(value: datetime.datetime) -> datetime.datetime:
+    '''return value as naive UTC, as it is stored in the database'''
+    if value.tzinfo is datetime.timezone.utc:
+        return value.replace(tzinfo=None)
+    if value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _format_word_ids(word_ids: Optional[list[int]]) -> Optional[str]:
+    return None if word_ids is None else wordsql.format_word_ids(word_ids)
+
+
+def _elapsed_seconds(tbl: sa.Table) -> sa.sql.ColumnElement:
+    '''SQL expression for the elapsed time of a task, in seconds (see
+    models.elapsed_seconds())'''
+    return (sa.func.strftime('%s', tbl.c.end_ts) -
+            sa.func.strftime('%s', tbl.c.start_ts))
+
+
+def _utc_date(value: datetime.date) -> datetime.date:
+    '''return the UTC date of value (naive datetimes are already UTC)'''
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(datetime.timezone.utc)
+        return value.date()
+    return value
+
+
+def _chunked(items: Iterable, size: int) -> Iterator[list]:
+    '''split items into lists of (at most) size items'''
+    it = iter(items)
+    while chunk := list(itertools.islice(it, size)):
+        yield chunk
+
+
+def _split_chunks(
+        chunks: Iterable[list],
+        workers: Optional[int],
+) -> Iterator[tuple[list, list[list[str]]]]:
+    '''Split the descriptions in chunks of (description_id, description,
+    ...) rows into words, in a pool of worker processes.
+
+    Yield each chunk along with the words of each row, in order. Only a
+    few chunks are in flight at once, so chunks can be streamed from the
+    database.
+    '''
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        for chunk in chunks:
+            yield (chunk, _split_descriptions([row[1] for row in chunk]))
+        return
+
+    with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+        window = 2 * workers
+        pending: collections.deque = collections.deque()
+        for chunk in chunks:
+            pending.append(
+                (chunk, pool.submit(_split_descriptions, [row[1] for row in chunk])))
+            if len(pending) >= window:
+                (done, future) = pending.popleft()
+                yield (done, future.result())
+        while pending:
+            (done, future) = pending.popleft()
+            yield (done, future.result())
 
-        # SQLite has no knowledge of timezones, but we always write
-        # datetimes to the database in UTC. Make that explicit on the way
-        # back in.
-        for (attr, val) in vars(task).items():
-            if isinstance(val, datetime.datetime) and val.tzinfo is None:
-                val = val.replace(tzinfo=datetime.timezone.utc)
-                setattr(task, attr, val)
 
-        return task
+def _split_descriptions(descriptions: list[str]) -> list[list[str]]:
+    '''return the distinct words of each description (runs in a worker process)'''
+    return [list(dict.fromkeys(models.split_description(description)))
+            for description in descriptions]
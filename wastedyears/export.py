@@ -0,0 +1,260 @@
+'''export the database to columnar files, and import it back
+
+An export is a directory with one file per table: tasks, descriptions,
+words and task_words. Timestamps are int64 microseconds since the epoch
+(so that they round-trip exactly, fractions of a second included), and
+descriptions are dictionary-encoded: tasks.description_id indexes
+descriptions. Rows are streamed in chunks, so exporting takes the same
+memory however big the database is.
+
+Formats:
+
+  arrow    Arrow IPC files; pyarrow.memory_map() + pyarrow.ipc.open_file()
+           read them without copying, and columns without nulls convert
+           to NumPy arrays without copying too
+  parquet  Parquet files, one row group per chunk
+  npz      NumPy .npz archives, one array per column; strings are
+           fixed-width unicode, a missing end_ts is NaT (the minimum int64).
+           Importing reads whole columns, since .npz members cannot be
+           read a slice at a time.
+
+arrow and parquet need pyarrow, npz needs numpy (pip install
+wastedyears[arrow] or wastedyears[numpy]).
+
+Importing reads tasks and descriptions back and writes them through
+WastedYearsDB.bulk_load(), which regenerates words, task_words and
+everything derived from them. Task IDs and timestamps are kept.
+'''
+
+from __future__ import annotations
+import datetime
+import importlib
+import os
+import tempfile
+import zipfile
+from typing import Any, Iterator, Optional
+
+from . import database, models
+
+FORMATS = ('arrow', 'parquet', 'npz')
+
+# columns of each exported table: name, and 'int' or 'str'
+_tables: dict[str, list[tuple[str, str]]] = {
+    'tasks': [('task_id', 'int'), ('update_ts', 'int'), ('start_ts', 'int'),
+              ('end_ts', 'int'), ('description_id', 'int')],
+    'descriptions': [('description_id', 'int'), ('description', 'str')],
+    'words': [('word_id', 'int'), ('word', 'str'), ('total_count', 'int'),
+              ('total_elapsed', 'int')],
+    'task_words': [('task_id', 'int'), ('word_id', 'int')],
+}
+
+
+def _epoch(column: str) -> str:
+    '''SQL for a timestamp column as int64 microseconds since the epoch
+    (strftime('%f') only has milliseconds, so the microseconds come from
+    the stored text, 'YYYY-MM-DD HH:MM:SS.ffffff', padded if shorter)'''
+    return (f"(strftime('%s', {column}) * 1000000"
+            f" + cast(substr({column} || '000000', 21, 6) as integer))")
+
+
+_queries = {
+    'tasks': (
+        f"select task_id, {_epoch('update_ts')}, {_epoch('start_ts')},"
+        f" {_epoch('end_ts')}, description_id from tasks order by task_id"),
+    'descriptions': (
+        'select description_id, description from descriptions'
+        ' order by description_id'),
+    'words': (
+        'select word_id, word, total_count, total_elapsed from words'
+        ' order by word_id'),
+    'task_words': 'select task_id, word_id from task_words order by task_id, word_id',
+}
+
+_epoch_start = datetime.datetime(1970, 1, 1)
+
+# how npz stores a null timestamp (same as numpy.datetime64('NaT'))
+_npz_null = -(2 ** 63)
+
+Columns = dict[str, list]
+
+
+def export_db(
+        db: database.WastedYearsDB,
+        out_dir: str,
+        fmt: str,
+        chunk_size: int = 10000) -> dict[str, int]:
+    '''Write the database to out_dir in format fmt.
+
+    Return the number of rows written per table.
+    '''
+    os.makedirs(out_dir, exist_ok=True)
+    counts = {}
+    for (table, columns) in _tables.items():
+        path = _path(out_dir, table, fmt)
+        writer = _writer(fmt, db, table, path)
+        result = db.conn.execute(_queries[table])
+        counts[table] = 0
+        try:
+            while rows := result.fetchmany(chunk_size):
+                writer.write({
+                    name: [row[idx] for row in rows]
+                    for (idx, (name, _)) in enumerate(columns)})
+                counts[table] += len(rows)
+        finally:
+            result.close()
+        writer.close()
+    return counts
+
+
+def import_db(
+        db: database.WastedYearsDB,
+        in_dir: str,
+        fmt: str,
+        chunk_size: int = 10000) -> models.LoadStats:
+    '''Load an export from in_dir, in format fmt, into an empty database.'''
+    if db.conn.execute('select exists (select 1 from tasks)').scalar():
+        raise RuntimeError('can only import into an empty database')
+
+    # the dictionary is small (one entry per distinct description)
+    descriptions: dict[int, str] = {}
+    for chunk in _read(fmt, _path(in_dir, 'descriptions', fmt), chunk_size):
+        descriptions.update(zip(chunk['description_id'], chunk['description']))
+
+    def tasks() -> Iterator[models.Task]:
+        for chunk in _read(fmt, _path(in_dir, 'tasks', fmt), chunk_size):
+            for (task_id, update_ts, start_ts, end_ts, description_id) in zip(
+                    chunk['task_id'], chunk['update_ts'], chunk['start_ts'],
+                    chunk['end_ts'], chunk['description_id']):
+                yield models.Task(
+                    task_id=task_id,
+                    update_ts=_from_epoch(update_ts),
+                    start_ts=_from_epoch(start_ts),
+                    end_ts=_from_epoch(end_ts),
+                    description=descriptions[description_id])
+
+    return db.bulk_load(tasks(), chunk_size=chunk_size)
+
+
+def _path(directory: str, table: str, fmt: str) -> str:
+    return os.path.join(directory, f'{table}.{fmt}')
+
+
+def _from_epoch(micros: Optional[int]) -> Optional[datetime.datetime]:
+    '''epoch microseconds to naive UTC, like the database stores'''
+    if micros is None:
+        return None
+    return _epoch_start + datetime.timedelta(microseconds=micros)
+
+
+def _require(module: str, extra: str) -> Any:
+    try:
+        return importlib.import_module(module)
+    except ImportError:
+        raise RuntimeError(
+            f'{module} is not installed (pip install wastedyears[{extra}])')
+
+
+def _writer(fmt: str, db: database.WastedYearsDB, table: str, path: str):
+    if fmt == 'npz':
+        return _NpzWriter(db, table, path)
+    return _ArrowWriter(table, path, fmt)
+
+
+def _read(fmt: str, path: str, chunk_size: int) -> Iterator[Columns]:
+    if fmt == 'npz':
+        return _read_npz(path, chunk_size)
+    return _read_arrow(path, fmt, chunk_size)
+
+
+class _ArrowWriter:
+    '''write record batches to an Arrow IPC or Parquet file'''
+
+    def __init__(self, table: str, path: str, fmt: str):
+        self.pa = _require('pyarrow', 'arrow')
+        types = {'int': self.pa.int64(), 'str': self.pa.string()}
+        self.schema = self.pa.schema(
+            [(name, types[type_]) for (name, type_) in _tables[table]])
+        if fmt == 'parquet':
+            parquet = _require('pyarrow.parquet', 'arrow')
+            self.writer = parquet.ParquetWriter(path, self.schema)
+        else:
+            self.writer = self.pa.ipc.new_file(path, self.schema)
+
+    def write(self, columns: Columns):
+        self.writer.write_batch(
+            self.pa.record_batch(list(columns.values()), schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+def _read_arrow(path: str, fmt: str, chunk_size: int) -> Iterator[Columns]:
+    pa = _require('pyarrow', 'arrow')
+    if fmt == 'parquet':
+        parquet = _require('pyarrow.parquet', 'arrow')
+        batches = parquet.ParquetFile(path).iter_batches(batch_size=chunk_size)
+        for batch in batches:
+            yield batch.to_pydict()
+    else:
+        with pa.memory_map(path) as source:
+            reader = pa.ipc.open_file(source)
+            for idx in range(reader.num_record_batches):
+                yield reader.get_batch(idx).to_pydict()
+
+
+class _NpzWriter:
+    '''Write one .npy file per column, then zip them up.
+
+    Each column is a memory-mapped .npy file of the final size, filled
+    in chunk by chunk, so memory use does not depend on the number of
+    rows.
+    '''
+
+    def __init__(self, db: database.WastedYearsDB, table: str, path: str):
+        self.np = _require('numpy', 'numpy')
+        self.path = path
+        self.tmp_dir = tempfile.TemporaryDirectory(dir=os.path.dirname(path) or '.')
+        num_rows = db.conn.execute(f'select count(*) from {table}').scalar()
+        self.arrays = {}
+        for (name, type_) in _tables[table]:
+            if type_ == 'str':
+                max_len = db.conn.execute(
+                    f'select max(length({name})) from {table}').scalar()
+                dtype = f'<U{max(max_len or 0, 1)}'
+            else:
+                dtype = '<i8'
+            self.arrays[name] = self.np.lib.format.open_memmap(
+                os.path.join(self.tmp_dir.name, f'{name}.npy'),
+                mode='w+', dtype=dtype, shape=(num_rows,))
+        self.offset = 0
+
+    def write(self, columns: Columns):
+        num_rows = 0
+        for (name, values) in columns.items():
+            num_rows = len(values)
+            values = [_npz_null if value is None else value for value in values]
+            self.arrays[name][self.offset:self.offset + num_rows] = values
+        self.offset += num_rows
+
+    def close(self):
+        with zipfile.ZipFile(self.path, 'w', allowZip64=True) as archive:
+            for (name, array) in self.arrays.items():
+                array.flush()
+                archive.write(array.filename, f'{name}.npy')
+        self.arrays.clear()
+        self.tmp_dir.cleanup()
+
+
+def _read_npz(path: str, chunk_size: int) -> Iterator[Columns]:
+    np = _require('numpy', 'numpy')
+    with np.load(path) as archive:
+        arrays = {name: archive[name] for name in archive.files}
+    num_rows = min((len(array) for array in arrays.values()), default=0)
+    for start in range(0, num_rows, chunk_size):
+        chunk = {}
+        for (name, array) in arrays.items():
+            values = array[start:start + chunk_size].tolist()
+            if array.dtype.kind == 'i':
+                values = [None if value == _npz_null else value for value in values]
+            chunk[name] = values
+        yield chunk
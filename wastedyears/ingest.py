@@ -23,16 +23,18 @@ Then repeat that block for as many dates as you please.
 
 import datetime
 import re
-from typing import Optional, Iterable
+from typing import Optional, Iterable, Union
 
-from . import models, database
+from . import models, database, partitions
 
 date_re = re.compile(r'^(\d{4})-(\d{2})-(\d{2})$')
 divider_re = re.compile(r'^-+$')
 task_re = re.compile(r'^(\d{2}):(\d{2})\s*\.\.\s*(\d{2}):(\d{2})\s+(.*)')
 
 
-def ingest(db: database.WastedYearsDB, infile) -> Iterable[models.Task]:
+def ingest(
+        db: Union[database.WastedYearsDB, partitions.PartitionedDB],
+        infile) -> Iterable[models.Task]:
     current_date = None
     previous_task = None
     for (line_num, line) in enumerate(infile):
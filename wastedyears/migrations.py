@@ -0,0 +1,335 @@
+'''schema migrations for existing wastedyears databases
+
+Each migration is a function that takes a WastedYearsDB and brings its
+schema from one version to the next. MIGRATIONS[n] upgrades a database
+from version n to version n + 1, and should be idempotent, so that an
+interrupted migration can be run again. A fresh database gets the
+current schema straight from init_schema().
+'''
+
+from __future__ import annotations
+from typing import Callable, TYPE_CHECKING
+
+from . import models, wordsql
+
+if TYPE_CHECKING:
+    from .database import WastedYearsDB
+
+
+def _add_word_daily(db: WastedYearsDB):
+    '''add the word_daily rollup table and fill it'''
+    db.tbl_word_daily.create(bind=db.conn, checkfirst=True)
+    db.rebuild_rollups()
+
+
+def _add_hot_path_indexes(db: WastedYearsDB):
+    '''add indexes for date-range queries on tasks and joins on word_id'''
+    db.conn.execute(
+        'create index if not exists ix_tasks_start_ts'
+        ' on tasks (start_ts, end_ts)')
+    db.conn.execute(
+        'create index if not exists ix_task_words_word_id'
+        ' on task_words (word_id, task_id)')
+
+
+def _add_word_pairs(db: WastedYearsDB):
+    '''add the word_pairs co-occurrence table and fill it'''
+    db.tbl_word_pairs.create(bind=db.conn, checkfirst=True)
+    db.rebuild_word_pairs()
+
+
+def _add_tasks_fts(db: WastedYearsDB):
+    '''add a full-text index of task descriptions, kept in sync by triggers'''
+    if not _has_column(db, 'tasks', 'description'):
+        # already moved to descriptions by _add_descriptions()
+        return
+    statements = [
+        '''create virtual table if not exists tasks_fts using fts5(
+            description, content='tasks', content_rowid='task_id')''',
+        '''create trigger if not exists tasks_fts_insert
+            after insert on tasks begin
+                insert into tasks_fts (rowid, description)
+                values (new.task_id, new.description);
+            end''',
+        '''create trigger if not exists tasks_fts_delete
+            after delete on tasks begin
+                insert into tasks_fts (tasks_fts, rowid, description)
+                values ('delete', old.task_id, old.description);
+            end''',
+        '''create trigger if not exists tasks_fts_update
+            after update of description on tasks begin
+                insert into tasks_fts (tasks_fts, rowid, description)
+                values ('delete', old.task_id, old.description);
+                insert into tasks_fts (rowid, description)
+                values (new.task_id, new.description);
+            end''',
+        "insert into tasks_fts (tasks_fts) values ('rebuild')",
+    ]
+    for stmt in statements:
+        db.conn.execute(stmt)
+
+
+def _add_descriptions(db: WastedYearsDB):
+    '''store each distinct description once, with its word_ids'''
+    db.tbl_descriptions.create(bind=db.conn, checkfirst=True)
+    if _has_column(db, 'tasks', 'description'):
+        _move_descriptions(db)
+    create_fts(db)
+
+
+def _move_descriptions(db: WastedYearsDB):
+    '''move tasks.description to descriptions'''
+    for name in ('insert', 'update', 'delete'):
+        db.conn.execute(f'drop trigger if exists tasks_fts_{name}')
+    db.conn.execute('drop table if exists tasks_fts')
+
+    db.conn.execute(
+        'insert into descriptions (description)'
+        ' select distinct description from tasks where true'
+        ' on conflict do nothing')
+
+    # Work out word_ids for descriptions of finished tasks. If a word is
+    # missing (say, because the tokenizer changed) leave word_ids null:
+    # the next task with that description will tokenize it again.
+    word_ids = dict(db.conn.execute('select word, word_id from words').fetchall())
+    updates = []
+    for (description_id, description) in db.conn.execute(
+            'select description_id, description from descriptions'
+            ' where word_ids is null and description in ('
+            '  select description from tasks where end_ts is not null)'
+    ).fetchall():
+        words = models.split_description(description)
+        if all(word in word_ids for word in words):
+            ids = {word_ids[word] for word in words}
+            updates.append((wordsql.format_word_ids(ids), description_id))
+    if updates:
+        db.conn.execute(
+            'update descriptions set word_ids = ? where description_id = ?',
+            updates)
+
+    _rebuild_tasks(
+        db,
+        'select t.task_id, t.update_ts, t.start_ts, t.end_ts, d.description_id'
+        ' from tasks t join descriptions d on d.description = t.description')
+
+
+def _rebuild_tasks(db: WastedYearsDB, select: str):
+    '''Recreate tasks with its current columns and constraints (SQLite
+    cannot add NOT NULL to an existing column), filled from select, which
+    must return task_id, update_ts, start_ts, end_ts and description_id.
+    The indexes and triggers on tasks are kept.
+
+    task_words refers to tasks, so foreign keys are checked at commit
+    instead, by which time every task_id is back.
+    '''
+    # (imported here, so that capture can import this module without
+    # importing SQLAlchemy)
+    from sqlalchemy.schema import CreateTable
+
+    extras = [sql for (sql,) in db.conn.execute(
+        "select sql from sqlite_master where tbl_name = 'tasks'"
+        " and type in ('index', 'trigger') and sql is not null").fetchall()]
+    columns = 'task_id, update_ts, start_ts, end_ts, description_id'
+    db.conn.execute('drop table if exists temp.tasks_copy')
+    db.conn.execute(f'create temp table tasks_copy ({columns})')
+    # (the first write, so this starts the transaction)
+    db.conn.execute(f'insert into tasks_copy {select}')
+    db.conn.execute('pragma defer_foreign_keys = on')
+    db.conn.execute('drop table tasks')
+    db.conn.execute(CreateTable(db.tbl_tasks))
+    db.conn.execute(f'insert into tasks ({columns}) select {columns} from tasks_copy')
+    db.conn.execute('drop table temp.tasks_copy')
+    for sql in extras:
+        db.conn.execute(sql)
+
+
+def create_fts(db: WastedYearsDB):
+    '''create the full-text index of descriptions (which metadata cannot
+    express) and the triggers that keep it in sync'''
+    statements = [
+        '''create virtual table if not exists descriptions_fts using fts5(
+            description, content='descriptions', content_rowid='description_id')''',
+        '''create trigger if not exists descriptions_fts_insert
+            after insert on descriptions begin
+                insert into descriptions_fts (rowid, description)
+                values (new.description_id, new.description);
+            end''',
+        '''create trigger if not exists descriptions_fts_delete
+            after delete on descriptions begin
+                insert into descriptions_fts (descriptions_fts, rowid, description)
+                values ('delete', old.description_id, old.description);
+            end''',
+        '''create trigger if not exists descriptions_fts_update
+            after update of description on descriptions begin
+                insert into descriptions_fts (descriptions_fts, rowid, description)
+                values ('delete', old.description_id, old.description);
+                insert into descriptions_fts (rowid, description)
+                values (new.description_id, new.description);
+            end''',
+        "insert into descriptions_fts (descriptions_fts) values ('rebuild')",
+    ]
+    for stmt in statements:
+        db.conn.execute(stmt)
+
+
+def _add_task_natural_key(db: WastedYearsDB):
+    '''delete duplicate tasks (from ingesting a log twice) and add a unique
+    index on the natural key of finished tasks'''
+    rows = db.conn.execute(
+        'select task_id from tasks t where end_ts > start_ts and exists ('
+        ' select 1 from tasks o where o.start_ts = t.start_ts'
+        '  and o.end_ts = t.end_ts and o.description_id = t.description_id'
+        '  and o.task_id < t.task_id)').fetchall()
+    task_ids = [task_id for (task_id,) in rows]
+    for start in range(0, len(task_ids), 500):
+        db.delete_tasks(task_ids[start:start + 500])
+    db.conn.execute(
+        'create unique index if not exists ux_tasks_natural_key'
+        ' on tasks (start_ts, end_ts, description_id) where end_ts > start_ts')
+
+
+def _add_tasks_rtree(db: WastedYearsDB):
+    '''add an R*Tree index of task spans, kept in sync by triggers'''
+    create_rtree(db)
+
+
+def create_rtree(db: WastedYearsDB):
+    '''Create tasks_rtree, an R*Tree index of the span of each task in
+    seconds since the epoch (unfinished tasks run until OPEN_END), and
+    the triggers that keep it in sync.
+
+    R*Tree coordinates are 32-bit floats, rounded outwards: a match is
+    only a candidate, to be checked against tasks.
+    '''
+    start_s = epoch_seconds_sql('new.start_ts')
+    # (a task that ends before it starts, say after the clock was set
+    # back, gets an empty span: R*Tree rejects negative ones)
+    end_s = f'max({start_s}, coalesce({epoch_seconds_sql("new.end_ts")}, {OPEN_END}))'
+    statements = [
+        '''create virtual table if not exists tasks_rtree using rtree(
+            task_id, start_s, end_s)''',
+        f'''create trigger if not exists tasks_rtree_insert
+            after insert on tasks begin
+                insert into tasks_rtree (task_id, start_s, end_s)
+                values (new.task_id, {start_s}, {end_s});
+            end''',
+        '''create trigger if not exists tasks_rtree_delete
+            after delete on tasks begin
+                delete from tasks_rtree where task_id = old.task_id;
+            end''',
+        f'''create trigger if not exists tasks_rtree_update
+            after update of start_ts, end_ts on tasks begin
+                update tasks_rtree set start_s = {start_s}, end_s = {end_s}
+                where task_id = new.task_id;
+            end''',
+        'delete from tasks_rtree',
+        'insert into tasks_rtree (task_id, start_s, end_s)'
+        f' select task_id, {start_s}, {end_s} from tasks new',
+    ]
+    for stmt in statements:
+        db.conn.execute(stmt)
+
+
+def _add_report_cache(db: WastedYearsDB):
+    '''add the report cache and the per-day data versions that it is keyed
+    by, bumped by triggers on word_daily'''
+    db.tbl_data_versions.create(bind=db.conn, checkfirst=True)
+    db.tbl_report_cache.create(bind=db.conn, checkfirst=True)
+    create_version_triggers(db)
+    db.conn.execute(
+        'insert or ignore into data_versions (day, version)'
+        ' select distinct day, 1 from word_daily')
+
+
+def create_version_triggers(db: WastedYearsDB):
+    '''Create the triggers that bump the data version of a day whenever
+    word_daily changes on that day.
+
+    Every writer (including the capture fast path) goes through
+    word_daily, so this is what tells the report cache which buckets
+    are stale. (Updates never move a row to another day.)
+    '''
+    bump = '''insert into data_versions (day, version) values ({}.day, 1)
+                on conflict (day) do update set version = version + 1;'''
+    statements = [
+        f'''create trigger if not exists word_daily_version_insert
+            after insert on word_daily begin
+                {bump.format('new')}
+            end''',
+        f'''create trigger if not exists word_daily_version_update
+            after update on word_daily begin
+                {bump.format('new')}
+            end''',
+        f'''create trigger if not exists word_daily_version_delete
+            after delete on word_daily begin
+                {bump.format('old')}
+            end''',
+    ]
+    for stmt in statements:
+        db.conn.execute(stmt)
+
+
+def _recompute_elapsed(db: WastedYearsDB):
+    '''Recompute every total of elapsed time from tasks.
+
+    add_task() and friends used to take timedelta.seconds, which drops
+    whole days (and wraps negative spans around), while the rebuilds
+    subtract strftime('%s') in SQL; now both agree on
+    models.elapsed_seconds(), but totals written the old way do not.
+    '''
+    elapsed = "strftime('%s', t.end_ts) - strftime('%s', t.start_ts)"
+    db.conn.execute(
+        'update words set (total_count, total_elapsed) = ('
+        f' select count(*), coalesce(sum({elapsed}), 0)'
+        ' from task_words tw join tasks t on t.task_id = tw.task_id'
+        ' where tw.word_id = words.word_id)')
+    db.rebuild_rollups()
+    db.rebuild_word_pairs()
+
+
+def _drop_unused_words(db: WastedYearsDB):
+    '''delete the words with no tasks left that delete_tasks() used to
+    leave behind, at zero'''
+    db.drop_unused_words()
+
+
+def _description_id_not_null(db: WastedYearsDB):
+    '''make tasks.description_id NOT NULL, as _add_descriptions() now
+    creates it'''
+    rows = db.conn.execute('pragma table_info(tasks)').fetchall()
+    if any(row[1] == 'description_id' and not row[3] for row in rows):
+        _rebuild_tasks(
+            db, 'select task_id, update_ts, start_ts, end_ts, description_id from tasks')
+
+
+# end of the span of unfinished tasks in tasks_rtree (near the largest
+# 32-bit float)
+OPEN_END = 1e38
+
+
+def epoch_seconds_sql(column: str) -> str:
+    '''SQL expression for a timestamp column as seconds since the epoch,
+    with fractions (unlike strftime('%s'))'''
+    return f'(julianday({column}) - 2440587.5) * 86400.0'
+
+
+def _has_column(db: WastedYearsDB, table: str, column: str) -> bool:
+    # (not sa.inspect(), so that capture can import this module without
+    # importing SQLAlchemy)
+    rows = db.conn.execute(f'pragma table_info({table})').fetchall()
+    return any(row[1] == column for row in rows)
+
+
+MIGRATIONS: list[Callable[[WastedYearsDB], None]] = [
+    _add_word_daily,
+    _add_hot_path_indexes,
+    _add_word_pairs,
+    _add_tasks_fts,
+    _add_descriptions,
+    _add_task_natural_key,
+    _add_tasks_rtree,
+    _add_report_cache,
+    _recompute_elapsed,
+    _drop_unused_words,
+    _description_id_not_null,
+]
@@ -4,7 +4,8 @@ import re
 from typing import Optional
 
 
-@dataclasses.dataclass
+# slots: there is one of these per row, and a history has a lot of rows
+@dataclasses.dataclass(slots=True)
 class Task:
     '''a single task, i.e. a span of time with one activity'''
 
@@ -18,7 +19,7 @@ class Task:
         return f'{self.start_ts} … {self.end_ts}: {self.description}'
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class WordInfo:
     word_id: int = 0
     word: str = ''
@@ -29,6 +30,63 @@ class WordInfo:
         return f'{self.total_count:-6}{self.total_elapsed:-8}s  {self.word}'
 
 
+@dataclasses.dataclass(slots=True)
+class FocusInfo:
+    '''how often tasks switched, and the gaps between tasks, in one day,
+    week or month (times in seconds)'''
+
+    bucket: datetime.date
+    tasks: int = 0
+    # consecutive tasks on a day with different descriptions
+    switches: int = 0
+    # longest run of consecutive tasks with the same description
+    longest_streak: int = 0
+    # gaps of up to max_gap s (the overhead of recording tasks)
+    gap_count: int = 0
+    gap_total: int = 0
+    longest_gap: int = 0
+    # gaps of more than max_gap s (breaks that were not recorded)
+    untracked: int = 0
+
+
+@dataclasses.dataclass
+class LoadStats:
+    '''summary of a bulk load: how much was written, and how fast'''
+
+    tasks: int = 0
+    rows: int = 0
+    seconds: float = 0.0
+    # tasks that were already in the database
+    skipped: int = 0
+    updated: int = 0
+
+    @property
+    def rows_per_sec(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        text = (f'{self.tasks} tasks, {self.rows} rows in {self.seconds:.2f} s '
+                f'({self.rows_per_sec:.0f} rows/s)')
+        if self.skipped or self.updated:
+            text += f'; {self.skipped} skipped, {self.updated} updated'
+        return text
+
+
+@dataclasses.dataclass
+class CacheStats:
+    '''what the report cache did for one report'''
+
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    # bytes in the cache afterwards
+    size: int = 0
+
+    def __str__(self):
+        return (f'report cache: {self.hits} hits, {self.misses} misses, '
+                f'{self.evictions} evicted; {self.size} bytes cached')
+
+
 _simple_url_re = re.compile(r'[a-z0-9\+\-]+://\S+')
 _split_re = re.compile(r'\b')
 
@@ -47,3 +105,15 @@ def split_description(desc: str) -> list[str]:
             words.append(chunk)
 
     return sorted(words) + urls
+
+
+def elapsed_seconds(start_ts: datetime.datetime, end_ts: datetime.datetime) -> int:
+    '''Return the elapsed time of a task in whole seconds, the same way
+    as SQL strftime('%s', end_ts) - strftime('%s', start_ts): both times
+    truncated to the second, and negative if end_ts is before start_ts.
+
+    Every total of elapsed time must agree with this, or rebuilding the
+    derived tables changes them.
+    '''
+    delta = end_ts.replace(microsecond=0) - start_ts.replace(microsecond=0)
+    return int(delta.total_seconds())
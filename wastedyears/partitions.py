@@ -0,0 +1,453 @@
+'''year-partitioned storage: one SQLite database per year
+
+With "layout = yearly" in the [core] section of wastedyears.cfg, tasks
+are stored in data_dir/wastedyears-YYYY.sqlite by the (UTC) year in
+which they started. Each partition has the full schema, so words, word
+IDs and rollups are per partition, and reports add them up by word. A
+small catalog, data_dir/catalog.sqlite, lists the partitions and how
+many tasks each holds.
+
+Writes go to the partition of the task's year (normally the current
+one). Queries over a time range ATTACH the partitions of only the years
+it touches, read-only, to the catalog's connection and UNION ALL across
+them. Task IDs are unique across partitions: a new task gets one more
+than the largest task ID in any partition.
+
+A past year can be frozen (wy partitions --freeze YEAR): it is
+VACUUMed, taken out of WAL mode and made read-only, so it can be backed
+up once and forgotten about. Adding a task to it is an error from then
+on.
+'''
+
+from __future__ import annotations
+import contextlib
+import dataclasses
+import datetime
+import itertools
+import os
+import sqlite3
+import time
+import urllib.parse
+from typing import Iterable, Iterator, Optional
+
+from . import capture, config, database, models, profiling
+
+# SQLite's default limit on attached databases (SQLITE_MAX_ATTACHED)
+_max_attached = 10
+
+_utc = datetime.timezone.utc
+
+# later than any timestamp (and, unlike '9999', not a number: start_ts
+# has numeric affinity, and numbers sort before all text)
+_end_of_time = '9999-12-31 23:59:59.999999'
+# timestamps in JSON output (see database._iso_timestamp())
+_iso_format = '%Y-%m-%dT%H:%M:%SZ'
+
+_catalog_schema = '''
+create table if not exists partitions (
+    year integer primary key,
+    filename text not null,
+    num_tasks integer not null default 0,
+    min_start_ts datetime,
+    max_start_ts datetime,
+    max_task_id integer,
+    read_only boolean not null default 0
+)'''
+
+
+@dataclasses.dataclass
+class Partition:
+    '''a row of the catalog'''
+    year: int
+    filename: str
+    num_tasks: int
+    min_start_ts: Optional[str]
+    max_start_ts: Optional[str]
+    max_task_id: Optional[int]
+    read_only: bool
+
+
+class PartitionedDB:
+    '''The yearly layout. Supports the WastedYearsDB methods needed to
+    record, ingest and list tasks, plus get_task_dates() and
+    get_word_report() (for wy rank-words).
+
+    Like WastedYearsDB, writes are in a transaction until commit() (or
+    the end of a with block). Reads see only committed tasks.
+    '''
+
+    def __init__(self, cfg: config.Config):
+        with profiling.phase('open db'):
+            self.cfg = cfg
+            cfg.create_data_dir()
+            path = os.path.join(cfg.data_dir, 'catalog.sqlite')
+            # URI filenames, so that partitions can be attached read-only
+            self.conn = sqlite3.connect(_uri(path), uri=True)
+            for pragma in cfg.sqlite.pragmas():
+                self.conn.execute(pragma)
+            self.conn.execute(_catalog_schema)
+            self.conn.commit()
+            # partitions opened for writing, by year
+            self._writers: dict[int, database.WastedYearsDB] = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type_, value, traceback):
+        if type_ is None:
+            self.commit()
+        self.close()
+
+    def close(self):
+        for db in self._writers.values():
+            db.close()
+        self._writers.clear()
+        self.conn.close()
+
+    def commit(self):
+        for db in self._writers.values():
+            db.commit()
+            db.begin()
+        self._update_catalog()
+
+    def rollback(self):
+        for db in self._writers.values():
+            db.rollback()
+            db.begin()
+
+    def partitions(
+            self,
+            since: Optional[datetime.datetime] = None,
+            until: Optional[datetime.datetime] = None) -> list[Partition]:
+        '''return the partitions with tasks that started in [since, until)'''
+        first = -1 if since is None else _utc_date(since).year
+        last = 10000 if until is None else _utc_date(
+            until - datetime.timedelta(microseconds=1)).year
+        rows = self.conn.execute(
+            'select year, filename, num_tasks, min_start_ts, max_start_ts,'
+            '  max_task_id, read_only'
+            ' from partitions where year between ? and ? and num_tasks > 0'
+            ' order by year', (first, last))
+        return [
+            Partition(year, filename, num_tasks, min_ts, max_ts, max_id, bool(read_only))
+            for (year, filename, num_tasks, min_ts, max_ts, max_id, read_only) in rows
+        ]
+
+    def add_task(self, task: models.Task) -> int:
+        assert task.start_ts is not None
+        db = self._writer(_utc_date(task.start_ts).year)
+        if task.task_id is None:
+            task = dataclasses.replace(task, task_id=self._next_task_id())
+        return db.add_task(task)
+
+    def end_last_task(self, end_ts: datetime.datetime):
+        last = self._last_year()
+        if last is not None:
+            self._writer(last).end_last_task(end_ts)
+
+    def bulk_load(
+            self,
+            tasks: Iterable[models.Task],
+            chunk_size: int = 1000,
+            on_duplicate: str = 'insert') -> models.LoadStats:
+        '''WastedYearsDB.bulk_load(), one partition at a time (so tasks
+        should be in order). A duplicate starts when the task it
+        duplicates does, so it is in the same partition.'''
+        if on_duplicate not in database.ON_DUPLICATE:
+            raise ValueError(f'invalid on_duplicate: {on_duplicate!r}')
+        started = time.perf_counter()
+        stats = models.LoadStats()
+
+        def start_year(task: models.Task) -> int:
+            assert task.start_ts is not None
+            return _utc_date(task.start_ts).year
+
+        for (year, group) in itertools.groupby(tasks, key=start_year):
+            db = self._writer(year)
+            numbered = (
+                task if task.task_id is not None
+                else dataclasses.replace(task, task_id=task_id)
+                for (task_id, task) in zip(itertools.count(self._next_task_id()), group))
+            loaded = db.bulk_load(
+                numbered, chunk_size=chunk_size, on_duplicate=on_duplicate)
+            stats.tasks += loaded.tasks
+            stats.rows += loaded.rows
+            stats.skipped += loaded.skipped
+            stats.updated += loaded.updated
+        stats.seconds = time.perf_counter() - started
+        return stats
+
+    def iter_tasks(
+            self,
+            since: Optional[datetime.datetime] = None,
+            until: Optional[datetime.datetime] = None,
+            limit: Optional[int] = None) -> Iterator[models.Task]:
+        '''Yield tasks that started in [since, until), in start_ts order,
+        up to limit of them.'''
+        columns = 't.task_id, t.update_ts, t.start_ts, t.end_ts, d.description'
+        for (task_id, update_ts, start_ts, end_ts, description) in self._iter_rows(
+                columns, since, until, limit):
+            yield models.Task(
+                task_id, _parse_ts(update_ts), _parse_ts(start_ts),
+                _parse_ts(end_ts), description)
+
+    def iter_task_records(
+            self,
+            since: Optional[datetime.datetime] = None,
+            until: Optional[datetime.datetime] = None,
+            limit: Optional[int] = None) -> Iterator[dict]:
+        '''Like iter_tasks(), but yield dicts ready to encode as JSON, with
+        timestamps formatted as ISO 8601 UTC by SQLite.'''
+        columns = ', '.join(
+            f"strftime('{_iso_format}', t.{col})"
+            for col in ('update_ts', 'start_ts', 'end_ts'))
+        for (task_id, update_ts, start_ts, end_ts, description) in self._iter_rows(
+                f't.task_id, {columns}, d.description', since, until, limit):
+            yield {
+                'task_id': task_id,
+                'update_ts': update_ts,
+                'start_ts': start_ts,
+                'end_ts': end_ts,
+                'description': description,
+            }
+
+    def _iter_rows(
+            self,
+            columns: str,
+            since: Optional[datetime.datetime],
+            until: Optional[datetime.datetime],
+            limit: Optional[int],
+            descending: bool = False) -> Iterator[tuple]:
+        '''yield columns of tasks t joined with descriptions d, for tasks
+        that started in [since, until), in start_ts order (newest first
+        if descending, starting from the newest partition)'''
+        params = (_ts(since, ''), _ts(until, _end_of_time))
+        parts = self.partitions(since, until)
+        if descending:
+            parts.reverse()
+        order = ' desc' if descending else ''
+        for batch in _batches(parts):
+            with self._attached(batch) as schemas:
+                select = ' union all '.join(
+                    f'select {columns}, t.start_ts as sort_ts'
+                    f' from {schema}.tasks t join {schema}.descriptions d'
+                    '   using (description_id)'
+                    ' where t.start_ts >= ? and t.start_ts < ?'
+                    for schema in schemas)
+                # closing the cursor finishes the statement, which must be
+                # done before detaching (even if the caller stops early)
+                with contextlib.closing(self.conn.cursor()) as cursor:
+                    cursor.execute(
+                        select + f' order by sort_ts{order}, 1{order} limit ?',
+                        params * len(schemas) + (-1 if limit is None else limit,))
+                    for row in cursor:
+                        yield row[:-1]
+                        if limit is not None:
+                            limit -= 1
+            if limit == 0:
+                return
+
+    def list_tasks(
+            self,
+            since: Optional[datetime.datetime] = None,
+            until: Optional[datetime.datetime] = None,
+            limit: Optional[int] = None) -> list[models.Task]:
+        return list(self.iter_tasks(since, until, limit))
+
+    def get_recent_tasks(
+            self,
+            since: datetime.datetime,
+            limit: int = 500) -> list[models.Task]:
+        '''Return up to limit tasks that started at or after since, most
+        recent first.
+
+        Only the newest partitions are read, until limit tasks are found.
+        '''
+        columns = 't.task_id, t.update_ts, t.start_ts, t.end_ts, d.description'
+        return [
+            models.Task(
+                task_id, _parse_ts(update_ts), _parse_ts(start_ts),
+                _parse_ts(end_ts), description)
+            for (task_id, update_ts, start_ts, end_ts, description) in self._iter_rows(
+                columns, since, None, limit, descending=True)
+        ]
+
+    def get_task_dates(
+            self,
+            since: Optional[datetime.datetime] = None,
+            until: Optional[datetime.datetime] = None) -> list[datetime.date]:
+        '''return the distinct (UTC) dates on which tasks started in
+        [since, until)'''
+        params = (_ts(since, ''), _ts(until, _end_of_time))
+        dates: list[datetime.date] = []
+        for batch in _batches(self.partitions(since, until)):
+            with self._attached(batch) as schemas:
+                select = ' union '.join(
+                    f'select date(start_ts) from {schema}.tasks'
+                    ' where start_ts >= ? and start_ts < ?'
+                    for schema in schemas)
+                rows = self.conn.execute(select + ' order by 1', params * len(schemas))
+                dates.extend(datetime.date.fromisoformat(day) for (day,) in rows)
+        return dates
+
+    def get_word_report(
+            self,
+            start_ts: datetime.date,
+            end_ts: datetime.date) -> dict[str, models.WordInfo]:
+        '''Like WastedYearsDB.get_word_report(), summed over the partitions
+        of the years in [start_ts, end_ts). word_ids differ between
+        partitions, so they are left at 0.'''
+        (start, end) = (_utc_date(start_ts), _utc_date(end_ts))
+        params = (start.isoformat(), end.isoformat())
+        since = datetime.datetime(start.year, start.month, start.day)
+        until = datetime.datetime(end.year, end.month, end.day)
+        report: dict[str, models.WordInfo] = {}
+        for batch in _batches(self.partitions(since, until)):
+            with self._attached(batch) as schemas:
+                select = ' union all '.join(
+                    'select w.word, d.total_count, d.total_elapsed'
+                    f' from {schema}.word_daily d join {schema}.words w'
+                    '   using (word_id)'
+                    ' where d.day >= ? and d.day < ?'
+                    for schema in schemas)
+                rows = self.conn.execute(
+                    'select word, sum(total_count), sum(total_elapsed)'
+                    f' from ({select}) group by word', params * len(schemas))
+                for (word, count, elapsed) in rows:
+                    info = report.setdefault(word, models.WordInfo(word=word))
+                    info.total_count += count
+                    info.total_elapsed += elapsed
+        return report
+
+    def freeze(self, year: int) -> tuple[int, int]:
+        '''Compact the partition of year and make it read-only.
+
+        Return its size in bytes before and after.
+        '''
+        if year >= datetime.datetime.now(_utc).year:
+            raise RuntimeError(f'cannot freeze {year}: only past years')
+        row = self.conn.execute(
+            'select filename from partitions where year = ?', (year,)).fetchone()
+        if row is None:
+            raise RuntimeError(f'no partition for {year}')
+
+        self.commit()
+        if year in self._writers:
+            self._writers.pop(year).close()
+        path = os.path.join(self.cfg.data_dir, row[0])
+        before = os.path.getsize(path)
+        conn = sqlite3.connect(path)
+        try:
+            # a read-only database in WAL mode still needs its -shm file
+            conn.execute('pragma journal_mode=delete')
+            conn.execute('vacuum')
+        finally:
+            conn.close()
+        os.chmod(path, 0o444)
+        self.conn.execute('update partitions set read_only = 1 where year = ?', (year,))
+        self.conn.commit()
+        return (before, os.path.getsize(path))
+
+    def _writer(self, year: int) -> database.WastedYearsDB:
+        '''open the partition for year (creating it if need be) for writing'''
+        if year in self._writers:
+            return self._writers[year]
+        row = self.conn.execute(
+            'select read_only from partitions where year = ?', (year,)).fetchone()
+        if row is not None and row[0]:
+            raise RuntimeError(f'the partition for {year} is read-only')
+
+        filename = f'wastedyears-{year}.sqlite'
+        engine = database.create_engine(
+            'sqlite:///' + os.path.join(self.cfg.data_dir, filename), self.cfg.sqlite)
+        db = database.WastedYearsDB(engine.connect(), pair_cap=self.cfg.pair_cap)
+        db.init_schema()
+        if row is None:
+            self.conn.execute(
+                'insert into partitions (year, filename) values (?, ?)',
+                (year, filename))
+            self.conn.commit()
+        self._writers[year] = db
+        return db
+
+    def _max_task_ids(self) -> dict[int, int]:
+        '''return the largest task_id per year, including uncommitted
+        tasks'''
+        max_ids = dict(self.conn.execute(
+            'select year, max_task_id from partitions where max_task_id is not null'))
+        for (year, db) in self._writers.items():
+            max_id = db.conn.execute('select max(task_id) from tasks').scalar()
+            if max_id is not None:
+                max_ids[year] = max_id
+            else:
+                max_ids.pop(year, None)
+        return max_ids
+
+    def _next_task_id(self) -> int:
+        return max(self._max_task_ids().values(), default=0) + 1
+
+    def _last_year(self) -> Optional[int]:
+        '''return the year of the partition with the last task added'''
+        max_ids = self._max_task_ids()
+        return max(max_ids, key=lambda year: max_ids[year], default=None)
+
+    def _update_catalog(self):
+        for (year, db) in self._writers.items():
+            stats = db.conn.execute(
+                'select count(*), min(start_ts), max(start_ts), max(task_id)'
+                ' from tasks').fetchone()
+            self.conn.execute(
+                'update partitions set num_tasks = ?, min_start_ts = ?,'
+                '  max_start_ts = ?, max_task_id = ?'
+                ' where year = ?', tuple(stats) + (year,))
+        self.conn.commit()
+
+    @contextlib.contextmanager
+    def _attached(self, batch: list[Partition]) -> Iterator[list[str]]:
+        '''attach the partitions in batch read-only, as p<year>; yield their
+        schema names'''
+        schemas = []
+        try:
+            for part in batch:
+                schema = f'p{part.year}'
+                path = os.path.join(self.cfg.data_dir, part.filename)
+                self.conn.execute(
+                    f'attach database ? as {schema}', (_uri(path, mode='ro'),))
+                schemas.append(schema)
+            yield schemas
+        finally:
+            for schema in schemas:
+                self.conn.execute(f'detach database {schema}')
+
+
+def _batches(partitions: list[Partition]) -> Iterator[list[Partition]]:
+    for start in range(0, len(partitions), _max_attached):
+        yield partitions[start:start + _max_attached]
+
+
+def _uri(path: str, **params: str) -> str:
+    query = f'?{urllib.parse.urlencode(params)}' if params else ''
+    return f'file:{urllib.parse.quote(os.path.abspath(path))}{query}'
+
+
+def _utc_date(value: datetime.date) -> datetime.date:
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(_utc)
+        return value.date()
+    return value
+
+
+def _ts(value: Optional[datetime.datetime], default: str) -> str:
+    '''format value (naive means UTC) like SQLAlchemy stores datetimes'''
+    if value is None:
+        return default
+    if value.tzinfo is not None:
+        value = value.astimezone(_utc).replace(tzinfo=None)
+    return value.strftime(capture._ts_format)
+
+
+def _parse_ts(value: Optional[str]) -> Optional[datetime.datetime]:
+    if value is None:
+        return None
+    return datetime.datetime.fromisoformat(value).replace(tzinfo=_utc)
@@ -0,0 +1,221 @@
+'''time the phases and SQL statements of a wy command
+
+"wy --profile COMMAND" (or WY_TRACE=1 wy COMMAND) reports where the
+time went: importing modules, loading the config, opening the database
+(including migrations), and the command itself, split into time spent
+executing SQL and time spent in Python. Each distinct SQL statement is
+listed with its count and total time.
+
+Formats:
+
+  text    human-readable summary
+  json    the same data, for scripts
+  chrome  Chrome trace events, for chrome://tracing or Perfetto: one
+          span per phase and per statement execution
+
+Choose one with --profile-format, or by setting WY_TRACE to its name.
+The report goes to stderr, or to --profile-output (WY_TRACE_FILE).
+'''
+
+from __future__ import annotations
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+from typing import Any, Optional
+
+import wastedyears
+
+FORMATS = ('text', 'json', 'chrome')
+
+# phases that are part of the command, but reported on their own
+_sub_phases = ('config', 'open db')
+
+_profiler: Optional[Profiler] = None
+
+
+class Profiler:
+    def __init__(self):
+        self.started = wastedyears.import_started
+        # (name, start, end) of each phase
+        self.phases: list[tuple[str, float, float]] = []
+        # (statement, start, end, thread ID) of each statement execution
+        self.executions: list[tuple[str, float, float, int]] = []
+        self.command_started = time.perf_counter()
+        self.phases.append(('import', self.started, self.command_started))
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, start, time.perf_counter()))
+
+    def attach(self, engine):
+        '''time every statement executed through engine'''
+        from sqlalchemy import event
+        event.listen(engine, 'before_cursor_execute', self._before_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_execute)
+
+    def _before_execute(self, conn, cursor, statement, parameters, context,
+                        executemany):
+        conn.info.setdefault('wy_profile_started', []).append(time.perf_counter())
+
+    def _after_execute(self, conn, cursor, statement, parameters, context,
+                       executemany):
+        start = conn.info['wy_profile_started'].pop()
+        self.executions.append((
+            ' '.join(statement.split()), start, time.perf_counter(),
+            threading.get_ident()))
+
+    def finish(self) -> dict[str, Any]:
+        '''end the command phase, and return the profile as a dict'''
+        end = time.perf_counter()
+        self.phases.append(('command', self.command_started, end))
+
+        sub_phases = [(start, stop) for (name, start, stop) in self.phases
+                      if name in _sub_phases]
+        sql_seconds = sum(
+            stop - start for (_, start, stop, _) in self.executions
+            if not any(sub_start <= start < sub_stop
+                       for (sub_start, sub_stop) in sub_phases))
+        python_seconds = (
+            (end - self.command_started) - sql_seconds -
+            sum(stop - start for (start, stop) in sub_phases))
+
+        statements: dict[str, list[float]] = {}
+        for (sql, start, stop, _) in self.executions:
+            totals = statements.setdefault(sql, [0, 0.0])
+            totals[0] += 1
+            totals[1] += stop - start
+
+        return {
+            'total_ms': _ms(end - self.started),
+            'phases': [
+                {'name': name,
+                 'start_ms': _ms(start - self.started),
+                 'duration_ms': _ms(stop - start)}
+                for (name, start, stop) in sorted(self.phases, key=lambda p: p[1])
+            ],
+            'sql_ms': _ms(sql_seconds),
+            'python_ms': _ms(python_seconds),
+            'statements': [
+                {'sql': sql,
+                 'count': count,
+                 'total_ms': _ms(seconds),
+                 'mean_ms': _ms(seconds / count)}
+                for (sql, (count, seconds)) in sorted(
+                    statements.items(), key=lambda item: -item[1][1])
+            ],
+        }
+
+    def chrome_trace(self) -> dict[str, Any]:
+        '''return the phases and statements as Chrome trace events'''
+        pid = os.getpid()
+        main_tid = threading.main_thread().ident
+        events = []
+        for (name, start, stop) in self.phases:
+            events.append(self._event(name, 'phase', start, stop, pid, main_tid))
+        for (sql, start, stop, tid) in self.executions:
+            event = self._event(sql[:60], 'sql', start, stop, pid, tid)
+            event['args'] = {'sql': sql}
+            events.append(event)
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def _event(self, name, category, start, stop, pid, tid) -> dict[str, Any]:
+        # a "complete" event; times are in microseconds
+        return {
+            'name': name,
+            'cat': category,
+            'ph': 'X',
+            'ts': round((start - self.started) * 1e6),
+            'dur': round((stop - start) * 1e6),
+            'pid': pid,
+            'tid': tid,
+        }
+
+
+def start() -> Profiler:
+    '''start profiling: engines created from now on are instrumented'''
+    global _profiler
+    _profiler = Profiler()
+    return _profiler
+
+
+def stop(fmt: str, outfile=None):
+    '''stop profiling, and write the report in format fmt'''
+    global _profiler
+    profiler = _profiler
+    assert profiler is not None
+    _profiler = None
+    outfile = outfile or sys.stderr
+
+    profile = profiler.finish()
+    if fmt == 'json':
+        json.dump(profile, outfile, indent=2)
+        outfile.write('\n')
+    elif fmt == 'chrome':
+        json.dump(profiler.chrome_trace(), outfile)
+        outfile.write('\n')
+    else:
+        outfile.writelines(line + '\n' for line in _text_report(profile))
+
+
+def env_format() -> Optional[str]:
+    '''return the format requested by WY_TRACE, or None if it is unset
+    (any value other than a format name means text)'''
+    trace = os.environ.get('WY_TRACE', '').strip().lower()
+    if trace in ('', '0'):
+        return None
+    return trace if trace in FORMATS else 'text'
+
+
+def phase(name: str):
+    '''context manager: time a phase of the command, if profiling'''
+    if _profiler is None:
+        return contextlib.nullcontext()
+    return _profiler.phase(name)
+
+
+def attach(engine):
+    '''instrument engine, if profiling'''
+    if _profiler is not None:
+        _profiler.attach(engine)
+
+
+def _text_report(profile: dict[str, Any]) -> list[str]:
+    durations: dict[str, float] = {}
+    for phase_ in profile['phases']:
+        durations[phase_['name']] = (
+            durations.get(phase_['name'], 0) + phase_['duration_ms'])
+    statements = profile['statements']
+    lines = [
+        f'wy profile: {profile["total_ms"]:.1f} ms',
+        f'  import    {durations["import"]:9.1f} ms',
+        f'  command   {durations["command"]:9.1f} ms',
+    ]
+    for name in _sub_phases:
+        if name in durations:
+            lines.append(f'    {name:<8}{durations[name]:9.1f} ms')
+    lines += [
+        f'    sql     {profile["sql_ms"]:9.1f} ms'
+        f'  ({sum(stmt["count"] for stmt in statements)} statements)',
+        f'    python  {profile["python_ms"]:9.1f} ms',
+    ]
+    if statements:
+        lines += ['', '  count   total ms    mean ms  statement']
+        for stmt in statements:
+            sql = stmt['sql']
+            if len(sql) > 60:
+                sql = sql[:57] + '...'
+            lines.append(
+                f'{stmt["count"]:7}{stmt["total_ms"]:11.2f}{stmt["mean_ms"]:11.3f}'
+                f'  {sql}')
+    return lines
+
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 3)
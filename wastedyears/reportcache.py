@@ -0,0 +1,214 @@
+'''a cache of report buckets, keyed by the data version of each bucket
+
+Past weeks and months hardly ever change, but wy weekly used to add up
+every one of them on every run. ReportCache keeps the words of each
+bucket of a report in the report_cache table, along with the version of
+the data it was computed from: the sum of the per-day versions in
+data_versions, which triggers on word_daily bump whenever a task is
+added, finished, ingested or deleted on that day. A repeated report
+reads the buckets whose version is unchanged from the cache, and
+recomputes only the others (normally just the current one), with one
+grouped query per run of adjacent stale buckets.
+
+Only buckets that lie entirely within the report's time range are
+cached. Once the cache outgrows its size limit ([reports] cache_size in
+wastedyears.cfg), the least recently used buckets are evicted.
+'''
+
+from __future__ import annotations
+import datetime
+import itertools
+import json
+from typing import Iterator, Optional
+
+import sqlalchemy as sa
+
+from . import config, database, models
+
+# the report_cache.report of iter_word_report() buckets
+_word_report = 'words'
+
+
+class ReportCache:
+    '''Wraps a WastedYearsDB and caches the buckets of its
+    iter_word_report(), in the same database and transaction.
+
+    stats adds up what the cache did, over every report run through it.
+    '''
+
+    def __init__(
+            self,
+            db: database.WastedYearsDB,
+            max_size: int = config.DEFAULT_REPORT_CACHE_SIZE):
+        self.db = db
+        self.max_size = max_size
+        self.stats = models.CacheStats()
+
+    def iter_word_report(
+            self,
+            bucket: str,
+            since: Optional[datetime.datetime] = None,
+            until: Optional[datetime.datetime] = None,
+    ) -> Iterator[tuple[datetime.date, list[models.WordInfo]]]:
+        '''Same as WastedYearsDB.iter_word_report(), but read buckets that
+        have not changed since they were cached from the cache.'''
+        if self.max_size <= 0:
+            yield from self.db.iter_word_report(bucket, since, until)
+            return
+
+        versions = self.db.get_bucket_versions(bucket, since, until)
+        if not versions:
+            return
+        starts = sorted(versions)
+        since_day = _utc_day(since) if since is not None else None
+        until_day = _utc_day(until) if until is not None else None
+
+        def whole(start: datetime.date) -> bool:
+            return ((since_day is None or since_day <= start) and
+                    (until_day is None or _bucket_end(bucket, start) <= until_day))
+
+        cached = self._lookup(bucket, starts[0], starts[-1])
+        fresh = {
+            start: words for (start, (version, words)) in cached.items()
+            if versions.get(start) == version and whole(start)
+        }
+        used = self._next_used()
+
+        for (hit, group) in itertools.groupby(starts, lambda start: start in fresh):
+            run = list(group)
+            if hit:
+                self.stats.hits += len(run)
+                for start in run:
+                    if fresh[start]:
+                        yield (start, fresh[start])
+                continue
+
+            # recompute this run of stale buckets with one query
+            self.stats.misses += len(run)
+            first = max(run[0], since_day) if since_day is not None else run[0]
+            last = _bucket_end(bucket, run[-1])
+            if until_day is not None:
+                last = min(last, until_day)
+            report = dict(self.db.iter_word_report(
+                bucket, _midnight(first), _midnight(last)))
+            self._store(bucket, used, [
+                (start, versions[start], report.get(start, []))
+                for start in run if whole(start)
+            ])
+            for start in run:
+                if start in report:
+                    yield (start, report[start])
+
+        self._touch(bucket, used, list(fresh))
+        self._evict()
+
+    def _lookup(
+            self,
+            bucket: str,
+            first: datetime.date,
+            last: datetime.date,
+    ) -> dict[datetime.date, tuple[int, list[models.WordInfo]]]:
+        '''return {bucket_start: (version, words)} of the cached buckets
+        that start in [first, last]'''
+        tbl = self.db.tbl_report_cache
+        result = self.db.conn.execute(
+            sa.select([tbl.c.bucket_start, tbl.c.version, tbl.c.data])
+            .where(tbl.c.report == _word_report)
+            .where(tbl.c.bucket == bucket)
+            .where(tbl.c.bucket_start.between(first, last))
+        )
+        return {
+            row.bucket_start: (row.version, [
+                models.WordInfo(word_id, word, total_count, total_elapsed)
+                for (word_id, word, total_count, total_elapsed) in json.loads(row.data)
+            ])
+            for row in result
+        }
+
+    def _store(
+            self,
+            bucket: str,
+            used: int,
+            entries: list[tuple[datetime.date, int, list[models.WordInfo]]]):
+        '''cache entries of (bucket_start, version, words)'''
+        if not entries:
+            return
+        rows = []
+        for (start, version, words) in entries:
+            data = json.dumps([
+                [info.word_id, info.word, info.total_count, info.total_elapsed]
+                for info in words
+            ], separators=(',', ':'))
+            rows.append({
+                'report': _word_report,
+                'bucket': bucket,
+                'bucket_start': start,
+                'version': version,
+                'data': data,
+                'size': len(data),
+                'used': used,
+            })
+        self.db.conn.execute(
+            self.db.tbl_report_cache.insert().prefix_with('OR REPLACE'), rows)
+
+    def _touch(self, bucket: str, used: int, starts: list[datetime.date]):
+        '''mark the cached buckets that start on starts as used'''
+        if not starts:
+            return
+        tbl = self.db.tbl_report_cache
+        self.db.conn.execute(
+            tbl.update()
+            .where(tbl.c.report == _word_report)
+            .where(tbl.c.bucket == bucket)
+            .where(tbl.c.bucket_start == sa.bindparam('start'))
+            .values(used=used),
+            [{'start': start} for start in starts])
+
+    def _next_used(self) -> int:
+        tbl = self.db.tbl_report_cache
+        return self.db.conn.execute(
+            sa.select([sa.func.coalesce(sa.func.max(tbl.c.used), 0) + 1])).scalar()
+
+    def _evict(self):
+        '''delete the least recently used buckets until the cache fits in
+        max_size'''
+        tbl = self.db.tbl_report_cache
+        conn = self.db.conn
+        size = conn.execute(
+            sa.select([sa.func.coalesce(sa.func.sum(tbl.c.size), 0)])).scalar()
+        victims = []
+        if size > self.max_size:
+            rowid: sa.sql.ColumnElement = sa.literal_column('rowid')
+            result = conn.execute(
+                sa.select([rowid, tbl.c.size]).order_by(tbl.c.used, rowid))
+            for (victim, victim_size) in result:
+                if size <= self.max_size:
+                    break
+                victims.append({'victim': victim})
+                size -= victim_size
+            result.close()
+            conn.execute(tbl.delete().where(rowid == sa.bindparam('victim')), victims)
+
+        self.stats.evictions += len(victims)
+        self.stats.size = size
+
+
+def _bucket_end(bucket: str, start: datetime.date) -> datetime.date:
+    '''return the start of the bucket after the one that starts on start'''
+    if bucket == 'day':
+        return start + datetime.timedelta(days=1)
+    if bucket == 'week':
+        return start + datetime.timedelta(days=7)
+    return (start.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+
+
+def _utc_day(value: datetime.datetime) -> datetime.date:
+    '''the UTC date of value (naive datetimes are already UTC)'''
+    if value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc)
+    return value.date()
+
+
+def _midnight(day: datetime.date) -> datetime.datetime:
+    '''day as a naive UTC datetime'''
+    return datetime.datetime.combine(day, datetime.time())
@@ -0,0 +1,121 @@
+'''the "wy serve" daemon: one warm database connection, shared by every
+wy command that client.forward() sends its way'''
+
+import io
+import os
+import signal
+import socket
+import socketserver
+import sys
+from typing import Iterator
+
+from . import cli, client, config, database, models, reportcache
+
+
+class Server(socketserver.UnixStreamServer):
+    '''Handle one request at a time, so that there is no need to share
+    the connection between threads.'''
+
+    def __init__(self, cfg: config.Config, db: database.WastedYearsDB):
+        self.db = db
+        self.cache_size = cfg.report_cache_size
+        _remove_stale_socket(cfg.socket_path)
+        # only the owner may connect
+        old_umask = os.umask(0o077)
+        try:
+            super().__init__(cfg.socket_path, _Handler)
+        finally:
+            os.umask(old_umask)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    server: Server
+    # write output in blocks, not one system call per line
+    wbufsize = io.DEFAULT_BUFFER_SIZE
+
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            # just checking that we are alive
+            return
+        request = client.decode_request(line)
+        db = self.server.db
+        try:
+            if request is None:
+                raise ValueError(
+                    f'invalid request: {line.decode("utf-8", "replace").strip()}')
+            for output in run(db, request, self.server.cache_size):
+                self._write(output)
+        except ConnectionError:
+            # the client hung up; nobody to tell
+            db.rollback()
+            db.begin()
+            return
+        except Exception as err:
+            db.rollback()
+            db.begin()
+            self._write(f'error {err}')
+            return
+
+        db.commit()
+        db.begin()
+        self._write('ok')
+
+    def _write(self, line: str):
+        self.wfile.write((line + '\n').encode('utf-8'))
+
+
+def serve(cfg: config.Config):
+    '''run the daemon until interrupted'''
+    # exit cleanly (removing the socket) on kill as well as ^C
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    with database.open_db(cfg) as db:
+        db.commit()                 # in case open_db() migrated the schema
+        db.begin()
+        with Server(cfg, db) as server:
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                os.remove(cfg.socket_path)
+
+
+def run(
+        db: database.WastedYearsDB,
+        request: list[str],
+        cache_size: int = config.DEFAULT_REPORT_CACHE_SIZE) -> Iterator[str]:
+    '''run the command in request (from client.parse_request()); yield
+    lines of output (reports go through a report cache of cache_size
+    bytes)'''
+    (cmd, words) = (request[0], request[1:])
+    now = cli._now()
+    if cmd == 'task':
+        db.end_last_task(now)
+        db.add_task(models.Task(start_ts=now, description=' '.join(words)))
+    elif cmd == 'done':
+        db.end_last_task(now)
+    elif cmd == 'ls-tasks':
+        for task in db.iter_tasks():
+            yield cli._format_task(task)
+    else:
+        bucket = {'daily': 'day', 'weekly': 'week', 'monthly': 'month'}[cmd]
+        reports = reportcache.ReportCache(db, cache_size)
+        yield from cli._report_lines(reports, bucket, None, None)
+
+
+def _remove_stale_socket(path: str):
+    '''remove the socket left behind by a daemon that died, but refuse
+    to start a second daemon'''
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except FileNotFoundError:
+        return
+    except ConnectionRefusedError:
+        os.remove(path)
+        return
+    finally:
+        sock.close()
+    raise RuntimeError(f'wy serve is already running on {path}')
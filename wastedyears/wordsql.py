@@ -0,0 +1,202 @@
+'''the SQL that maintains words and the tables derived from them
+
+Both the capture fast path (through the standard library sqlite3 module)
+and WastedYearsDB (through SQLAlchemy) record words with these functions,
+so that they write exactly the same rows. Like capture, this module only
+uses the standard library.
+'''
+
+import datetime
+import itertools
+from typing import Any, Callable, Iterable, Optional, Sequence
+
+from . import models
+
+# conn.execute() of either sqlite3 or SQLAlchemy: run one statement with
+# positional parameters, return an iterable of rows
+Execute = Callable[[str, tuple], Iterable[Sequence[Any]]]
+
+
+def intern_description(
+        execute: Execute,
+        description: str) -> tuple[int, str, Optional[str]]:
+    '''Return (description_id, description, word_ids) for description,
+    adding it to descriptions if it is not there yet.
+
+    word_ids is None until the words of description have been recorded.
+    '''
+    params = (description,)
+    for row in list(execute(
+            'select description_id, description, word_ids from descriptions'
+            ' where description = ?', params)):
+        return (row[0], row[1], row[2])
+
+    (row,) = execute(
+        'insert into descriptions (description) values (?)'
+        ' returning description_id, description, word_ids', params)
+    return (row[0], row[1], row[2])
+
+
+def record_words(
+        execute: Execute,
+        task_id: int,
+        desc: tuple[int, str, Optional[str]],
+        elapsed: int,
+        day: datetime.date,
+        pair_cap: int):
+    '''Record the words of a finished task: add to the totals of its words
+    and the tables derived from them.
+
+    desc is (description_id, description, word_ids) as returned by
+    intern_description(). If the description was seen before, its
+    word_ids are already known, so there is no need to tokenize it or
+    look up its words.
+    '''
+    (description_id, description, word_ids) = desc
+    if word_ids is None:
+        words = models.split_description(description)
+        (ids, _) = _upsert_words(execute, words, elapsed)
+        execute(
+            'update descriptions set word_ids = ? where description_id = ?',
+            (format_word_ids(ids), description_id))
+    else:
+        ids = parse_word_ids(word_ids)
+        if ids:
+            execute(
+                'update words set total_count = total_count + 1,'
+                ' total_elapsed = total_elapsed + ?'
+                ' where word_id in (' + ', '.join(['?'] * len(ids)) + ')',
+                (elapsed, *ids))
+    _add_task_words(execute, task_id, ids, elapsed, day, pair_cap)
+
+
+def format_word_ids(word_ids: Iterable[int]) -> str:
+    '''encode word_ids for descriptions.word_ids'''
+    return ' '.join(str(word_id) for word_id in sorted(word_ids))
+
+
+def parse_word_ids(word_ids: str) -> list[int]:
+    '''decode descriptions.word_ids'''
+    return [int(word_id) for word_id in word_ids.split()]
+
+
+def upsert_words(
+        execute: Execute,
+        task_id: int,
+        words: list[str],
+        elapsed: int,
+        day: datetime.date,
+        pair_cap: int,
+) -> dict[str, int]:
+    '''Insert words that are not already in the database, and add
+    1 and elapsed to the totals of words that are there (overall, for
+    day, and for each pair among the pair_cap lowest word_ids).
+
+    This takes four statements no matter how many words there are:
+    one multi-row upsert into words, one insert into task_words, and
+    one multi-row upsert each into word_daily and word_pairs.
+
+    Return a map of word to word_id for newly inserted words.
+    '''
+    (word_ids, new_words) = _upsert_words(execute, words, elapsed)
+    _add_task_words(execute, task_id, word_ids, elapsed, day, pair_cap)
+    return new_words
+
+
+def _upsert_words(
+        execute: Execute,
+        words: list[str],
+        elapsed: int,
+) -> tuple[list[int], dict[str, int]]:
+    '''Add 1 and elapsed to the totals of words, inserting the ones that
+    are not there yet.
+
+    Return the word_ids of all words, and a map of word to word_id for
+    newly inserted words.
+    '''
+    # A word that appears twice in one description only counts once.
+    words = list(dict.fromkeys(words))
+    if not words:
+        return ([], {})
+
+    # A new word gets a word_id above any there was before (SQLite picks
+    # max(word_id) + 1). Its total_count says nothing: an existing word
+    # may have had a total_count of 0.
+    ((max_id,),) = list(execute('select coalesce(max(word_id), 0) from words', ()))
+
+    upsert = (
+        'insert into words (word, total_count, total_elapsed) values ' +
+        ', '.join(['(?, 1, ?)'] * len(words)) +
+        ' on conflict (word) do update set' +
+        ' total_count = total_count + 1,' +
+        ' total_elapsed = total_elapsed + excluded.total_elapsed' +
+        ' returning word, word_id')
+    params = tuple(val for word in words for val in (word, elapsed))
+
+    new_words: dict[str, int] = {}
+    word_ids: list[int] = []
+    for (word, word_id) in list(execute(upsert, params)):
+        word_ids.append(word_id)
+        if word_id > max_id:
+            new_words[word] = word_id
+
+    return (word_ids, new_words)
+
+
+def _add_task_words(
+        execute: Execute,
+        task_id: int,
+        word_ids: list[int],
+        elapsed: int,
+        day: datetime.date,
+        pair_cap: int):
+    '''associate word_ids with task_id, and update word_daily and
+    word_pairs to match'''
+    if not word_ids:
+        return
+
+    execute(
+        'insert into task_words (task_id, word_id) values ' +
+        ', '.join(['(?, ?)'] * len(word_ids)),
+        tuple(val for word_id in word_ids for val in (task_id, word_id)))
+
+    execute(
+        upsert_word_daily_sql(len(word_ids)),
+        tuple(val
+              for word_id in word_ids
+              for val in (day.isoformat(), word_id, 1, elapsed)))
+
+    pairs = word_pairs(word_ids, pair_cap)
+    if pairs:
+        execute(
+            upsert_word_pairs_sql(len(pairs)),
+            tuple(val for (id_a, id_b) in pairs for val in (id_a, id_b, 1, elapsed)))
+
+
+def word_pairs(word_ids: Iterable[int], pair_cap: int) -> list[tuple[int, int]]:
+    '''Return the (word_id_a, word_id_b) pairs of a task, with a < b.
+
+    Pairs grow quadratically with the number of words, so only the
+    pair_cap lowest word_ids take part.
+    '''
+    return list(itertools.combinations(sorted(set(word_ids))[:pair_cap], 2))
+
+
+def upsert_word_daily_sql(num_rows: int) -> str:
+    '''SQL to add (day, word_id, count, elapsed) rows to word_daily'''
+    return (
+        'insert into word_daily (day, word_id, total_count, total_elapsed)'
+        ' values ' + ', '.join(['(?, ?, ?, ?)'] * num_rows) +
+        ' on conflict (day, word_id) do update set' +
+        ' total_count = total_count + excluded.total_count,' +
+        ' total_elapsed = total_elapsed + excluded.total_elapsed')
+
+
+def upsert_word_pairs_sql(num_rows: int) -> str:
+    '''SQL to add (word_id_a, word_id_b, count, elapsed) rows to word_pairs'''
+    return (
+        'insert into word_pairs (word_id_a, word_id_b, total_count, total_elapsed)'
+        ' values ' + ', '.join(['(?, ?, ?, ?)'] * num_rows) +
+        ' on conflict (word_id_a, word_id_b) do update set' +
+        ' total_count = total_count + excluded.total_count,' +
+        ' total_elapsed = total_elapsed + excluded.total_elapsed')